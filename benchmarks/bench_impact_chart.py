@@ -0,0 +1,99 @@
+import argparse
+import logging
+import random
+import timeit
+import pandas as pd
+from scholar_map.get_impact_chart import get_citing_authors_table, get_impact_table, INSTITUTE_COL_NAME, \
+    LOCATION_COL_NAME, DOMAIN_COL_NAME, PUB_POS_COL
+from scholar_map.institutions import AuthorInstitutions
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+SCHOLAR_ID = 'SCHOLAR'
+
+
+def _generate_data(num_citations, num_pubs, num_authors, num_domains, seed):
+    rng = random.Random(seed)
+    domains = [f'uni{i}.edu' for i in range(num_domains)]
+    domains_df = pd.DataFrame({'country': [f'Country {i % 50}' for i in range(num_domains)],
+                               'name': [f'University {i % (num_domains // 2)}' for i in range(num_domains)],
+                               'domain': domains})
+    authors = {}
+    for i in range(num_authors):
+        domain = rng.choice(domains)
+        email_domain = rng.choice([domain, f'cs.{domain}', f'lab{i}.org'])  # exact, sub-domain or unknown
+        authors[f'AUTH{i}'] = dict(name=f'Author {i}', email_domain=f'@{email_domain}')
+    author_ids = list(authors.keys()) + ['']
+    pubs_citations = [[] for _ in range(num_pubs)]
+    for _ in range(num_citations):
+        ids = rng.sample(author_ids, 3)
+        if rng.random() < .01:
+            ids[0] = SCHOLAR_ID
+        pubs_citations[rng.randrange(num_pubs)].append(dict(author_id=ids, bib=dict(author=['name'] * len(ids))))
+    return pubs_citations, authors, domains_df
+
+
+def _reference_impact_table(pubs_citations, authors, domains_df):
+    # the original per-author boolean mask filtering
+    rows = []
+    for pub, citations in enumerate(pubs_citations):
+        institutes = set()
+        for citation in citations:
+            if SCHOLAR_ID in citation['author_id']:
+                continue
+            for author_id in citation['author_id']:
+                if author_id == '' or author_id not in authors:
+                    continue
+                sub_domain = authors[author_id]['email_domain'].lower().replace('@', '')
+                info = domains_df[domains_df['domain'] == sub_domain]
+                if len(info) == 0:
+                    info = domains_df[domains_df['domain'] == '.'.join(sub_domain.split('.')[-2:])]
+                if len(info) == 0:
+                    continue
+                info = info.iloc[0]
+                if info['name'] not in institutes:
+                    institutes.add(info['name'])
+                    rows.append((pub, info['name'], info['country'], info['domain']))
+    return pd.DataFrame(rows, columns=[PUB_POS_COL, INSTITUTE_COL_NAME, LOCATION_COL_NAME, DOMAIN_COL_NAME])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--citations', type=int, default=100000, help='The number of citations.')
+    parser.add_argument('-p', '--pubs', type=int, default=100, help='The number of publications.')
+    parser.add_argument('-a', '--authors', type=int, default=50000, help='The number of citing authors.')
+    parser.add_argument('-d', '--domains', type=int, default=5000, help='The number of domains in the locations table.')
+    parser.add_argument('-r', '--reference', type=int, default=1000,
+                        help='The number of citations on which to time (and check) the original implementation.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random data generation.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    pubs_citations, authors, domains_df = _generate_data(
+        args.citations, args.pubs, args.authors, args.domains, args.seed)
+    logging.info(f'Generated {args.citations} citations of {args.pubs} publications by {args.authors} authors')
+
+    start = timeit.default_timer()
+    institutions = AuthorInstitutions.from_locations(authors, domains_df)
+    elapsed = timeit.default_timer() - start
+    logging.info(f'institutions: {len(institutions)} authors mapped in {elapsed:.3f}s (once, by get_locations)')
+
+    start = timeit.default_timer()
+    citing_df = get_citing_authors_table(pubs_citations, SCHOLAR_ID)
+    impact_df = get_impact_table(citing_df, institutions)
+    elapsed = timeit.default_timer() - start
+    logging.info(f'join: {len(citing_df)} citing authors in {elapsed:.3f}s, {len(impact_df)} unique institutes')
+
+    # time original implementation on a subset of the citations and check results match
+    ref_citations = [citations[:max(1, args.reference // args.pubs)] for citations in pubs_citations]
+    num_ref = sum(len(citations) for citations in ref_citations)
+    start = timeit.default_timer()
+    ref_df = _reference_impact_table(ref_citations, authors, domains_df)
+    elapsed = timeit.default_timer() - start
+    logging.info(f'scan: {num_ref} citations in {elapsed:.3f}s '
+                 f'(~{elapsed * args.citations / num_ref:.1f}s extrapolated to {args.citations} citations)')
+    new_df = get_impact_table(get_citing_authors_table(ref_citations, SCHOLAR_ID), institutions)
+    new_df = new_df[ref_df.columns]  # original implementation does not count citations
+    assert ref_df.equals(new_df), 'Results differ from the original implementation'
+    logging.info('Results match the original implementation')
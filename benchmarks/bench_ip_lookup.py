@@ -0,0 +1,53 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import timeit
+import IP2Location
+from scholar_map.indexes import IPLocationIndex
+from benchmarks.fakes import write_ip_database
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+def _generate_ips(num_ips, num_unique, seed):
+    rng = random.Random(seed)
+    unique = [f'{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}'
+              for _ in range(num_unique)]
+    return [rng.choice(unique) for _ in range(num_ips)]
+
+
+def _time(name, func, num_ips):
+    start = timeit.default_timer()
+    result = func()
+    elapsed = timeit.default_timer() - start
+    logging.info(f'{name}: {elapsed:.3f}s, {num_ips / elapsed / 1e3:.1f}k IPs/s')
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num-ips', type=int, default=200000, help='The number of IP addresses to look up.')
+    parser.add_argument('-u', '--unique', type=int, default=50000, help='The number of unique IP addresses.')
+    parser.add_argument('-r', '--ranges', type=int, default=1000000, help='The number of ranges in the database.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random data generation.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'IP2LOCATION-DB9.BIN')
+        write_ip_database(db_file, args.ranges, args.seed)
+        database = IP2Location.IP2Location(db_file, 'SHARED_MEMORY')
+        ips = _generate_ips(args.num_ips, args.unique, args.seed)
+        n = len(ips)
+        logging.info(f'Generated database with {args.ranges} ranges and {n} IP addresses ({len(set(ips))} unique)')
+
+        reference = _time('get_all (per address)', lambda: [database.get_all(ip) for ip in ips], n)
+        index = _time('index creation', lambda: IPLocationIndex(database), n)
+        records = _time('lookup_all (batch)', lambda: index.lookup_all(ips), n)
+        assert all(vars(records[ip]) == vars(record) for ip, record in zip(ips, reference)), \
+            'lookup_all differs from get_all'
+        logging.info('Records match the database\'s get_all')
+        database.close()
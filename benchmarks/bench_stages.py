@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from benchmarks.fakes import FakeDNS, FakeEmail2Country, FakeGeocoder, FakeReference, fake_network
+from benchmarks.synthetic import get_fake_scholar, write_dataset, SCHOLAR_ID
+from scholar_map.geocoding import CachedGeocoder
+from scholar_map.get_impact_chart import get_impact_chart
+from scholar_map.get_locations import Resolver, load_authors
+from scholar_map.get_map_tiles import get_map_tiles
+from scholar_map.get_scholar import get_scholar
+from scholar_map.metrics import metrics, stage
+from scholar_map.pipeline import STAGES
+from scholar_map.throttling import MAX_WORKERS
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+logger = logging.getLogger('bench_stages')  # the stages' own messages are only logged with "--verbose"
+
+
+def _run_stage(name, results, func, *args, **kwargs):
+    # times the stage and records its (Python) memory allocation peak, if tracing
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with stage(name):
+        result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else float('nan')
+    results[name] = dict(seconds=elapsed, peak_mb=peak)
+    logger.info(f'{name}: {elapsed:.3f}s, peak {peak:.1f}MB')
+    return result
+
+
+def _get_locations(resolver, output_dir):
+    authors = load_authors(output_dir)
+    return resolver.get_locations(authors, output_dir, reset=True)
+
+
+def _compare(results, baseline_file):
+    with open(baseline_file, 'r') as fp:
+        baseline = json.load(fp)['stages']
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        logger.info(f'{name}: {result["seconds"] / baseline[name]["seconds"] - 1:+.1%} time, '
+                    f'{result["peak_mb"] / baseline[name]["peak_mb"] - 1:+.1%} peak memory vs. baseline')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--authors', type=int, default=10000, help='The number of citing authors.')
+    parser.add_argument('-p', '--pubs', type=int, default=50, help='The number of publications.')
+    parser.add_argument('-c', '--citations', type=int, default=200, help='The number of citations per publication.')
+    parser.add_argument('-d', '--domains', type=int, default=2000, help='The number of university domains.')
+    parser.add_argument('--skew', type=float, default=1., help='The exponent of the Zipf law of the domains.')
+    parser.add_argument('--stages', type=str, nargs='+', choices=STAGES, default=STAGES,
+                        help='The stages to run. If the scholar stage is not run, its data is written directly.')
+    parser.add_argument('--scholar-latency', type=float, default=0., help='The latency of Google Scholar requests.')
+    parser.add_argument('--geo-latency', type=float, default=0., help='The latency of geocoder requests.')
+    parser.add_argument('--dns-latency', type=float, default=0., help='The latency of DNS requests.')
+    parser.add_argument('--country-latency', type=float, default=0., help='The latency of email2country requests.')
+    parser.add_argument('-t', '--threads', type=int, default=MAX_WORKERS,
+                        help='The maximum number of concurrent requests to each service.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The number of worker processes parsing and voting affiliations.')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='The path to the directory in which to save the stages\' data. Defaults to a temporary '
+                             'directory, removed at the end.')
+    parser.add_argument('--results', type=str, default=None,
+                        help='The path to the JSON file in which to save the stages\' times, memory peaks and metrics.')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='The path to a results file of a previous run, against which to compare the results.')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Whether to not trace memory allocations, which slows down the stages.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Whether to log the stages\' messages.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random data generation.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+    logger.setLevel(logging.INFO)
+
+    output_dir = args.output if args.output is not None else tempfile.mkdtemp()
+    os.makedirs(output_dir, exist_ok=True)
+    reference = FakeReference()
+    start = time.perf_counter()
+    fake = get_fake_scholar(reference, args.authors, args.pubs, args.citations, num_domains=args.domains,
+                            skew=args.skew, latency=args.scholar_latency, seed=args.seed)
+    logger.info(f'Generated {args.pubs * args.citations} citations by {args.authors} authors of '
+                f'{len(set(a["email_domain"] for a in fake.authors.values()))} domains '
+                f'in {time.perf_counter() - start:.3f}s')
+    if 'scholar' not in args.stages:
+        write_dataset(fake, output_dir)
+    _ = reference.us_unis_df, reference.world_unis, reference.all_unis_matcher  # not part of the stages
+
+    if not args.no_memory:
+        tracemalloc.start()
+    metrics.clear()
+    results = {}
+    if 'scholar' in args.stages:
+        _run_stage('scholar', results, get_scholar, SCHOLAR_ID, output_dir, fake, args.threads, 0., 0.)
+    if 'locations' in args.stages:
+        geo_locator = CachedGeocoder(FakeGeocoder(args.geo_latency), os.path.join(output_dir, 'geocode_cache.db'))
+        resolver = Resolver(geo_locator, reference, args.threads, args.workers, country_rate=None)
+        with fake_network(FakeDNS(args.dns_latency), FakeEmail2Country(args.country_latency)):
+            _run_stage('locations', results, _get_locations, resolver, output_dir)
+        geo_locator.close()
+    if 'impact' in args.stages:
+        _run_stage('impact', results, get_impact_chart, SCHOLAR_ID, output_dir)
+    if 'tiles' in args.stages:
+        _run_stage('tiles', results, get_map_tiles, output_dir)
+    tracemalloc.stop()
+
+    if args.results is not None:
+        with open(args.results, 'w') as fp:
+            json.dump(dict(params=vars(args), stages=results, metrics=metrics.to_dict()), fp, indent=4)
+        logger.info(f'Saved results in "{args.results}"')
+    if args.baseline is not None:
+        _compare(results, args.baseline)
+    if args.output is None:
+        shutil.rmtree(output_dir)
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import random
+import re
+import timeit
+import pandas as pd
+from scholar_map.indexes import DomainSuffixIndex
+from scholar_map.reference import US_UNI_DATA
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+def _scan_search(us_unis_df, domain):
+    # the original per-domain full-column scan
+    unis = us_unis_df[us_unis_df['website'].str.endswith(domain)]
+    if len(unis) == 0:
+        return None
+    return unis.loc[unis['website'].map(lambda x: len(x.replace(domain, ''))).sort_values().index].index[0]
+
+
+def _index_search(us_unis_index, domain):
+    return us_unis_index.lookup(domain)[0]
+
+
+def _is_label_match(website, domain):
+    return website == domain or website.endswith('.' + domain)
+
+
+def _label_scan_search(us_unis_df, domain):
+    # the scan restricted to label boundaries, where ties keep the first row, i.e., the index's documented behavior
+    websites = us_unis_df['website']
+    unis = websites[websites.map(lambda x: _is_label_match(x, domain))]
+    if len(unis) == 0:
+        return None
+    return unis.str.len().sort_values(kind='stable').index[0]
+
+
+def _check(us_unis_df, us_unis_index, domains):
+    # checks the index against the scan, allowing only for the documented differences
+    websites = us_unis_df['website']
+    boundary, ties = [], []
+    for domain in sorted(set(domains)):
+        scan_pos, index_pos = _scan_search(us_unis_df, domain), _index_search(us_unis_index, domain)
+        assert index_pos == _label_scan_search(us_unis_df, domain), f'Index differs from scan for "{domain}"'
+        if scan_pos == index_pos:
+            continue
+        if not _is_label_match(websites.iat[scan_pos], domain):
+            boundary.append(f'{domain}: "{websites.iat[scan_pos]}" (scan) vs "{websites.iat[index_pos]}" (index)'
+                            if index_pos is not None else f'{domain}: "{websites.iat[scan_pos]}" (scan only)')
+        else:
+            # the scan's (unstable) sort picks any of the shortest websites, the index the first
+            assert len(websites.iat[scan_pos]) == len(websites.iat[index_pos]), f'Index differs for "{domain}"'
+            ties.append(f'{domain}: rows {scan_pos} (scan) vs {index_pos} (index)')
+    logging.info(f'Results match the scan for {len(set(domains)) - len(boundary) - len(ties)} domains, '
+                 f'{len(boundary)} differ due to label boundaries, e.g., {boundary[:3]}, and {len(ties)} due to '
+                 f'ties between equally short websites, e.g., {ties[:3]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num-domains', type=int, default=2000, help='The number of domains to search for.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random domain sampling.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    us_unis_df = pd.read_csv(US_UNI_DATA)
+    us_unis_df.columns = us_unis_df.columns.str.lower()
+    us_unis_df['website'] = us_unis_df['website'].map(lambda x: re.sub('https?://|www.|/', '', x)).str.lower()
+
+    start = timeit.default_timer()
+    us_unis_index = DomainSuffixIndex(us_unis_df['website'])
+    logging.info(f'Built index over {len(us_unis_index)} websites in {timeit.default_timer() - start:.3f}s')
+
+    # mix of exact websites, sub-domains of websites and unknown domains
+    rng = random.Random(args.seed)
+    websites = us_unis_df['website'].tolist()
+    domains = []
+    for _ in range(args.num_domains):
+        website = rng.choice(websites)
+        domains.append(rng.choice([website, f'cs.{website}', f'{website.split(".")[0]}.example.org',
+                                   website[1:]]))  # e.g., "it.edu" from "mit.edu", not a label boundary
+
+    for name, search, data in [('scan', _scan_search, us_unis_df), ('index', _index_search, us_unis_index)]:
+        start = timeit.default_timer()
+        for domain in domains:
+            search(data, domain)
+        elapsed = timeit.default_timer() - start
+        logging.info(f'{name}: {len(domains)} lookups in {elapsed:.3f}s ({1e6 * elapsed / len(domains):.1f}us/lookup)')
+
+    _check(us_unis_df, us_unis_index, domains)
@@ -0,0 +1,76 @@
+import argparse
+import logging
+import random
+import timeit
+import unicodedata
+import pandas as pd
+from scholar_map.util import clean_filename, clean_filenames, get_title, get_titles, valid_filename_chars, char_limit
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+WORDS = ['university', 'of', 'lisbon', 'MIT', 'école', 'polytechnique', 'fédérale', 'münchen', 'são', 'paulo',
+         'IBM', 'research', 'deep', 'learning', 'for', 'the', 'Internet', 'of', 'Things', '東京大学', 'señales',
+         'AI-based', 'multi-agent', '(extended)', 'systems:', 'a', 'survey', 'Zürich', 'N.Y.']
+
+
+def _generate_data(num_strings, num_unique, seed):
+    rng = random.Random(seed)
+    unique = []
+    for i in range(num_unique):
+        if i % 3 == 0:  # publication ids
+            unique.append(f'{rng.choice(["SCHOLAR", "aBcD-123_x"])}:{rng.getrandbits(40):x}')
+        else:  # titles and institution names
+            unique.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))))
+    return [rng.choice(unique) for _ in range(num_strings)]
+
+
+def _reference_clean_filename(filename, whitelist=valid_filename_chars, replace=' '):
+    # the original per-character whitelist filtering
+    for r in replace:
+        filename = filename.replace(r, '_')
+    cleaned_filename = unicodedata.normalize('NFKD', filename).encode('ASCII', 'ignore').decode()
+    cleaned_filename = ''.join(c for c in cleaned_filename if c in whitelist)
+    return cleaned_filename[:char_limit]
+
+
+def _reference_get_title(title):
+    # the original (non-memoized) title-caser
+    return None if title is None else ' '.join([w.title() if w.islower() else w for w in title.split()])
+
+
+def _time(name, func, num_strings):
+    start = timeit.default_timer()
+    result = func()
+    elapsed = timeit.default_timer() - start
+    logging.info(f'{name}: {elapsed:.3f}s, {num_strings / elapsed / 1e6:.2f}M strings/s')
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num-strings', type=int, default=1000000, help='The number of strings.')
+    parser.add_argument('-u', '--unique', type=int, default=50000, help='The number of unique strings.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random data generation.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    strings = _generate_data(args.num_strings, args.unique, args.seed)
+    series = pd.Series(strings, dtype=object)
+    n = len(strings)
+    logging.info(f'Generated {n} strings ({len(set(strings))} unique)')
+
+    reference = _time('clean_filename (original)', lambda: [_reference_clean_filename(s) for s in strings], n)
+    result = _time('clean_filename', lambda: [clean_filename(s) for s in strings], n)
+    assert result == reference, 'clean_filename differs from the original implementation'
+    result = _time('clean_filenames (Series)', lambda: clean_filenames(series), n)
+    assert result.tolist() == reference, 'clean_filenames differs from the original implementation'
+
+    reference = _time('get_title (original)', lambda: series.map(_reference_get_title), n)
+    get_title.cache_clear()
+    result = _time('get_title (memoized)', lambda: series.map(get_title), n)
+    assert result.equals(reference), 'get_title differs from the original implementation'
+    get_title.cache_clear()
+    result = _time('get_titles (Series)', lambda: get_titles(series), n)
+    assert result.equals(reference), 'get_titles differs from the original implementation'
+    logging.info('Outputs match the original implementations')
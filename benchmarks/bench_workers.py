@@ -0,0 +1,100 @@
+import argparse
+import logging
+import os
+import random
+import timeit
+import pandas as pd
+from scholar_map.get_locations import Resolver
+from scholar_map.reference import ReferenceData
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+WORDS = ['department', 'computer', 'science', 'lab', 'research', 'engineering', 'institute', 'center', 'school',
+         'medicine', 'physics', 'group', 'systems', 'data', 'intelligence', 'robotics', 'faculty', 'studies']
+CITIES = ['Lisbon', 'Porto', 'Boston', 'London', 'Paris', 'Berlin', 'Tokyo', 'Toronto', 'Sydney', 'Madrid']
+
+
+def _generate_data(num_authors, num_domains, uni_names, seed):
+    rng = random.Random(seed)
+
+    def _affiliation():
+        r = rng.random()
+        title = rng.choice(['Professor', 'PhD Student', 'Researcher', 'Postdoc'])
+        if r < .05:
+            return 'Unknown affiliation'
+        if r < .5:
+            return f'{title}, {rng.choice(uni_names).title()}'  # known uni
+        words = ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 4)))
+        if r < .6:
+            return f'{title} at {words} - {rng.choice(CITIES)}'
+        if r < .7:
+            return rng.choice(CITIES)
+        return f'{title}, {words}'
+
+    affiliations = [_affiliation() for _ in range(num_authors)]
+    domain_affiliations = {f'domain{i}.org': [] for i in range(num_domains)}
+    domains = list(domain_affiliations.keys())
+    for affiliation in affiliations:
+        domain_affiliations[rng.choice(domains)].append(affiliation)
+    return affiliations, domain_affiliations
+
+
+def _reference_vote(matcher, affiliations):
+    # the original per-domain majority vote via pandas
+    affiliation = matcher.best_match(*(aff.lower() for aff in affiliations if aff is not None))
+    if affiliation is None:
+        affiliation = pd.Series(affiliations, dtype=object).value_counts()
+        affiliation = affiliation[affiliation == affiliation.max()]
+        affiliation = affiliation.index[0] if len(affiliation) > 0 else None
+    return affiliation
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--authors', type=int, default=100000, help='The number of citing authors.')
+    parser.add_argument('-d', '--domains', type=int, default=10000, help='The number of domains.')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='The maximum number of worker processes, timed from 1 up to this number.')
+    parser.add_argument('-r', '--reference', type=int, default=1000,
+                        help='The number of domains on which to check the original voting implementation.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random data generation.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    reference = ReferenceData()
+    matcher = reference.all_unis_matcher
+    affiliations, domain_affiliations = _generate_data(
+        args.authors, args.domains, sorted(reference.us_unis_df['name'].unique()), args.seed)
+    logging.info(f'Generated {len(affiliations)} affiliations ({len(set(affiliations))} unique) '
+                 f'of {len(domain_affiliations)} domains')
+
+    serial = None
+    workers = 1
+    while True:
+        resolver = Resolver(None, reference, workers=workers)
+        start = timeit.default_timer()
+        resolver.process_affiliations(affiliations)
+        parse_time = timeit.default_timer() - start
+        processed = {domain: [resolver.process_affiliation(aff) for aff in affs]
+                     for domain, affs in domain_affiliations.items()}
+        start = timeit.default_timer()
+        votes = resolver.vote_affiliations(processed)
+        vote_time = timeit.default_timer() - start
+        if serial is None:
+            serial = (parse_time + vote_time, processed, votes)
+        else:
+            assert (processed, votes) == serial[1:], f'Results with {workers} workers differ from the serial mode'
+        logging.info(f'{workers} workers: parse {parse_time:.3f}s, vote {vote_time:.3f}s, '
+                     f'speedup {serial[0] / (parse_time + vote_time):.2f}x')
+        if workers >= args.workers:
+            break
+        workers = min(workers * 2, args.workers)
+    logging.info('Results match the serial mode')
+
+    # check voting against the original implementation
+    ref_domains = list(serial[1].keys())[:args.reference]
+    for domain in ref_domains:
+        assert _reference_vote(matcher, serial[1][domain]) == serial[2][domain], \
+            f'Vote of "{domain}" differs from the original implementation'
+    logging.info(f'Votes of {len(ref_domains)} domains match the original implementation')
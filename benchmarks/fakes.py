@@ -0,0 +1,312 @@
+import contextlib
+import itertools
+import random
+import socket
+import struct
+import threading
+import time
+import types
+import zlib
+import email2country
+from scholar_map.geocoding import GeoLocation
+from scholar_map.indexes import IPRangeIndex
+from scholar_map.reference import ReferenceData, COMPILED_DIR
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+class FakeScholar(object):
+    """
+    Offline stand-in for the `scholarly` backend, serving synthetic publications, citations and author profiles with a
+    configurable latency per request.
+    """
+
+    def __init__(self, scholar_id='SCHOLAR', num_pubs=10, num_citations=20, num_authors=100, authors_per_citation=3,
+                 domains=('mit.edu',), latency=0., failure_rate=0., seed=0, num_scholars=1, weights=None,
+                 affiliations=None):
+        """
+        Creates a new fake backend.
+        :param str scholar_id: the id of the (first) scholar. Other scholars' ids have a numeric suffix, e.g.,
+        "SCHOLAR1".
+        :param int num_pubs: the number of publications of each scholar.
+        :param int num_citations: the number of citations of each publication.
+        :param int num_authors: the number of citing authors, shared by all scholars.
+        :param int authors_per_citation: the number of authors of each citation.
+        :param tuple[str] domains: the citing authors' email domains.
+        :param float latency: the time taken by each request, in seconds.
+        :param float failure_rate: the probability of each request failing.
+        :param int seed: the seed of the random data generator.
+        :param int num_scholars: the number of scholars.
+        :param list[float] weights: the relative frequency of each of the citing authors' email domains, uniform if
+        `None`.
+        :param dict[str, list[str]] affiliations: the affiliations from which to draw those of the citing authors with
+        each email domain. If `None`, affiliations are derived from the domain's name, independently of the authors'
+        email domains.
+        """
+        self.scholar_id = scholar_id
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.num_calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        cum_weights = list(itertools.accumulate(weights)) if weights is not None else None
+
+        def _domain():
+            return self._rng.choice(domains) if cum_weights is None else \
+                self._rng.choices(domains, cum_weights=cum_weights)[0]
+
+        self.authors = {}
+        for i in range(num_authors):
+            if affiliations is None:
+                affiliation = f'Researcher, {_domain().split(".")[0]}'
+                domain = _domain()
+            else:
+                domain = _domain()
+                affiliation = self._rng.choice(affiliations[domain])
+            self.authors[f'AUTH{i:07d}'] = dict(scholar_id=f'AUTH{i:07d}', name=f'Author {i}',
+                                                affiliation=affiliation, email_domain=f'@{domain}')
+        author_ids = list(self.authors.keys())
+        self.citations = {}
+        self.scholars = {}
+        for k in range(num_scholars):
+            sid = scholar_id if k == 0 else f'{scholar_id}{k}'
+            pubs = []
+            for i in range(num_pubs):
+                pub_id = f'{sid}:PUB{i:05d}'
+                pub = dict(author_pub_id=pub_id, bib=dict(title=f'publication number {i}'), citedby_url=f'/cites?{i}')
+                pubs.append(pub)
+                citations = []
+                for j in range(num_citations):
+                    ids = self._rng.sample(author_ids, min(authors_per_citation, len(author_ids)))
+                    ids = [a if self._rng.random() > .1 else '' for a in ids]  # some without profile
+                    citations.append(dict(author_id=ids, bib=dict(title=f'citation {j} of {i}',
+                                                                  author=[f'Name {a or j}' for a in ids])))
+                self.citations[pub_id] = citations
+            self.scholars[sid] = dict(scholar_id=sid, name=f'Fake Scholar {k}', publications=pubs)
+        self.author = self.scholars[scholar_id]
+
+    def _request(self):
+        with self._lock:
+            self.num_calls += 1
+            fail = self._rng.random() < self.failure_rate
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if fail:
+            raise ConnectionError('Fake request failure')
+
+    def search_author_id(self, author_id):
+        self._request()
+        return self.scholars[author_id] if author_id in self.scholars else dict(self.authors[author_id])
+
+    def fill(self, author):
+        return author
+
+    def citedby(self, pub):
+        self._request()
+        return iter(self.citations[pub['author_pub_id']])
+
+
+def _sleep(latency):
+    if latency > 0:
+        time.sleep(latency)
+
+
+def _hash(text):
+    return zlib.crc32(text.encode('utf-8'))  # deterministic across runs, unlike `hash`
+
+
+class FakeGeocoder(object):
+    """
+    Offline stand-in for the `Nominatim` geocoder, resolving any query into a deterministic location, whose address
+    ends with the query's last comma-separated part (e.g., the country), with a configurable latency per request.
+    """
+
+    def __init__(self, latency=0., not_found_rate=0.):
+        """
+        Creates a new fake geocoder.
+        :param float latency: the time taken by each request, in seconds.
+        :param float not_found_rate: the fraction of queries that are not found.
+        """
+        self.latency = latency
+        self.not_found_rate = not_found_rate
+        self.num_calls = 0
+        self._lock = threading.Lock()
+
+    def geocode(self, query):
+        with self._lock:
+            self.num_calls += 1
+        _sleep(self.latency)
+        h = _hash(query)
+        if h % 1000 < self.not_found_rate * 1000:
+            return None
+        return GeoLocation(f'{query}, {query.split(", ")[-1]}', h % 180 - 90., h % 360 - 180.)
+
+
+class FakeDNS(object):
+    """
+    Offline stand-in for `socket.gethostbyname`, resolving domains into deterministic IPv4 addresses, with a
+    configurable latency per request.
+    """
+
+    def __init__(self, latency=0., failure_rate=0.):
+        """
+        Creates a new fake DNS resolver.
+        :param float latency: the time taken by each request, in seconds.
+        :param float failure_rate: the fraction of domains that cannot be resolved.
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.num_calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, domain):
+        with self._lock:
+            self.num_calls += 1
+        _sleep(self.latency)
+        h = _hash(domain)
+        if h % 1000 < self.failure_rate * 1000:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return f'{1 + h % 223}.{(h >> 8) % 256}.{(h >> 16) % 256}.{(h >> 24) % 256}'
+
+
+class FakeEmail2Country(object):
+    """
+    Offline stand-in for `email2country.email2institution_country`, resolving domains into countries from their
+    top-level domain, with a configurable latency per request.
+    """
+    COUNTRIES = {'edu': 'United States', 'gov': 'United States', 'pt': 'Portugal', 'uk': 'United Kingdom',
+                 'de': 'Germany', 'fr': 'France', 'es': 'Spain', 'it': 'Italy', 'cn': 'China', 'jp': 'Japan',
+                 'br': 'Brazil', 'ca': 'Canada', 'au': 'Australia', 'in': 'India', 'kr': 'Korea, Republic of'}
+
+    def __init__(self, latency=0.):
+        """
+        Creates a new fake country resolver.
+        :param float latency: the time taken by each request, in seconds.
+        """
+        self.latency = latency
+        self.num_calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, domain):
+        with self._lock:
+            self.num_calls += 1
+        _sleep(self.latency)
+        return self.COUNTRIES.get(domain.split('.')[-1])
+
+
+@contextlib.contextmanager
+def fake_network(dns=None, countries=None):
+    """
+    Context manager replacing `socket.gethostbyname` and `email2country.email2institution_country` by the given local
+    stand-ins, restoring the original functions on exit.
+    :param callable dns: the stand-in for `socket.gethostbyname`, e.g., a `FakeDNS`.
+    :param callable countries: the stand-in for `email2country.email2institution_country`, e.g., a
+    `FakeEmail2Country`.
+    """
+    gethostbyname, email2institution_country = socket.gethostbyname, email2country.email2institution_country
+    socket.gethostbyname = dns if dns is not None else FakeDNS()
+    email2country.email2institution_country = countries if countries is not None else FakeEmail2Country()
+    try:
+        yield
+    finally:
+        socket.gethostbyname, email2country.email2institution_country = gethostbyname, email2institution_country
+
+
+class FakeIPDatabase(object):
+    """
+    Offline stand-in for the IP2Location database, resolving IP addresses into deterministic records.
+    """
+    COUNTRIES = ['United States of America', 'United Kingdom of Great Britain and Northern Ireland', 'Portugal',
+                 'Germany', 'France', 'China', 'Japan', 'Brazil']
+
+    def get_all(self, ip_addr):
+        h = _hash(ip_addr)
+        return types.SimpleNamespace(ip=ip_addr, country_long=self.COUNTRIES[h % len(self.COUNTRIES)],
+                                     isp=None if h % 2 == 0 else f'ISP {h % 100}', city=f'City {h % 1000}',
+                                     region=f'Region {h % 50}', zipcode=f'{h % 100000:05d}',
+                                     latitude=h % 180 - 90., longitude=h % 360 - 180.)
+
+    def lookup_all(self, ip_addrs):
+        # also stands in for the database's `IPLocationIndex`
+        return {ip_addr: self.get_all(ip_addr) for ip_addr in set(ip_addrs)}
+
+
+class FakeReference(ReferenceData):
+    """
+    Reference datasets with the bundled university datasets but offline stand-ins for the IP2Location databases,
+    which are not bundled.
+    """
+
+    def __init__(self, compiled_dir=COMPILED_DIR, num_isps=1000):
+        """
+        Creates new reference datasets.
+        :param str compiled_dir: the path to the directory with the compiled university datasets.
+        :param int num_isps: the number of ISP ranges, evenly splitting the IPv4 address space.
+        """
+        super().__init__(compiled_dir)
+        self.num_isps = num_isps
+
+    @property
+    def ip_database(self):
+        return self._get('ip_database', FakeIPDatabase)
+
+    @property
+    def ip_location_index(self):
+        return self.ip_database
+
+    @property
+    def isp_names_index(self):
+        def _load():
+            size = 2 ** 32 // self.num_isps
+            names = [f'Fake ISP {i}'.encode('utf-8') for i in range(self.num_isps)]
+            return IPRangeIndex([i * size for i in range(self.num_isps)],
+                                [(i + 1) * size - 1 for i in range(self.num_isps)], range(self.num_isps),
+                                list(b''.join(names)), list(itertools.accumulate([0] + [len(n) for n in names])))
+
+        return self._get('isp_names_index', _load)
+
+
+IP_DB_COUNTRIES = {'US': 'United States of America', 'GB': 'United Kingdom of Great Britain and Northern Ireland',
+                   'PT': 'Portugal', 'DE': 'Germany', 'FR': 'France', 'CN': 'China', 'JP': 'Japan', 'BR': 'Brazil'}
+
+
+def write_ip_database(file_path, num_ranges=100000, seed=0):
+    """
+    Writes a synthetic IPv4 database in the IP2Location BIN format (DB9 layout, i.e., with country, region, city,
+    latitude, longitude and zip code fields), to be opened with `IP2Location.IP2Location`, with random ranges
+    covering the whole IPv4 address space.
+    :param str file_path: the path to the file in which to write the database.
+    :param int num_ranges: the number of IPv4 ranges.
+    :param int seed: the seed for the random ranges and records.
+    """
+    rng = random.Random(seed)
+    num_columns = 7  # ip_from + 6 fields
+    header_size = 64
+    rows_addr = header_size + 1  # 1-based
+    num_rows = num_ranges + 1  # last row holds the end of the address space
+    strings = bytearray()
+    offsets = {}
+    strings_addr = header_size + num_rows * num_columns * 4
+
+    def _string(*texts):
+        # the (0-based) file offset of the given consecutive length-prefixed strings, written once
+        if texts not in offsets:
+            offsets[texts] = strings_addr + len(strings)
+            for text in texts:
+                data = text.encode('latin-1')
+                strings.extend(struct.pack('B', len(data)) + data)
+        return offsets[texts]
+
+    starts = [0] + sorted(rng.sample(range(1, 2 ** 32 - 1), num_ranges - 1)) + [2 ** 32 - 1]
+    rows = bytearray()
+    for start in starts:
+        short = rng.choice(list(IP_DB_COUNTRIES))
+        rows.extend(struct.pack('<IIIIffI', start, _string(short, IP_DB_COUNTRIES[short]),
+                                _string(f'Region {rng.randrange(50)}'), _string(f'City {rng.randrange(1000)}'),
+                                rng.uniform(-90, 90), rng.uniform(-180, 180), _string(f'{rng.randrange(100):05d}')))
+    header = struct.pack('<BBBBBIIIIIIBBB', 9, num_columns, 24, 1, 1, num_rows, rows_addr, 0, 0, 0, 0, 1, 0, 0)
+    with open(file_path, 'wb') as fp:
+        fp.write(header.ljust(header_size, b'\0'))
+        fp.write(rows)
+        fp.write(strings)
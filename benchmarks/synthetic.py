@@ -0,0 +1,137 @@
+import argparse
+import logging
+import os
+import random
+import re
+import jsonpickle
+from benchmarks.fakes import FakeScholar
+from scholar_map.loading import get_citations_file, AUTHOR_FILE, AUTHORS_FILE
+from scholar_map.reference import ReferenceData
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+SCHOLAR_ID = 'SCHOLAR'
+
+ROLES = ['Professor', 'Associate Professor', 'Assistant Professor', 'PhD Student', 'Postdoc', 'Researcher']
+DEPARTMENTS = ['Department of Computer Science', 'School of Engineering', 'Department of Physics', 'Medical School',
+               'Institute for Data Science']
+SUB_DOMAINS = ['cs', 'eng', 'med', 'ee', 'physics', 'alumni']
+SUB_DOMAIN_RATE = .2  # fraction of university domains with department sub-domains
+OTHER_DOMAINS = {  # non-university domains, e.g., companies and webmail
+    'gmail.com': ['Independent Researcher', 'PhD Student', 'Unknown affiliation'],
+    'google.com': ['Research Scientist, Google', 'Google Research'],
+    'microsoft.com': ['Principal Researcher, Microsoft Research', 'Microsoft'],
+    'ibm.com': ['Research Staff Member, IBM Research', 'IBM'],
+    'hotmail.com': ['Unknown affiliation', 'Researcher'],
+    'qq.com': ['Unknown affiliation', 'Lecturer'],
+}
+DOMAIN_PATTERN = re.compile(r'^[a-z0-9-]+(\.[a-z0-9-]+)+$')
+
+
+def get_domains(reference, num_domains, skew=1., seed=0):
+    """
+    Draws citing authors' email domains from the bundled US and world universities' datasets, together with some
+    department sub-domains and non-university domains, each with a set of plausible affiliations. The domains'
+    relative frequencies follow a Zipf law, such that a few domains hold most authors, as in real citation data.
+    :param ReferenceData reference: the reference datasets with the universities.
+    :param int num_domains: the number of university domains to draw.
+    :param float skew: the exponent of the Zipf law, where 0 corresponds to uniform frequencies.
+    :param int seed: the seed of the random data generator.
+    :rtype: tuple[list[str], list[float], dict[str, list[str]]]
+    :return: a tuple (domains, weights, affiliations) with the domains, their relative frequency and their authors'
+    possible affiliations.
+    """
+    rng = random.Random(seed)
+    unis = {}  # domain -> university name
+    for website, name in zip(reference.us_unis_df['website'], reference.us_unis_df['name']):
+        if isinstance(website, str) and DOMAIN_PATTERN.match(website):
+            unis.setdefault(website, name.title())
+    for uni in reference.world_unis:
+        for domain in uni['domains']:
+            if DOMAIN_PATTERN.match(domain.lower()):
+                unis.setdefault(domain.lower(), uni['name'])
+    domains = sorted(unis.keys())
+    rng.shuffle(domains)
+    domains = domains[:num_domains]
+
+    affiliations = {}
+    for domain in domains:
+        name = unis[domain]
+        affiliations[domain] = [f'{role}, {name}' for role in ROLES] + \
+                               [f'{rng.choice(ROLES)} at {rng.choice(DEPARTMENTS)} - {name}', name]
+        if rng.random() < SUB_DOMAIN_RATE:
+            affiliations[f'{rng.choice(SUB_DOMAINS)}.{domain}'] = affiliations[domain]
+    affiliations.update(OTHER_DOMAINS)
+
+    domains = list(affiliations.keys())
+    rng.shuffle(domains)  # ranks of the Zipf law
+    weights = [1. / (rank + 1) ** skew for rank in range(len(domains))]
+    return domains, weights, affiliations
+
+
+def get_fake_scholar(reference, num_authors, num_pubs, num_citations, authors_per_citation=3, num_domains=2000,
+                     skew=1., latency=0., failure_rate=0., seed=0):
+    """
+    Creates an offline scholar backend serving synthetic publications, citations and citing authors, whose email
+    domains and affiliations are drawn by `get_domains`.
+    :param ReferenceData reference: the reference datasets with the universities.
+    :param int num_authors: the number of citing authors.
+    :param int num_pubs: the number of publications of the scholar.
+    :param int num_citations: the number of citations of each publication.
+    :param int authors_per_citation: the number of authors of each citation.
+    :param int num_domains: the number of university domains.
+    :param float skew: the exponent of the Zipf law of the domains' frequencies.
+    :param float latency: the time taken by each request, in seconds.
+    :param float failure_rate: the probability of each request failing.
+    :param int seed: the seed of the random data generator.
+    :rtype: FakeScholar
+    """
+    domains, weights, affiliations = get_domains(reference, num_domains, skew, seed)
+    return FakeScholar(SCHOLAR_ID, num_pubs, num_citations, num_authors, authors_per_citation, domains, latency,
+                       failure_rate, seed, weights=weights, affiliations=affiliations)
+
+
+def write_dataset(fake, output_dir):
+    """
+    Writes the data served by the given backend in the format saved by `get_scholar`, i.e., the scholar's
+    `AUTHOR_FILE`, one citations file per publication and the citing authors' (legacy) `AUTHORS_FILE`, such that the
+    other stages can be run without fetching.
+    :param FakeScholar fake: the scholar backend.
+    :param str output_dir: the path to the directory in which to save the data.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, AUTHOR_FILE), 'w') as fp:
+        fp.write(jsonpickle.dumps(fake.author, indent=4))
+    authors = {}
+    for pub in fake.author['publications']:
+        citations = fake.citations[pub['author_pub_id']]
+        with open(get_citations_file(output_dir, pub), 'w') as fp:
+            fp.write(jsonpickle.dumps(citations, indent=4))
+        for citation in citations:
+            for author_id, name in zip(citation['author_id'], citation['bib']['author']):
+                if author_id == '':
+                    authors[name] = {'name': name}
+                else:
+                    authors[author_id] = fake.authors[author_id]
+    with open(os.path.join(output_dir, AUTHORS_FILE), 'w') as fp:
+        fp.write(jsonpickle.dumps(authors))
+    logging.info(f'Saved {len(fake.author["publications"])} publications and {len(authors)} citing authors '
+                 f'in "{output_dir}"')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='The path to the directory in which to save the synthetic data.')
+    parser.add_argument('-a', '--authors', type=int, default=10000, help='The number of citing authors.')
+    parser.add_argument('-p', '--pubs', type=int, default=50, help='The number of publications.')
+    parser.add_argument('-c', '--citations', type=int, default=200, help='The number of citations per publication.')
+    parser.add_argument('-d', '--domains', type=int, default=2000, help='The number of university domains.')
+    parser.add_argument('--skew', type=float, default=1., help='The exponent of the Zipf law of the domains.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='The seed for the random data generation.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    write_dataset(get_fake_scholar(ReferenceData(), args.authors, args.pubs, args.citations, num_domains=args.domains,
+                                   skew=args.skew, seed=args.seed), args.output)
@@ -1,2 +1,23 @@
+import importlib
+
 __author__ = 'Pedro Sequeira'
 __email__ = 'pedrodbs@gmail.com'
+
+# public API, imported on first access such that running a single stage does not import the others
+_API = {
+    'Pipeline': 'pipeline',
+    'AuthorInstitutions': 'institutions',
+    'CachedHostResolver': 'hosts',
+    'StaticHostResolver': 'hosts',
+    'Resolver': 'get_locations',
+    'ReferenceData': 'reference',
+    'load_authors': 'get_locations',
+}
+
+__all__ = list(_API)
+
+
+def __getattr__(name):
+    if name not in _API:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(f'.{_API[name]}', __name__), name)
@@ -0,0 +1,106 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .metrics import metrics
+from .throttling import RateLimiter, retry, MAX_WORKERS, MAX_RETRIES
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+CITATIONS = 'citations'
+AUTHOR = 'author'
+
+
+class ScholarFetcher(object):
+    """
+    Scheduler fetching publications' citations and citing authors' profiles concurrently through a pool of workers
+    sharing a single scholar backend, e.g., the `scholarly` module or a local stand-in. All requests go through a
+    global token bucket allowing one request every `min_wait` to `max_wait` seconds, and failed requests are retried
+    with jittered exponential backoff.
+    """
+
+    def __init__(self, backend, max_workers=MAX_WORKERS, min_wait=0., max_wait=0., retries=MAX_RETRIES):
+        """
+        Creates a new fetcher.
+        :param backend: the scholar backend, providing the `citedby(pub)` and `search_author_id(author_id)` methods.
+        :param int max_workers: the maximum number of concurrent requests.
+        :param float min_wait: the minimum time between consecutive requests, in seconds.
+        :param float max_wait: the maximum time between consecutive requests, in seconds.
+        :param int retries: the maximum number of retries of each failed request.
+        """
+        self.backend = backend
+        self.throttle = RateLimiter(1. / min_wait, jitter=max_wait - min_wait) if min_wait > 0 else None
+        self._get_citations = retry(metrics.timed('network.scholar.citations', self._citedby),
+                                    retries=retries, backoff=max(1., min_wait), limiter=self.throttle)
+        self._get_author = retry(metrics.timed('network.scholar.author', self._search_author_id),
+                                 retries=retries, backoff=max(1., min_wait), limiter=self.throttle)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {}  # future -> (kind, item)
+        self._authors = set()  # ids of the authors being fetched, fetched ones are deduplicated by the caller's store
+        self._failed_authors = set()  # ids of the authors that could not be fetched, not retried
+        self._lock = threading.Lock()
+        self.num_errors = 0
+
+    def _citedby(self, pub):
+        return list(self.backend.citedby(pub))
+
+    def _search_author_id(self, author_id):
+        return self.backend.search_author_id(author_id)
+
+    def submit_citations(self, pub):
+        """
+        Schedules fetching the citations of the given publication.
+        :param dict pub: the publication, as given by the scholar backend.
+        """
+        with self._lock:
+            self._pending[self._executor.submit(self._get_citations, pub)] = (CITATIONS, pub)
+
+    def submit_author(self, author_id):
+        """
+        Schedules fetching the profile of the given author, if not being fetched and not previously failed. Authors
+        whose profiles were already yielded by `results` are not tracked, such that memory is bounded by the number of
+        pending requests, so should be skipped by the caller, e.g., if in the citing authors' store.
+        :param str author_id: the Google Scholar id of the author.
+        :rtype: bool
+        :return: whether fetching the author's profile was scheduled by this call.
+        """
+        with self._lock:
+            if author_id in self._authors or author_id in self._failed_authors:
+                return False
+            self._authors.add(author_id)
+            self._pending[self._executor.submit(self._get_author, author_id)] = (AUTHOR, author_id)
+            return True
+
+    def results(self):
+        """
+        Iterates over the results of the scheduled requests as they complete, until there are no pending requests.
+        New requests can be scheduled while iterating. Requests failing after all retries are logged and skipped.
+        :rtype: typing.Iterator[tuple[str, object, object]]
+        :return: an iterator over tuples (kind, item, result), where `kind` is either `CITATIONS` or `AUTHOR`, `item`
+        is the publication or author id, and `result` is the list of citations or the author profile, respectively.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending.keys())
+            if len(pending) == 0:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                with self._lock:
+                    kind, item = self._pending.pop(future)
+                    if kind == AUTHOR:
+                        self._authors.discard(item)
+                try:
+                    result = future.result()
+                except Exception as err:
+                    self.num_errors += 1
+                    if kind == AUTHOR:
+                        with self._lock:
+                            self._failed_authors.add(item)
+                    logging.info(f'Error fetching {kind} for "{item if kind == AUTHOR else item["author_pub_id"]}": '
+                                 f'{err}, skipping')
+                    continue
+                yield kind, item, result
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
+from .metrics import metrics
+from .throttling import RateLimiter, retry, MAX_RETRIES
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+GEO_CACHE_FILE = 'geocode_cache.db'
+
+CACHE_TTL = 90 * 24 * 60 * 60  # 90 days
+NEGATIVE_CACHE_TTL = 7 * 24 * 60 * 60  # 7 days
+
+NOMINATIM_RATE = 1.  # requests per second, see https://operations.osmfoundation.org/policies/nominatim/
+GEOCODER_ERRORS = (GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable)  # transient errors, worth retrying
+
+GeoLocation = namedtuple('GeoLocation', ['address', 'latitude', 'longitude'])
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class CachedGeocoder(object):
+    """
+    Geocoder backed by a persistent SQLite cache keyed on the normalized query string. Both found and not-found results
+    are cached, each with its own time-to-live. Any object with a `geopy`-like `geocode(query)` method, e.g.,
+    `geopy.Nominatim`, or a local stand-in, can be used as the backend geocoder. Can be shared among threads.
+    """
+
+    def __init__(self, geocoder, cache_file, ttl=CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL):
+        self.geocoder = geocoder
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS geocode (query TEXT PRIMARY KEY, address TEXT, '
+                           'latitude REAL, longitude REAL, timestamp REAL NOT NULL)')
+        self._conn.commit()
+
+    def geocode(self, query):
+        """
+        Geocodes the given query, first by searching the cache, then by calling the backend geocoder.
+        :param str query: the query (e.g., address, place or institution name) to geocode.
+        :rtype: GeoLocation
+        :return: the location found for the query, or `None` if the query could not be geocoded.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            row = self._conn.execute('SELECT address, latitude, longitude, timestamp FROM geocode WHERE query=?',
+                                     (key,)).fetchone()
+            if row is not None:
+                address, latitude, longitude, timestamp = row
+                if time.time() - timestamp <= (self.ttl if address is not None else self.negative_ttl):
+                    self.hits += 1
+                    metrics.count('cache.geocode.hits')
+                    return None if address is None else GeoLocation(address, latitude, longitude)
+            self.misses += 1
+        metrics.count('cache.geocode.misses')
+
+        location = self.geocoder.geocode(query)  # not locked, backend calls can run concurrently
+        if location is not None:
+            location = GeoLocation(location.address, location.latitude, location.longitude)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)',
+                               (key,) + (tuple(location) if location is not None else (None, None, None)) +
+                               (time.time(),))
+            self._conn.commit()
+        return location
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ThrottledGeocoder(object):
+    """
+    Geocoder wrapper limiting the rate of calls to the backend geocoder, shared among all threads, and retrying calls
+    that failed due to transient errors with jittered exponential backoff.
+    """
+
+    def __init__(self, geocoder, rate=NOMINATIM_RATE, retries=MAX_RETRIES):
+        self.geocoder = geocoder
+        self.limiter = RateLimiter(rate)
+        self.geocode = retry(metrics.timed('network.geocode', geocoder.geocode), GEOCODER_ERRORS, retries,
+                             limiter=self.limiter)
+
+
+class StaticGeocoder(object):
+    """
+    Offline stand-in geocoder resolving queries from a fixed mapping, e.g., to be used as the backend of a
+    `CachedGeocoder` in tests and benchmarks.
+    """
+
+    def __init__(self, locations):
+        self.locations = {normalize_query(query): GeoLocation(*loc) for query, loc in locations.items()}
+        self.calls = 0
+
+    def geocode(self, query):
+        self.calls += 1
+        return self.locations.get(normalize_query(query))
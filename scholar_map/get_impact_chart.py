@@ -1,12 +1,18 @@
 import argparse
+import csv
+import itertools
 import logging
+import operator
 import os
-import jsonpickle
 import pandas as pd
 import tqdm
-from get_locations import LOCATIONS_FILE
-from get_scholar import OUTPUT_DIR, AUTHOR_FILE, AUTHORS_FILE
-from util import clean_filename, get_title
+from .get_locations import load_authors, LOCATIONS_FILE
+from .institutions import AuthorInstitutions, get_domain_index, AUTHOR_INSTITUTIONS_FILE
+from .loading import load_cached, iter_citations, iter_json_array, get_citations_file, OUTPUT_DIR, AUTHOR_FILE, \
+    AUTHORS_FILE
+from .metrics import metrics, stage
+from .stores import AuthorStore, AuthorDatabase, AUTHORS_STORE_FILE, AUTHORS_DB_FILE
+from .util import get_title, get_titles
 
 __author__ = 'Pedro Sequeira'
 __email__ = 'pedrodbs@gmail.com'
@@ -16,22 +22,370 @@ CITATION_COL_NAME = 'Cited By'
 INSTITUTE_COL_NAME = 'Institute'
 LOCATION_COL_NAME = 'Location'
 DOMAIN_COL_NAME = 'Domain'
+CITATIONS_COL_NAME = 'Citations'
+LOCATION_CITATIONS_COL_NAME = 'Location Citations'
+
+PUB_POS_COL = 'pub'
+CITATION_POS_COL = 'citation'
+AUTHOR_ID_COL = 'author_id'
 
 IMPACT_CHART_FILE = 'impact_chart.csv'
+IMPACT_TABLE_FILE = 'impact_table'
+TABLE_FORMATS = ['parquet', 'feather']
+
+
+def get_citing_authors_table(pubs_citations, scholar_id):
+    """
+    Flattens the citations of each publication into a table with one row per (publication, citation, citing author)
+    triple.
+    :param list[list[dict]] pubs_citations: the list of citations of each publication.
+    :param str scholar_id: the Google Scholar id of the cited author, whose own citations are skipped.
+    :rtype: pd.DataFrame
+    :return: a table with the position of the publication, the position of the citation (over all publications) and
+    the id of the citing author in each row.
+    """
+    pub_pos = []
+    citation_pos = []
+    author_ids = []
+    for i, citations in enumerate(pubs_citations):
+        for citation in citations:
+            authors_ids = citation['author_id']
+            if scholar_id in authors_ids:
+                continue  # own citation, skip
+            num_authors = min(len(authors_ids), len(citation['bib']['author']))
+            pub_pos.extend([i] * num_authors)
+            citation_pos.extend([len(citation_pos)] * num_authors)
+            author_ids.extend(authors_ids[:num_authors])
+    return pd.DataFrame({PUB_POS_COL: pub_pos, CITATION_POS_COL: citation_pos, AUTHOR_ID_COL: author_ids})
+
+
+def load_author_institutions(output_dir):
+    """
+    Loads the mapping from citing author to institution saved by `get_locations` in the given directory.
+    :param str output_dir: the path to the directory to load data.
+    :rtype: AuthorInstitutions
+    :return: the mapping, or `None` if the file does not exist or is older than the locations or the authors files.
+    """
+    file_path = os.path.join(output_dir, AUTHOR_INSTITUTIONS_FILE)
+    if not os.path.isfile(file_path):
+        return None
+    stamp = os.path.getmtime(file_path)
+    sources = [os.path.join(output_dir, file) for file in (LOCATIONS_FILE, AUTHORS_STORE_FILE, AUTHORS_FILE)]
+    if any(stamp < os.path.getmtime(source) for source in sources if os.path.isfile(source)):
+        logging.info(f'Institutions file is older than the locations or authors files: {file_path}')
+        return None
+    institutions = AuthorInstitutions.load(file_path)
+    logging.info(f'Loaded institutions of {len(institutions)} authors from "{file_path}"')
+    return institutions
+
+
+def get_author_institutions(output_dir, authors=None, domains_df=None):
+    """
+    Gets the mapping from citing author to institution. If neither the authors nor the locations are given, the
+    mapping saved by `get_locations` in the output directory is loaded if up-to-date, otherwise it is computed from the
+    given data, or the data stored in the output directory.
+    :param str output_dir: the path to the directory to load data.
+    :param authors: the citing authors' data, indexed by author id, e.g., a dict or an `AuthorDatabase`.
+    :param pd.DataFrame domains_df: the locations table, as produced by `get_locations`.
+    :rtype: AuthorInstitutions
+    """
+    if authors is None and domains_df is None:
+        institutions = load_author_institutions(output_dir)
+        if institutions is not None:
+            return institutions
+    if authors is None:
+        authors = load_authors(output_dir)
+    if domains_df is None:
+        file_path = os.path.join(output_dir, LOCATIONS_FILE)
+        if not os.path.isfile(file_path):
+            raise ValueError(f'File with domain info does not exist: {file_path}')
+        domains_df = pd.read_csv(file_path)
+        logging.info(f'Loaded location data from "{file_path}"')
+    return AuthorInstitutions.from_locations(authors, domains_df)
+
+
+def get_impact_table(citing_df, institutions):
+    """
+    Gets the institutes citing each publication by joining the citing authors with their institutions.
+    :param pd.DataFrame citing_df: the table with the (publication, citing author) pairs.
+    :param AuthorInstitutions institutions: the mapping from citing author to institution.
+    :rtype: pd.DataFrame
+    :return: a table with the position of the publication, the citing institute's name, country and domain, and the
+    number of citations of the publication from the institute and from its country in each row, with one row per
+    unique institute of each publication, in order of appearance.
+    """
+    inst = institutions.get_institutions(citing_df[AUTHOR_ID_COL].values)
+    found = inst >= 0
+    inst = inst[found]
+    df = pd.DataFrame({PUB_POS_COL: citing_df[PUB_POS_COL].values[found],
+                       CITATION_POS_COL: citing_df[CITATION_POS_COL].values[found],
+                       'inst': inst,
+                       'name': institutions.name_codes[inst],
+                       'country': institutions.country_codes[inst]})
+
+    # counts each citation once per institute / country, even if it has several authors from it
+    # the country and domain of each institute are those of its first occurrence, whether known or not
+    df = df.drop_duplicates([PUB_POS_COL, CITATION_POS_COL, 'name'])
+    impact_df = df.groupby([PUB_POS_COL, 'name'], sort=False).agg(
+        inst=('inst', 'first'), citations=(CITATION_POS_COL, 'size')).reset_index()
+    inst = impact_df['inst'].values
+    countries = institutions.country_codes[inst]
+    location_counts = df.drop_duplicates([PUB_POS_COL, CITATION_POS_COL, 'country']).groupby(
+        [PUB_POS_COL, 'country']).size()
+    return pd.DataFrame({PUB_POS_COL: impact_df[PUB_POS_COL].values,
+                         INSTITUTE_COL_NAME: institutions.names[impact_df['name'].values],
+                         LOCATION_COL_NAME: institutions.countries[countries],
+                         DOMAIN_COL_NAME: institutions.domains[inst],
+                         CITATIONS_COL_NAME: impact_df['citations'].values,
+                         LOCATION_CITATIONS_COL_NAME: location_counts.reindex(
+                             pd.MultiIndex.from_arrays([impact_df[PUB_POS_COL].values, countries])).values})
+
+
+def iter_impact_chart_rows(impact_df, pub_titles):
+    """
+    Generates the rows of the impact chart, i.e., for each cited publication, a header followed by the citing
+    institutes sorted by location and name.
+    :param pd.DataFrame impact_df: the table with the unique institutes citing each publication.
+    :param list[str] pub_titles: the titles of the publications, indexed by the publications' positions in the table.
+    :rtype: typing.Iterator[list[str]]
+    """
+    impact_df = impact_df.sort_values([PUB_POS_COL, LOCATION_COL_NAME, INSTITUTE_COL_NAME], kind='stable')
+    impact_df = impact_df.astype(object).where(impact_df.notna(), None)  # missing values as empty fields
+    rows = zip(impact_df[PUB_POS_COL], impact_df[INSTITUTE_COL_NAME], impact_df[LOCATION_COL_NAME],
+               impact_df[DOMAIN_COL_NAME], impact_df[CITATIONS_COL_NAME], impact_df[LOCATION_CITATIONS_COL_NAME])
+    for pub_pos, pub_rows in itertools.groupby(rows, key=operator.itemgetter(0)):
+        yield [PUB_COL_NAME, CITATION_COL_NAME, ' ', ' ', ' ', ' ']
+        yield [get_title(pub_titles[pub_pos]), INSTITUTE_COL_NAME, LOCATION_COL_NAME, DOMAIN_COL_NAME,
+               CITATIONS_COL_NAME, LOCATION_CITATIONS_COL_NAME]
+        for row in pub_rows:
+            yield [' '] + list(row[1:])
+        yield [' ', ' ', ' ', ' ', ' ', '']  # blank line
+
+
+def write_impact_chart(file_path, rows):
+    """
+    Writes the given rows to a CSV file as they are generated.
+    :param str file_path: the path to the CSV file.
+    :param typing.Iterable[list[str]] rows: the rows to be written.
+    """
+    with open(file_path, 'w', encoding='utf-8', newline='') as fp:
+        csv.writer(fp, lineterminator='\n').writerows(rows)
+
+
+def _get_long_table(impact_df, pub_titles):
+    titles = get_titles(pd.Series(pub_titles, dtype=object))
+    return pd.DataFrame({PUB_COL_NAME: titles.iloc[impact_df[PUB_POS_COL]].values,
+                         INSTITUTE_COL_NAME: impact_df[INSTITUTE_COL_NAME].values,
+                         LOCATION_COL_NAME: impact_df[LOCATION_COL_NAME].values,
+                         DOMAIN_COL_NAME: impact_df[DOMAIN_COL_NAME].values,
+                         CITATIONS_COL_NAME: impact_df[CITATIONS_COL_NAME].values,
+                         LOCATION_CITATIONS_COL_NAME: impact_df[LOCATION_CITATIONS_COL_NAME].values})
+
+
+def write_impact_table(file_path, impact_df, pub_titles, table_format):
+    """
+    Writes the impact data as a long-form table with one row per publication and citing institute.
+    :param str file_path: the path to the file.
+    :param pd.DataFrame impact_df: the table with the unique institutes citing each publication.
+    :param list[str] pub_titles: the titles of the publications, indexed by the publications' positions in the table.
+    :param str table_format: the file format, one of `TABLE_FORMATS` (requires `pyarrow`).
+    """
+    df = _get_long_table(impact_df, pub_titles)
+    if table_format == 'parquet':
+        df.to_parquet(file_path, index=False)
+    elif table_format == 'feather':
+        df.to_feather(file_path)
+    else:
+        raise ValueError(f'Unknown table format: {table_format}')
+
+
+def get_impact_chart(scholar_id, output_dir, author=None, authors=None, domains_df=None, table_format=None):
+    """
+    Gets the institutes and locations citing each of the given scholar's publications and saves them in an
+    `IMPACT_CHART_FILE` file. Data not given is loaded from the files saved in the output directory by the previous
+    stages, i.e., if neither the authors nor the locations are given, only the mapping from citing author to
+    institution saved by `get_locations` is loaded (see `get_author_institutions`).
+    :param str scholar_id: the Google Scholar profile/user ID.
+    :param str output_dir: the path to the directory to load and save data.
+    :param dict author: the scholar's data, as fetched by `get_scholar`.
+    :param dict authors: the citing authors' data, indexed by author id.
+    :param pd.DataFrame domains_df: the locations table, as produced by `get_locations`.
+    :param str table_format: the format in which to also save the impact data as a long-form table, one of
+    `TABLE_FORMATS`, or `None`.
+    :rtype: pd.DataFrame
+    :return: the table with the unique institutes citing each publication.
+    """
+    # get author data
+    if author is None:
+        file_path = os.path.join(output_dir, AUTHOR_FILE)
+        if not os.path.isfile(file_path):
+            raise ValueError(f'File with author\'s info does not exist: {file_path}')
+        author = load_cached(file_path)
+        logging.info(f'Loaded info for author id: "{scholar_id}" from {file_path}')
+
+    # get citing authors' institutions
+    institutions = get_author_institutions(output_dir, authors, domains_df)
+
+    # for each publication, get citations
+    pubs = author['publications']
+    logging.info(f'Got {len(pubs)} publications')
+    pubs_citations = []
+    cited_pubs = []
+    logging.info('==================================================')
+    logging.info('Taking citations\' institute and location information for each publication...')
+    for pub, citations in tqdm.tqdm(iter_citations(output_dir, pubs), total=len(pubs)):
+        pubs_citations.append(citations)
+        cited_pubs.append(pub['bib']['title'])
+        logging.info(f'Loaded {len(citations)} citations for "{pub["bib"]["title"]}"')
+
+    # join all citing authors with their institutes at once
+    citing_df = get_citing_authors_table(pubs_citations, scholar_id)
+    impact_df = get_impact_table(citing_df, institutions)
+    logging.info(f'Got {len(citing_df)} citing authors from {sum(len(c) for c in pubs_citations)} citations, '
+                 f'{len(impact_df)} unique institutes per publication')
+
+    logging.info('==================================================')
+    file_path = os.path.join(output_dir, IMPACT_CHART_FILE)
+    write_impact_chart(file_path, iter_impact_chart_rows(impact_df, cited_pubs))
+    logging.info(f'Saved impact chart in "{file_path}"')
 
+    if table_format is not None:
+        file_path = os.path.join(output_dir, f'{IMPACT_TABLE_FILE}.{table_format}')
+        write_impact_table(file_path, impact_df, cited_pubs, table_format)
+        logging.info(f'Saved impact table in "{file_path}"')
 
-def _get_author_info():
-    sub_domain = cite_author['email_domain'].lower().replace('@', '')
-    info = domains_df[domains_df['domain'] == sub_domain]
-    if len(info) > 0:
-        return info.iloc[0]
+    return impact_df
 
-    domain = '.'.join(sub_domain.split('.')[-2:])
-    info = domains_df[domains_df['domain'] == domain]
-    if len(info) > 0:
-        return info.iloc[0]
 
-    return None  # not found
+class ImpactTableWriter(object):
+    """
+    Writes the impact data as a long-form table (see `write_impact_table`) incrementally, e.g., one publication at a
+    time, i.e., as a Parquet file with one row group per write or as a Feather (Arrow IPC) file with one record batch
+    per write.
+    """
+
+    def __init__(self, file_path, table_format):
+        """
+        Creates a new writer.
+        :param str file_path: the path to the file.
+        :param str table_format: the file format, one of `TABLE_FORMATS` (requires `pyarrow`).
+        """
+        import pyarrow as pa
+        self._schema = pa.schema([(PUB_COL_NAME, pa.string()), (INSTITUTE_COL_NAME, pa.string()),
+                                  (LOCATION_COL_NAME, pa.string()), (DOMAIN_COL_NAME, pa.string()),
+                                  (CITATIONS_COL_NAME, pa.int64()), (LOCATION_CITATIONS_COL_NAME, pa.int64())])
+        if table_format == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(file_path, self._schema)
+        elif table_format == 'feather':
+            self._writer = pa.ipc.new_file(file_path, self._schema)
+        else:
+            raise ValueError(f'Unknown table format: {table_format}')
+
+    def write(self, impact_df, pub_titles):
+        """
+        Appends the given impact data to the table.
+        :param pd.DataFrame impact_df: the table with the unique institutes citing some publications.
+        :param list[str] pub_titles: the titles of the publications, indexed by the publications' positions in the
+        table.
+        """
+        import pyarrow as pa
+        self._writer.write_table(pa.Table.from_pandas(_get_long_table(impact_df, pub_titles), self._schema,
+                                                      preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+def stream_impact_chart(scholar_id, output_dir, author=None, authors=None, domains_df=None, table_format=None):
+    """
+    Bounded-memory version of `get_impact_chart`, producing the same files. Each publication's citations are parsed
+    incrementally, joined with the citing authors' institutions, and its rows are written as soon as they are
+    computed, such that only the data of one publication is held in memory at a time, in addition to the locations
+    table. The (integer-coded) mapping from citing author to institution saved by `get_locations` is used if neither the
+    authors nor the locations are given and it is up-to-date, otherwise each publication's citing authors are looked up
+    in an on-disk `AuthorDatabase` (by default) and mapped to their institutions.
+    :param str scholar_id: the Google Scholar profile/user ID.
+    :param str output_dir: the path to the directory to load and save data.
+    :param dict author: the scholar's data, as fetched by `get_scholar`.
+    :param authors: the citing authors' data, indexed by author id, or an `AuthorDatabase`. Defaults to the
+    `AuthorDatabase` of the authors stored in the output directory.
+    :param pd.DataFrame domains_df: the locations table, as produced by `get_locations`.
+    :param str table_format: the format in which to also save the impact data as a long-form table, one of
+    `TABLE_FORMATS`, or `None`.
+    :rtype: int
+    :return: the number of rows, i.e., unique institutes citing each publication, written.
+    """
+    # get author data
+    if author is None:
+        file_path = os.path.join(output_dir, AUTHOR_FILE)
+        if not os.path.isfile(file_path):
+            raise ValueError(f'File with author\'s info does not exist: {file_path}')
+        author = load_cached(file_path)
+        logging.info(f'Loaded info for author id: "{scholar_id}" from {file_path}')
+
+    # get citing authors' institutions, saved by `get_locations`, otherwise looked up per publication
+    institutions = load_author_institutions(output_dir) if authors is None and domains_df is None else None
+    own_authors = institutions is None and authors is None
+    if institutions is None:
+        if own_authors:
+            authors_file = os.path.join(output_dir, AUTHORS_STORE_FILE)
+            legacy_file = os.path.join(output_dir, AUTHORS_FILE)
+            if not os.path.isfile(authors_file):
+                if not os.path.isfile(legacy_file):
+                    raise ValueError(f'Could not find authors file in "{authors_file}"')
+                AuthorStore(authors_file, legacy_file).close()  # one-time import
+            authors = AuthorDatabase(authors_file, os.path.join(output_dir, AUTHORS_DB_FILE), read_only=True)
+            logging.info(f'Opened store with {len(authors)} authors from "{authors_file}"')
+        if domains_df is None:
+            file_path = os.path.join(output_dir, LOCATIONS_FILE)
+            if not os.path.isfile(file_path):
+                raise ValueError(f'File with domain info does not exist: {file_path}')
+            domains_df = pd.read_csv(file_path)
+            logging.info(f'Loaded location data from "{file_path}"')
+        domain_index = get_domain_index(domains_df)
+        locations = AuthorInstitutions.from_locations({}, domains_df)  # institutions' dictionaries only
+
+    # process and write one publication at a time
+    pubs = author['publications']
+    logging.info(f'Got {len(pubs)} publications')
+    logging.info('==================================================')
+    logging.info('Taking citations\' institute and location information for each publication...')
+    chart_file = os.path.join(output_dir, IMPACT_CHART_FILE)
+    table_file = os.path.join(output_dir, f'{IMPACT_TABLE_FILE}.{table_format}')
+    table_writer = ImpactTableWriter(table_file, table_format) if table_format is not None else None
+    num_rows = 0
+    with open(chart_file, 'w', encoding='utf-8', newline='') as fp:
+        writer = csv.writer(fp, lineterminator='\n')
+        for pub in tqdm.tqdm(pubs):
+            citations_file = get_citations_file(output_dir, pub)
+            if not os.path.isfile(citations_file):
+                logging.info(f'File with citations info for "{pub["bib"]["title"]}" does not exist: '
+                             f'{citations_file} (no citations?)')
+                continue
+            citing_df = get_citing_authors_table([iter_json_array(citations_file)], scholar_id)
+            if institutions is not None:
+                impact_df = get_impact_table(citing_df, institutions)
+            else:
+                author_ids = citing_df[AUTHOR_ID_COL].unique()
+                pub_authors = authors.get_many(author_ids) if isinstance(authors, AuthorDatabase) else \
+                    {author_id: authors[author_id] for author_id in author_ids if author_id in authors}
+                impact_df = get_impact_table(citing_df, locations.with_authors(pub_authors, domain_index))
+            pub_titles = [pub['bib']['title']]
+            writer.writerows(iter_impact_chart_rows(impact_df, pub_titles))
+            if table_writer is not None:
+                table_writer.write(impact_df, pub_titles)
+            num_rows += len(impact_df)
+            logging.info(f'Got {len(citing_df)} citing authors and {len(impact_df)} unique institutes for '
+                         f'"{pub["bib"]["title"]}"')
+    logging.info('==================================================')
+    logging.info(f'Saved impact chart in "{chart_file}"')
+    if table_writer is not None:
+        table_writer.close()
+        logging.info(f'Saved impact table in "{table_file}"')
+    if own_authors:
+        authors.close()
+    return num_rows
 
 
 if __name__ == '__main__':
@@ -42,6 +396,21 @@ if __name__ == '__main__':
                              'https://scholar.google.com/citations?user=')
     parser.add_argument('-o', '--output', type=str, default=OUTPUT_DIR,
                         help='The path to the directory to load and save data.')
+    parser.add_argument('-f', '--table-format', type=str, choices=TABLE_FORMATS, default=None,
+                        help=f'Also save the impact data as a long-form table, "{IMPACT_TABLE_FILE}.FORMAT", in the '
+                             f'given format.')
+    parser.add_argument('--streaming', action='store_true',
+                        help=f'Whether to run in bounded memory, processing and writing one publication at a time. '
+                             f'If the institutions file saved by get_locations, "{AUTHOR_INSTITUTIONS_FILE}", is out '
+                             f'of date, each publication\'s citing authors are looked up in an on-disk store, '
+                             f'"{AUTHORS_DB_FILE}" in the output directory.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='The path to the file in which to save the run\'s metrics, in the Prometheus text format '
+                             'if with a ".prom" extension, otherwise as JSON. Defaults to "impact_metrics.json" in the '
+                             'output directory.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Whether to profile the stage with cProfile, saving the statistics in "impact.prof" in '
+                             'the output directory.')
     args = parser.parse_args()
 
     # output
@@ -52,100 +421,10 @@ if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S',
                         handlers=handlers)
 
-    # get author data
-    file_path = os.path.join(args.output, AUTHOR_FILE)
-    if not os.path.isfile(file_path):
-        raise ValueError(f'File with author\'s info does not exist: {file_path}')
-    with open(file_path, 'r') as fp:
-        author = jsonpickle.loads(fp.read())
-    logging.info(f'Loaded info for author id: "{args.id}" from {file_path}')
-
-    # get citing authors data
-    file_path = os.path.join(args.output, AUTHORS_FILE)
-    if not os.path.isfile(file_path):
-        raise ValueError(f'File with citing authors\' info does not exist: {file_path}')
-    with open(file_path, 'r') as fp:
-        authors = jsonpickle.loads(fp.read())
-    logging.info(f'Loaded info for {len(authors)} citing authors from {file_path}')
-
-    # get domain data
-    file_path = os.path.join(args.output, LOCATIONS_FILE)
-    if not os.path.isfile(file_path):
-        raise ValueError(f'File with domain info does not exist: {file_path}')
-    domains_df = pd.read_csv(file_path)
-    logging.info(f'Loaded location data from "{file_path}"')
-
-    # for each publication, get citations
-    pubs = author['publications']
-    logging.info(f'Got {len(pubs)} publications')
-    total_cites = 0
-    impact_data = []
-    logging.info('==================================================')
-    logging.info('Taking citations\' institute and location information for each publication...')
-    for pub in tqdm.tqdm(pubs):
-        pub_id = pub['author_pub_id']
-        pub_title = pub['bib']['title']
-
-        # get citation data for this pub
-        citations_file = os.path.join(args.output, clean_filename(pub_id) + '.json')
-        if not os.path.isfile(citations_file):
-            logging.info(f'File with citations info for "{pub_title}" does not exist: {citations_file} (no citations?)')
-            continue
-        with open(citations_file, 'r') as fp:
-            citations = jsonpickle.loads(fp.read())
-        logging.info(f'Loaded citations for "{pub_title}" from {citations_file}')
-
-        citation_data = {INSTITUTE_COL_NAME: [], LOCATION_COL_NAME: [], DOMAIN_COL_NAME: []}
-        impact_data.append({PUB_COL_NAME: pub_title, CITATION_COL_NAME: citation_data})
-
-        # for each citation, get authors' list
-        logging.info(f'Processing {len(citations)} citations...')
-        for citation in citations:
-            authors_ids = citation['args.id']
-            author_names = citation['bib']['author']
-
-            # check own citation, skip
-            if args.id in authors_ids:
-                total_cites -= 1
-                logging.info('Skipping own citation')
-                continue
-
-            # for each author, get country
-            for i, args.id in enumerate(authors_ids):
-                if i >= len(author_names):
-                    continue
-                name = author_names[i]
-                if args.id == '' or args.id not in authors:
-                    logging.info(f'Author "{name}" not found or does not have a Google Scholar profile')
-                    continue
-                cite_author = authors[args.id]
-
-                author_info = _get_author_info()
-                if author_info is None:
-                    logging.info(f'Author "{args.id}"\'s country not found, skipping')
-                affiliation = author_info['name']
-                if affiliation not in citation_data[INSTITUTE_COL_NAME]:
-                    citation_data[INSTITUTE_COL_NAME].append(affiliation)
-                    citation_data[LOCATION_COL_NAME].append(author_info['country'])
-                    citation_data[DOMAIN_COL_NAME].append(author_info['domain'])
-
-    logging.info('==================================================')
-    file_path = os.path.join(args.output, IMPACT_CHART_FILE)
-    with open(file_path, 'w', encoding='utf-8') as fp:
-        for pub in impact_data:
-            if len(pub[CITATION_COL_NAME][INSTITUTE_COL_NAME]) == 0:
-                continue  # no citations, skip
-            fp.write(f'{PUB_COL_NAME},{CITATION_COL_NAME}, , \n')
-            title = get_title(pub[PUB_COL_NAME])
-            fp.write(f'"{title}",{INSTITUTE_COL_NAME},{LOCATION_COL_NAME},{DOMAIN_COL_NAME}\n')
-            institutes = pub[CITATION_COL_NAME][INSTITUTE_COL_NAME]
-            locations = pub[CITATION_COL_NAME][LOCATION_COL_NAME]
-            domains = pub[CITATION_COL_NAME][DOMAIN_COL_NAME]
-            df = pd.DataFrame(pub[CITATION_COL_NAME])
-            df.sort_values([LOCATION_COL_NAME, INSTITUTE_COL_NAME], inplace=True)
-            for _, row in df.iterrows():
-                fp.write(f' ,"{row[INSTITUTE_COL_NAME]}","{row[LOCATION_COL_NAME]}","{row[DOMAIN_COL_NAME]}"\n')
-            fp.write(f' , , ,\n')  # blank line
-    logging.info(f'Saved impact chart in "{file_path}"')
-
+    with stage('impact', os.path.join(args.output, 'impact.prof') if args.profile else None):
+        if args.streaming:
+            stream_impact_chart(args.id, args.output, table_format=args.table_format)
+        else:
+            get_impact_chart(args.id, args.output, table_format=args.table_format)
+    metrics.save(args.metrics if args.metrics is not None else os.path.join(args.output, 'impact_metrics.json'))
     logging.info('Done!')
@@ -3,29 +3,33 @@ import csv
 import logging
 import os.path
 import re
+import socket
 import email2country
-import jsonpickle
+import functools
 import tqdm
-import IP2Location
-import socket
+import threading
 import pandas as pd
-from ipaddress import ip_network, ip_address
+from collections import Counter
 from geopy import Nominatim
 from geotext import GeoText
-from requests.exceptions import SSLError
-from get_scholar import AUTHORS_FILE, OUTPUT_DIR
-from util import get_title
+from requests.exceptions import RequestException, SSLError
+from .geocoding import CachedGeocoder, ThrottledGeocoder, GEO_CACHE_FILE, NOMINATIM_RATE
+from .hosts import CachedHostResolver, StaticHostResolver, DNS_CACHE_FILE
+from .institutions import AuthorInstitutions, AUTHOR_INSTITUTIONS_FILE
+from .loading import AUTHORS_FILE, OUTPUT_DIR
+from .metrics import metrics, stage
+from .reference import ReferenceData
+from .stores import AuthorStore, DomainStore, AUTHORS_STORE_FILE, DOMAINS_DB_FILE
+from .throttling import RateLimiter, map_concurrent, map_processes, retry, MAX_WORKERS
+from .util import get_titles
 
 __author__ = 'Pedro Sequeira'
 __email__ = 'pedrodbs@gmail.com'
 
 LOCATIONS_FILE = 'locations.csv'
+LOCATIONS_COLUMNS = ['country', 'name', 'domain', 'latitude', 'longitude', 'address', 'city', 'state', 'zip']
+EMAIL2COUNTRY_RATE = 10.  # requests per second, shared by all threads
 
-# DATA files
-IP_LOCATION_DB = 'data/IP2LOCATION-LITE-DB9.BIN/IP2LOCATION-LITE-DB9.BIN'
-WORLD_UNI_DOMAINS = 'data/world_universities_and_domains.json'
-US_UNI_DATA = 'data/Colleges_and_Universities.csv'
-ISP_NAMES_DB = 'data/IP2LOCATION-LITE-ASN.CSV'
 
 US_CODE_TO_COUNTRY = {
     'US': 'United States',
@@ -48,92 +52,23 @@ EQUIV_COUNTRIES = {
 }
 
 
-def _search_us_unis(domain):
-    unis = us_unis_df[us_unis_df['website'].str.endswith(domain)]
-    if len(unis) == 0:
-        return None
-    uni = unis.iloc[0]
-    if len(unis) > 1:
-        logging.info(f'Got {len(unis)} universities matching "{domain}",\n{unis["name"]}\nSelecting best...')
-        uni = unis.loc[unis['website'].map(lambda x: len(x.replace(domain, ''))).sort_values().index].iloc[0]
-    uni = dict(uni[['name', 'address', 'city', 'state', 'zip', 'country', 'latitude', 'longitude']])
-    uni['country'] = US_CODE_TO_COUNTRY[uni['country']]
-    uni['domain'] = domain
-    _register_domain(domain, uni, uni['name'])
-    logging.info(f'Found info for domain "{domain}": {uni}')
-    return uni
-
-
-def _search_domain_ip(domain, affiliation, country):
-    try:
-        ip_addr = socket.gethostbyname(domain)
-        ip_info = ip_database.get_all(ip_addr)
-        ip_info.country_long = ip_info.country_long.lower()
-        if country is not None and ip_info.country_long != country and \
-                (ip_info.country_long not in EQUIV_COUNTRIES or EQUIV_COUNTRIES[ip_info.country_long] != country):
-            logging.info(
-                f'Found IP for domain "{domain}" but got inconsistent country: "{ip_info.country_long}"!="{country}"')
-            return  # can't trust in IP info..
-        if affiliation is None:
-            if ip_info.isp is not None:
-                affiliation = ip_info.isp
-            else:
-                ip_addr = ip_address(ip_addr)  # search for ISP name in database
-                matches = isp_names_df[isp_names_df['ip'].map(lambda ip: ip_addr in ip_network(ip))]
-                if len(matches) > 0:
-                    affiliation = matches.iloc[0]['name']
-        country = country if country is not None else EQUIV_COUNTRIES[ip_info.country_long] \
-            if ip_info.country_long in EQUIV_COUNTRIES else ip_info.country_long
-        uni = dict(domain=domain, name=affiliation, city=ip_info.city, state=ip_info.region, zip=ip_info.zipcode,
-                   country=country, latitude=ip_info.latitude, longitude=ip_info.longitude)
-        logging.info(f'Found info via IP search for domain "{domain}": {uni}')
-        _register_domain(domain, uni, affiliation)
-        return uni
-    except (socket.gaierror, ValueError) as err:
-        logging.info(f'Error: {err}')
-    return None  # no luck
-
-
-def _search_world_unis(domain):
-    for uni in world_unis:
-        if not any(domain in d for d in uni['domains']) and not any(domain in w for w in uni['web_pages']):
-            continue
-
-        # found uni, try searching US uni database for name as it has more info
-        uni_name = uni['name'].lower()
-        unis = us_unis_df[us_unis_df['name'].str.contains(uni_name) | us_unis_df['alias'].str.contains(uni_name)]
-        if len(unis) >= 1:
-            uni = unis.iloc[0]
-            if len(unis) > 1:
-                logging.info(f'Got {len(unis)} universities matching "{uni_name}",\n{unis}\nSelecting best...')
-                uni = unis.loc[unis['name'].map(lambda x: len(x.replace(domain, ''))).sort_values().index].iloc[0]
-
-            uni = dict(uni[['name', 'address', 'city', 'state', 'zip', 'country', 'latitude', 'longitude']])
-            uni['country'] = US_CODE_TO_COUNTRY[uni['country']]
-            uni['domain'] = domain
-            domain_unis[domain] = uni
-            logging.info(f'Found info for domain "{domain}": {uni}')
-            return uni
+def _email2institution_country(domain):
+    return email2country.email2institution_country(domain)
 
-        # otherwise return the info we have
-        loc = _get_geo_location(uni['name'], uni['state-province'], uni['country'])  # try geo-location
-        affiliation = uni['name']
-        uni = dict(domain=domain, name=affiliation, country=uni['country'], state=uni['state-province'], **loc)
-        _register_domain(domain, uni, affiliation)
-        return uni
 
-    return None  # no luck
+def _is_temporary(err):
+    return not isinstance(err, SSLError)  # certificate errors are not transient, so not worth retrying
 
 
-def _process_affiliation():
-    affiliation = author['affiliation']
+def _process_affiliation(matcher, full_affiliation):
+    affiliation = full_affiliation
     if affiliation == 'Unknown affiliation':
         return None  # no affiliation entered...
 
     # searches unis
-    for uni in all_unis:
-        if uni in affiliation.lower():
-            return uni
+    uni = matcher.best_match(affiliation.lower())
+    if uni is not None:
+        return uni
 
     # otherwise try to guess affiliation through parsing
     affiliation = re.split(' / | - |,| at ', affiliation)[-1].strip()
@@ -142,82 +77,452 @@ def _process_affiliation():
     places = GeoText(affiliation)
     if len(places.cities) > 0 and affiliation == places.cities[0] or \
             len(places.countries) > 0 and affiliation == places.countries[0]:
-        affiliation = author['affiliation']  # better off keeping full affiliation
+        affiliation = full_affiliation  # better off keeping full affiliation
 
     return affiliation
 
 
-def _register_domain(domain, uni, affiliation):
-    domain_unis[domain] = uni
-    if domain not in domain_affiliations:
-        domain_affiliations[domain] = []
-    domain_affiliations[domain].append(affiliation)
-
-
-def _get_cache(domain, affiliation):
-    if domain in domain_unis:
-        domain_affiliations[domain].append(affiliation)
-        logging.info(f'Domain {domain} fetched from cache')
-        return domain_unis[domain]
-    return None
-
-
-def _get_geo_location(affiliation, city, country):
-    location = geo_locator.geocode(', '.join(f for f in [affiliation, city, country] if f is not None))
-    if location is None:
-        return _get_geo_location(None, city, country) if affiliation is not None else \
-            _get_geo_location(None, None, country) if city is not None else {}
-    loc_country = location.address.split(', ')[-1].lower()
-    geo_country = geo_locator.geocode(country).address.split(', ')[-1].lower()
-    if loc_country != geo_country:
-        return _get_geo_location(None, city, country)  # can't trust affiliation, use only location
-    return dict(latitude=location.latitude, longitude=location.longitude, address=location.address)
-
-
-def _search_author_affiliation():
-    # parse email domain
-    full_domain = author['email_domain'].lower().replace('@', '')
-    domain = '.'.join(full_domain.split('.')[-2:])
-    if domain.endswith('.ai') or domain.endswith('.mil'):
-        country = 'united states'
-    else:
+def _vote_affiliation(matcher, affiliations):
+    # first by known uni name then by majority, ties broken by first vote
+    affiliation = matcher.best_match(*(aff.lower() for aff in affiliations if aff is not None))
+    if affiliation is None:
+        votes = Counter(aff for aff in affiliations if aff is not None)
+        affiliation = votes.most_common(1)[0][0] if len(votes) > 0 else None
+    return affiliation
+
+
+_worker_matcher = None  # known university names matcher, sent once to each worker process, see `Resolver._map`
+
+
+def _init_worker(matcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def _worker_process_affiliation(full_affiliation):
+    return _process_affiliation(_worker_matcher, full_affiliation)
+
+
+def _worker_vote_affiliation(affiliations):
+    return _vote_affiliation(_worker_matcher, affiliations)
+
+
+def _get_full_domain(author):
+    return author['email_domain'].lower().replace('@', '')
+
+
+def _get_domain(full_domain):
+    return '.'.join(full_domain.split('.')[-2:])
+
+
+class Resolver(object):
+    """
+    Resolves the citing authors' email domains into institution and location records. Holds the reference datasets,
+    the geo-locator and the domains' IP, country and affiliation lookups in memory, such that these are shared by all
+    the scholars whose locations are resolved.
+    """
+
+    def __init__(self, geo_locator, reference=None, max_workers=MAX_WORKERS, workers=1, host_resolver=None,
+                 country_rate=EMAIL2COUNTRY_RATE):
+        """
+        Creates a new resolver.
+        :param geo_locator: the geocoder, providing a `geocode(query)` method, e.g., a `CachedGeocoder`.
+        :param ReferenceData reference: the reference datasets, loaded lazily by default.
+        :param int max_workers: the maximum number of concurrent DNS, country and geo-location requests.
+        :param int workers: the number of worker processes parsing and voting affiliations.
+        :param CachedHostResolver host_resolver: the resolver of the domains' IP addresses, e.g., with a persistent
+        cache. Defaults to resolving via DNS with an in-memory cache.
+        :param float country_rate: the maximum number of email2country requests per second, `None` for no limit, e.g.,
+        for offline stand-ins.
+        """
+        self.geo_locator = geo_locator
+        self.reference = reference if reference is not None else ReferenceData()
+        self.max_workers = max_workers
+        self.workers = workers
+        self.host_resolver = host_resolver if host_resolver is not None else CachedHostResolver()
+        self.domain_ips = {}  # full domain -> IP address
+        self.ip_infos = {}  # IP address -> IP2Location record, looked up in batches
+        self.domain_countries = {}  # domain -> country
+        self.counts = Counter()  # number of domains and lookups, cumulative over all scholars
+        self._us_uni_names = {}  # world uni name -> best US uni, filled on demand
+        self._affiliations = {}  # full affiliation -> processed affiliation
+        self._affiliations_lock = threading.Lock()
+        self._ip_database_lock = threading.Lock()  # database reads are not thread-safe
+        self._get_country_name = functools.lru_cache(maxsize=None)(self._get_country_name)
+        limiter = RateLimiter(country_rate) if country_rate is not None else None
+        self._email2institution_country = retry(_email2institution_country, (RequestException,), limiter=limiter,
+                                                retry_if=_is_temporary)
+
+    def _get_domain_country(self, domain):
+        if domain.endswith('.ai') or domain.endswith('.mil'):
+            return 'united states'
         try:
-            country = email2country.email2institution_country(domain)
-            if country is not None:
-                country = country.lower()
-        except SSLError:
-            country = None
-    affiliation = _process_affiliation()
-
-    # try cache
-    uni = _get_cache(full_domain, affiliation)
-    if uni is not None:
+            with metrics.timer('network.email2country'):
+                country = self._email2institution_country(domain)
+            return None if country is None else country.lower()
+        except RequestException:
+            metrics.count('network.email2country.errors')
+            return None
+
+    def _map(self, func, items):
+        # calls a `_worker_*` function for each item, in parallel if several workers and enough items
+        if len(items) == 0:
+            return []
+        return map_processes(func, items, self.workers, initializer=_init_worker,
+                             initargs=(self.reference.all_unis_matcher,))
+
+    def process_affiliation(self, full_affiliation):
+        """
+        Processes an author's affiliation, i.e., searches for a known university name or otherwise extracts the
+        institution's name.
+        :param str full_affiliation: the affiliation, as given in the author's profile.
+        :rtype: str
+        :return: the processed affiliation, or `None` if the author did not enter an affiliation.
+        """
+        with self._affiliations_lock:
+            self.counts['affiliation_queries'] += 1
+            if full_affiliation in self._affiliations:
+                return self._affiliations[full_affiliation]
+        affiliation = _process_affiliation(self.reference.all_unis_matcher, full_affiliation)
+        with self._affiliations_lock:
+            self._affiliations[full_affiliation] = affiliation
+            self.counts['affiliation_parses'] += 1
+        return affiliation
+
+    def process_affiliations(self, affiliations):
+        """
+        Processes the given affiliations not previously processed, sharded across the worker processes, such that
+        subsequent calls to `process_affiliation` for these are memoized.
+        :param typing.Iterable[str] affiliations: the affiliations, as given in the authors' profiles.
+        """
+        with self._affiliations_lock:
+            affiliations = list(dict.fromkeys(aff for aff in affiliations if aff not in self._affiliations))
+        results = self._map(_worker_process_affiliation, affiliations)
+        with self._affiliations_lock:
+            self._affiliations.update(zip(affiliations, results))
+            self.counts['affiliation_parses'] += len(affiliations)
+
+    def vote_affiliations(self, domain_affiliations):
+        """
+        Selects the affiliation of each domain from its authors' affiliation votes, first by known university name, then
+        by majority, sharding the domains across the worker processes.
+        :param dict[str, list[str]] domain_affiliations: a dictionary from domain to the list of affiliation votes.
+        :rtype: dict[str, str]
+        :return: a dictionary from domain to the selected affiliation, or `None` if the domain has no votes.
+        """
+        return dict(zip(domain_affiliations.keys(),
+                        self._map(_worker_vote_affiliation, list(domain_affiliations.values()))))
+
+    def _get_us_uni(self, pos, domain):
+        uni = self.reference.us_unis_df.iloc[pos]
+        uni = dict(uni[['name', 'address', 'city', 'state', 'zip', 'country', 'latitude', 'longitude']])
+        uni['country'] = US_CODE_TO_COUNTRY[uni['country']]
+        uni['domain'] = domain
+        logging.info(f'Found info for domain "{domain}": {uni}')
         return uni
 
-    # try searching US database websites, first sub-domain then domain
-    uni = _search_us_unis(full_domain)
-    if uni is not None:
+    def _search_us_unis(self, domain):
+        pos, num_matches = self.reference.us_unis_index.lookup(domain)
+        if pos is None:
+            return None
+        if num_matches > 1:
+            logging.info(f'Got {num_matches} universities matching "{domain}", '
+                         f'selected best: "{self.reference.us_unis_df["website"].iat[pos]}"')
+        return self._get_us_uni(pos, domain)
+
+    def _search_domain_ip(self, domain, affiliation, country):
+        ip_addr = self.domain_ips.get(domain)
+        if ip_addr is None:
+            return None  # could not resolve domain
+        try:
+            with self._ip_database_lock:
+                ip_info = self.ip_infos.get(ip_addr)
+                if ip_info is None:
+                    ip_info = self.reference.ip_database.get_all(ip_addr)  # not looked up in batch
+            ip_country = ip_info.country_long.lower()  # records may be shared by several domains, not modified
+            if country is not None and ip_country != country and \
+                    (ip_country not in EQUIV_COUNTRIES or EQUIV_COUNTRIES[ip_country] != country):
+                logging.info(f'Found IP for domain "{domain}" but got inconsistent country: '
+                             f'"{ip_country}"!="{country}"')
+                return  # can't trust in IP info..
+            if affiliation is None:
+                if ip_info.isp is not None:
+                    affiliation = ip_info.isp
+                else:
+                    affiliation = self.reference.isp_names_index.lookup(ip_addr)  # search for ISP name in database
+            country = country if country is not None else EQUIV_COUNTRIES[ip_country] \
+                if ip_country in EQUIV_COUNTRIES else ip_country
+            uni = dict(domain=domain, name=affiliation, city=ip_info.city, state=ip_info.region, zip=ip_info.zipcode,
+                       country=country, latitude=ip_info.latitude, longitude=ip_info.longitude)
+            logging.info(f'Found info via IP search for domain "{domain}": {uni}')
+            return uni
+        except (socket.gaierror, ValueError) as err:
+            logging.info(f'Error: {err}')
+        return None  # no luck
+
+    def _search_us_uni_name(self, uni_name):
+        if uni_name in self._us_uni_names:
+            metrics.count('cache.us_uni_names.hits')
+            return self._us_uni_names[uni_name]
+        metrics.count('cache.us_uni_names.misses')
+
+        # gets the US university with the shortest name among those whose name or alias contains the given name
+        us_unis_df = self.reference.us_unis_df
+        num_unis = len(us_unis_df)
+        matches = sorted(set(pos % num_unis for pos in self.reference.us_unis_name_index.find_all(uni_name)))
+        pos = min(matches, key=lambda i: len(us_unis_df['name'].iat[i])) if len(matches) > 0 else None
+        if len(matches) > 1:
+            logging.info(f'Got {len(matches)} universities matching "{uni_name}", '
+                         f'selected best: "{us_unis_df["name"].iat[pos]}"')
+        self._us_uni_names[uni_name] = pos
+        return pos
+
+    def _search_world_unis(self, domain):
+        pos = self.reference.world_unis_index.lookup(domain)
+        if pos is not None:
+            uni = self.reference.world_unis[pos]
+
+            # found uni, try searching US uni database for name as it has more info
+            pos = self._search_us_uni_name(uni['name'].lower())
+            if pos is not None:
+                return self._get_us_uni(pos, domain)
+
+            # otherwise return the info we have
+            loc = self._get_geo_location(uni['name'], uni['state-province'], uni['country'])  # try geo-location
+            return dict(domain=domain, name=uni['name'], country=uni['country'], state=uni['state-province'], **loc)
+
+        return None  # no luck
+
+    def _get_country_name(self, country):
+        if country is None:
+            return None
+        location = self.geo_locator.geocode(country)  # normalizes country name as given by the geo-locator
+        return country.lower() if location is None else location.address.split(', ')[-1].lower()
+
+    def _get_geo_location(self, affiliation, city, country):
+        query = ', '.join(f for f in [affiliation, city, country] if f is not None)
+        if query == '':
+            return {}
+        location = self.geo_locator.geocode(query)
+        if location is None:
+            return self._get_geo_location(None, city, country) if affiliation is not None else \
+                self._get_geo_location(None, None, country) if city is not None else {}
+        loc_country = location.address.split(', ')[-1].lower()
+        if country is not None and loc_country != self._get_country_name(country):
+            # can't trust affiliation, use only location
+            return self._get_geo_location(None, city, country) if affiliation is not None else \
+                self._get_geo_location(None, None, country) if city is not None else {}
+        return dict(latitude=location.latitude, longitude=location.longitude, address=location.address)
+
+    @staticmethod
+    def _timed_search(name, search, *args):
+        # times a search in the "resolver.NAME" timer, counting the domains it resolved
+        with metrics.timer(f'resolver.{name}'):
+            uni = search(*args)
+        if uni is not None:
+            metrics.count(f'resolver.{name}.resolved')
         return uni
-    # uni = _search_us_unis(domain)
-    # if uni is not None:
-    #     return uni
 
-    # then search by domain IP address, only full-domain
-    uni = _search_domain_ip(full_domain, affiliation, country)
-    if uni is not None:
-        return uni
+    def resolve_domain(self, full_domain, affiliation):
+        """
+        Resolves the institution and location of the given email domain. The domain's IP address and country must
+        have been looked up beforehand, see `lookup_domains`.
+        :param str full_domain: the (full) email domain.
+        :param str affiliation: the processed affiliation of an author with the given domain.
+        :rtype: dict
+        :return: the institution record for the domain, whose `name` is replaced by the voted affiliation, if any.
+        """
+        domain = _get_domain(full_domain)
+        country = self.domain_countries.get(domain)  # none if the lookup failed
+
+        # try searching US database websites, first sub-domain then domain
+        uni = self._timed_search('us_unis', self._search_us_unis, full_domain)
+        if uni is not None:
+            return uni
+        # uni = self._search_us_unis(domain)
+        # if uni is not None:
+        #     return uni
 
-    # finally search world universities database, only full-domain
-    uni = _search_world_unis(full_domain)
-    if uni is not None:
-        return uni
+        # then search by domain IP address, only full-domain
+        uni = self._timed_search('ip', self._search_domain_ip, full_domain, affiliation, country)
+        if uni is not None:
+            return uni
 
-    # otherwise just return inferred affiliation and country
-    logging.info(f'Could not find info for domain "{domain}": {affiliation}')
-    loc = _get_geo_location(affiliation, None, country)  # try geo-location
-    uni = dict(domain=full_domain, name=affiliation, country=country, **loc)
-    _register_domain(full_domain, uni, affiliation)
-    return uni
+        # finally search world universities database, only full-domain
+        uni = self._timed_search('world_unis', self._search_world_unis, full_domain)
+        if uni is not None:
+            return uni
+
+        # otherwise just return inferred affiliation and country
+        logging.info(f'Could not find info for domain "{domain}": {affiliation}')
+        with metrics.timer('resolver.geocode'):
+            loc = self._get_geo_location(affiliation, None, country)  # try geo-location
+        return dict(domain=full_domain, name=affiliation, country=country, **loc)
+
+    def _lookup_ips(self, ip_addrs):
+        # gets the IP2Location records of the new IP addresses in a single pass over the database
+        ip_addrs = set(ip for ip in ip_addrs if ip is not None) - self.ip_infos.keys()
+        if len(ip_addrs) == 0:
+            return
+        try:
+            with self._ip_database_lock, metrics.timer('resolver.ip_lookup'):
+                self.ip_infos.update(self.reference.ip_location_index.lookup_all(ip_addrs))
+        except ValueError as err:
+            logging.info(f'Error: {err}')  # e.g., database not available, each address is searched when needed
+
+    def lookup_domains(self, full_domains):
+        """
+        Resolves the IP addresses and countries of the given domains concurrently, skipping previously looked up ones.
+        :param list[str] full_domains: the (full) email domains.
+        :rtype: tuple[int, int]
+        :return: a tuple (num_ips, num_countries) with the number of IP address and country lookups made.
+        """
+        domains = set(_get_domain(d) for d in full_domains)
+        self.counts.update(ip_queries=len(full_domains), country_queries=len(domains))
+        metrics.count('cache.dns.hits', len(set(full_domains) & self.domain_ips.keys()))
+        metrics.count('cache.countries.hits', len(domains & self.domain_countries.keys()))
+
+        full_domains = sorted(set(d for d in full_domains if d not in self.domain_ips))
+        logging.info(f'Resolving IP addresses of {len(full_domains)} unique domains...')
+        domain_ips = self.host_resolver.resolve_all(full_domains, self.max_workers, tqdm.tqdm)
+        self.domain_ips.update(domain_ips)
+        self._lookup_ips(domain_ips.values())
+
+        domains = sorted(domains - self.domain_countries.keys())
+        logging.info(f'Resolving countries of {len(domains)} unique domains...')
+        self.domain_countries.update(map_concurrent(self._get_domain_country, domains, self.max_workers, tqdm.tqdm))
+        self.counts.update(ip_lookups=len(full_domains), country_lookups=len(domains))
+        metrics.count('cache.dns.misses', len(full_domains))
+        metrics.count('cache.countries.misses', len(domains))
+        return len(full_domains), len(domains)
+
+    def get_locations(self, authors, output_dir, reset=False, domain_store=None):
+        """
+        Resolves the institutions and locations of the given citing authors, resuming from the domains and authors
+        stored in the output directory by previous runs, and saves them in a `LOCATIONS_FILE` file.
+        :param dict authors: the citing authors' data, indexed by author id.
+        :param str output_dir: the path to the directory in which to store data.
+        :param bool reset: whether to discard the domains and authors resolved in previous runs.
+        :param DomainStore domain_store: the store of resolved domains and authors to be used instead of the one in
+        the output directory, e.g., shared by several scholars.
+        :rtype: pd.DataFrame
+        :return: the locations table, with one row per unique (full) email domain.
+        """
+        # load domains and authors resolved in previous runs
+        own_store = domain_store is None
+        if own_store:
+            domain_store = DomainStore(os.path.join(output_dir, DOMAINS_DB_FILE))
+        if reset:
+            domain_store.clear()
+        stored_authors = domain_store.get_authors()
+        domain_unis = domain_store.get_domains()
+        logging.info(f'Loaded {len(domain_unis)} domains and {len(stored_authors)} authors resolved in previous runs')
+        num_queries, num_parses = self.counts['affiliation_queries'], self.counts['affiliation_parses']
+
+        # group authors with domain info by their (full) email domain
+        logging.info('==================================================')
+        domain_authors = {}  # full domain -> author ids
+        changed_authors = []
+        for author_id, author in authors.items():
+            if 'affiliation' not in author or 'email_domain' not in author:
+                logging.info(f'No Google Scholar data found for {author["name"]}...')
+                continue
+            full_domain = _get_full_domain(author)
+            if full_domain not in domain_authors:
+                domain_authors[full_domain] = []
+            domain_authors[full_domain].append(author_id)
+            if stored_authors.get(author_id) != (full_domain, author['affiliation']):
+                changed_authors.append((author_id, full_domain, author['affiliation']))
+        total = sum(len(author_ids) for author_ids in domain_authors.values())
+        full_domains = sorted(d for d in domain_authors.keys() if d not in domain_unis)  # only unresolved domains
+
+        # process the affiliations of new or changed authors and of the unresolved domains' authors, store authors
+        self.process_affiliations([affiliation for _, _, affiliation in changed_authors] +
+                                  [authors[domain_authors[d][0]]['affiliation'] for d in full_domains])
+        changed_authors = [(author_id, full_domain, affiliation, self.process_affiliation(affiliation))
+                           for author_id, full_domain, affiliation in changed_authors]
+        domain_store.put_authors(changed_authors)
+        logging.info(f'Got {total} authors from {len(domain_authors)} unique domains, {len(changed_authors)} new or '
+                     f'changed authors, {len(full_domains)} domains to resolve')
+
+        # resolve unique domains' IP and country concurrently
+        num_ips, num_countries = self.lookup_domains(full_domains)
+
+        # resolve each unique domain once, concurrently, using the first author's affiliation
+        # geo-location requests are rate-limited, each resolved domain is checkpointed in the store, failed domains
+        # are not stored and so are resolved again in the next run
+        logging.info('==================================================')
+        logging.info('Taking affiliation and location information from each domain...')
+
+        def _resolve_and_store(full_domain):
+            resolver = domain_authors[full_domain][0]
+            uni = self.resolve_domain(full_domain, self.process_affiliation(authors[resolver]['affiliation']))
+            domain_store.put_domain(full_domain, uni, resolver)  # checkpoint
+            return uni
+
+        domain_unis.update(map_concurrent(_resolve_and_store, full_domains, self.max_workers, tqdm.tqdm))
+
+        # fan results back to the authors for affiliation voting
+        domain_affiliations = domain_store.get_affiliations(set(authors.keys()))
+        domain_unis = {domain: domain_unis[domain] for domain in domain_authors.keys()
+                       if domain in domain_unis}  # only current, resolved domains
+        domain_affiliations = {domain: domain_affiliations[domain] for domain in domain_unis.keys()}
+        if own_store:
+            domain_store.close()
+
+        # report on saved lookups
+        num_stored = len(domain_authors) - len(full_domains)
+        self.counts.update(domains=len(domain_authors), domain_hits=num_stored)
+        num_parses = self.counts['affiliation_parses'] - num_parses
+        num_queries = self.counts['affiliation_queries'] - num_queries
+        metrics.count('cache.domains.hits', num_stored)
+        metrics.count('cache.domains.misses', len(full_domains))
+        metrics.count('cache.affiliations.hits', max(0, num_queries - num_parses))
+        metrics.count('cache.affiliations.misses', num_parses)
+        logging.info(f'Saved {total - num_ips} DNS lookups, {total - num_countries} country lookups, '
+                     f'{total - len(full_domains)} domain resolutions ({num_stored} from previous runs) and '
+                     f'{total - num_parses} affiliation parses')
+
+        logging.info('==================================================')
+        logging.info(f'Found locations for {total} authors (total {len(domain_unis)} unique institutes)')
+
+        # correct affiliations, first by known uni name then by majority
+        logging.info('Correcting domain affiliations...')
+        for domain, affiliation in self.vote_affiliations(domain_affiliations).items():
+            if affiliation is not None:
+                domain_unis[domain]['name'] = affiliation
+
+        # save dataframe
+        df = pd.DataFrame(domain_unis.values()).reindex(columns=LOCATIONS_COLUMNS)  # also if no domains
+        df['name'] = get_titles(df['name'])
+        df['country'] = get_titles(df['country'])
+        df.sort_values(by=['country', 'name', 'domain'], inplace=True)
+        file_path = os.path.join(output_dir, LOCATIONS_FILE)
+        df.to_csv(file_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        logging.info(f'Saved location data in "{file_path}"')
+
+        # save citing authors' institutions, such that the impact chart does not match their domains again
+        institutions = AuthorInstitutions.from_locations(authors, df)
+        file_path = os.path.join(output_dir, AUTHOR_INSTITUTIONS_FILE)
+        institutions.save(file_path)
+        logging.info(f'Saved institutions of {len(institutions)} authors in "{file_path}"')
+        return df
+
+
+def load_authors(output_dir):
+    """
+    Loads the citing authors' data stored in the given directory by `get_scholar`.
+    :param str output_dir: the directory with the scholar's data.
+    :rtype: dict
+    :return: the citing authors' data, indexed by author id.
+    """
+    authors_file = os.path.join(output_dir, AUTHORS_STORE_FILE)
+    legacy_authors_file = os.path.join(output_dir, AUTHORS_FILE)
+    if not os.path.isfile(authors_file) and not os.path.isfile(legacy_authors_file):
+        raise ValueError(f'Could not find authors file in "{authors_file}"')
+    authors = AuthorStore(authors_file, legacy_authors_file, read_only=True).authors
+    logging.info(f'Loaded info for {len(authors)} authors from "{authors_file}"')
+    return authors
 
 
 if __name__ == '__main__':
@@ -225,6 +530,31 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-o', '--output', type=str, default=OUTPUT_DIR,
                         help='The path to the directory to load and save data.')
+    parser.add_argument('--geo-cache', type=str, default=None,
+                        help=f'The path to the persistent geo-location cache file. '
+                             f'Defaults to "{GEO_CACHE_FILE}" in the output directory.')
+    parser.add_argument('--dns-cache', type=str, default=None,
+                        help=f'The path to the persistent DNS cache file. '
+                             f'Defaults to "{DNS_CACHE_FILE}" in the output directory.')
+    parser.add_argument('--hosts', type=str, default=None,
+                        help='The path to a hosts file, i.e., with lines "IP_ADDRESS DOMAIN...", from which to resolve '
+                             'the domains\' IP addresses instead of DNS, e.g., to run offline.')
+    parser.add_argument('-t', '--threads', type=int, default=MAX_WORKERS,
+                        help='The maximum number of concurrent DNS, country and geo-location requests.')
+    parser.add_argument('--geo-rate', type=float, default=NOMINATIM_RATE,
+                        help='The maximum number of geo-location requests per second.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The number of worker processes parsing and voting the authors\' affiliations.')
+    parser.add_argument('--reset', action='store_true',
+                        help=f'Whether to discard the domains and authors resolved in previous runs, stored in '
+                             f'"{DOMAINS_DB_FILE}" in the output directory.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='The path to the file in which to save the run\'s metrics, in the Prometheus text format '
+                             'if with a ".prom" extension, otherwise as JSON. Defaults to "locations_metrics.json" in '
+                             'the output directory.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Whether to profile the stage with cProfile, saving the statistics in "locations.prof" '
+                             'in the output directory.')
     args = parser.parse_args()
 
     logging.RootLogger.root.handlers = []
@@ -235,88 +565,29 @@ if __name__ == '__main__':
 
     # load authors file
     logging.info('==================================================')
-    authors_file = os.path.join(args.output, AUTHORS_FILE)
-    if not os.path.isfile(authors_file):
-        raise ValueError(f'Could not find authors file in "{authors_file}"')
-    with open(authors_file, 'r') as fp:
-        authors = jsonpickle.loads(fp.read())
-    logging.info(f'Loaded info for {len(authors)} authors from "{authors_file}"')
-
-    # load data files
-    logging.info('==================================================')
-
-    ip_database = IP2Location.IP2Location(IP_LOCATION_DB, 'SHARED_MEMORY')  # ip 2 location database
-    logging.info(f'Loaded IP2Location database from "{IP_LOCATION_DB}"')
-
-    isp_names_df = pd.read_csv(ISP_NAMES_DB, names=['id1', 'id2', 'ip', 'id3', 'name'])  # ip 2 location isp names db
-    logging.info(f'Loaded IP2Location names database from "{ISP_NAMES_DB}"')
-
-    with open(WORLD_UNI_DOMAINS, 'r', encoding='utf-8') as fp:
-        world_unis = jsonpickle.loads(fp.read())
-    logging.info(f'Loaded info for {len(world_unis)} universities from "{WORLD_UNI_DOMAINS}"')
-
-    us_unis_df = pd.read_csv(US_UNI_DATA)
-    logging.info(f'Loaded info for {len(us_unis_df)} US universities from "{US_UNI_DATA}"')
-
-    # transform data
-    us_unis_df.columns = us_unis_df.columns.str.lower()
-    us_unis_df['name'] = us_unis_df['name'].str.lower()
-    us_unis_df['alias'] = us_unis_df['alias'].str.lower()
-    us_unis_df['website'] = us_unis_df['website'].map(lambda x: re.sub('https?://|www.|/', '', x)).str.lower()
-
-    # gets set of all known universities
-    all_unis = set(us_unis_df['name'].unique())
-    all_unis.update(uni['name'].lower() for uni in world_unis)
+    authors = load_authors(args.output)
 
     # set geo-location
-    geo_locator = Nominatim(user_agent="uni-finder")
-
-    logging.info('==================================================')
-    logging.info('Taking affiliation and location information from each author...')
-    domain_unis = {}
-    domain_affiliations = {}
-    found = total = 0
-    for author in tqdm.tqdm(authors.values()):
-        name = author['name']
-        logging.info(f'Processing {name}...')
-        if 'affiliation' not in author or 'email_domain' not in author:
-            logging.info(f'No Google Scholar data found for {name}...')
-            continue
-
-        uni_data = _search_author_affiliation()
-        if uni_data is None:
-            logging.info(f'Could not find info for author "{author}"!')
-        else:
-            found += 1
-        total += 1
-
-    logging.info('==================================================')
-    logging.info(f'Found {found}/{total} author affiliation locations (total {len(domain_unis)} unique institutes)')
-
-    # correct affiliations, first by known uni name then by majority
-    logging.info('Correcting domain affiliations...')
-    for domain, affiliations in tqdm.tqdm(domain_affiliations.items()):
-        affiliation = None
-        for uni in all_unis:
-            if any(uni in aff.lower() for aff in affiliations if aff is not None):
-                affiliation = uni
-                break
-        if affiliation is None:
-            affiliation = pd.value_counts(affiliations)
-            affiliation = affiliation[affiliation == affiliation.max()]
-            if len(affiliation) == 0:
-                continue
-            affiliation = affiliation.index[0]
-        domain_unis[domain]['name'] = affiliation
-
-    # save dataframe
-    df = pd.DataFrame(domain_unis.values())
-    df['name'] = df['name'].map(get_title)
-    df['country'] = df['country'].map(get_title)
-    df.sort_values(by=['country', 'name', 'domain'], inplace=True)
-    df = df[['country', 'name', 'domain', 'latitude', 'longitude', 'address', 'city', 'state', 'zip']]
-    file_path = os.path.join(args.output, LOCATIONS_FILE)
-    df.to_csv(file_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
-    logging.info(f'Saved location data in "{file_path}"')
+    geo_cache_file = args.geo_cache if args.geo_cache is not None else os.path.join(args.output, GEO_CACHE_FILE)
+    geo_locator = CachedGeocoder(ThrottledGeocoder(Nominatim(user_agent="uni-finder"), args.geo_rate),
+                                 geo_cache_file)
+    logging.info(f'Using geo-location cache in "{geo_cache_file}"')
+
+    # set DNS, optionally offline
+    dns_cache_file = args.dns_cache if args.dns_cache is not None else os.path.join(args.output, DNS_CACHE_FILE)
+    host_resolver = CachedHostResolver(
+        StaticHostResolver.from_hosts_file(args.hosts) if args.hosts is not None else None, dns_cache_file)
+    logging.info(f'Using DNS cache in "{dns_cache_file}"')
+
+    # reference data files are each loaded (from their compiled form) only when first needed
+    resolver = Resolver(geo_locator, max_workers=args.threads, workers=args.workers, host_resolver=host_resolver)
+    with stage('locations', os.path.join(args.output, 'locations.prof') if args.profile else None):
+        resolver.get_locations(authors, args.output, args.reset)
+
+    geo_locator.close()
+    logging.info(f'Geo-location cache: {geo_locator.hits} hits, {geo_locator.misses} geocoder calls')
+    host_resolver.close()
+    logging.info(f'DNS cache: {host_resolver.hits} hits, {host_resolver.misses} DNS lookups')
+    metrics.save(args.metrics if args.metrics is not None else os.path.join(args.output, 'locations_metrics.json'))
 
     logging.info('Done!')
@@ -0,0 +1,211 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from .get_impact_chart import get_author_institutions
+from .get_locations import LOCATIONS_FILE
+from .loading import OUTPUT_DIR
+from .metrics import metrics, stage
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+TILES_DIR = 'map_tiles'
+COUNTRIES_FILE = 'countries.geojson'
+MIN_ZOOM = 0
+MAX_ZOOM = 12
+MAX_LATITUDE = 85.0511287798  # limit of the Web Mercator projection
+COORD_DECIMALS = 5  # about 1m
+UNKNOWN_COUNTRY = 'Unknown'  # of institutions without a country, such that per-country counts add up to the totals
+
+TILE_COLUMNS = ['zoom', 'x', 'y', 'latitude', 'longitude', 'institutions', 'authors', 'countries', 'name']
+
+
+def get_tile_coords(latitudes, longitudes, zoom):
+    """
+    Gets the (x, y) coordinates of the Web Mercator ("slippy map") tiles containing the given points at the given zoom
+    level, i.e., the same scheme used by web map and vector tile servers.
+    :param np.ndarray latitudes: the points' latitudes, in degrees.
+    :param np.ndarray longitudes: the points' longitudes, in degrees.
+    :param int zoom: the zoom level, where the world is split into 2^zoom x 2^zoom tiles.
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    n = 2 ** zoom
+    lat = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(longitudes) + 180.) / 360. * n)
+    y = np.floor((1. - np.log(np.tan(lat) + 1. / np.cos(lat)) / np.pi) / 2. * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def get_tiles_table(locations_df, weights, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Bins the institutions of the given locations table into map tiles at each zoom level.
+    :param pd.DataFrame locations_df: the locations table, as produced by `get_locations`.
+    :param np.ndarray weights: the number of citing authors of each institution (row) in the locations table.
+    :param int min_zoom: the lowest zoom level.
+    :param int max_zoom: the highest zoom level.
+    :rtype: pd.DataFrame
+    :return: a table with one row per non-empty tile of each zoom level, with the tile's coordinates, the centroid of
+    its institutions (weighted by citing authors), the number of institutions and citing authors, the number of
+    institutions from each country, and the institution's name for single-institution tiles.
+    """
+    lats = pd.to_numeric(locations_df['latitude'], errors='coerce').values
+    lons = pd.to_numeric(locations_df['longitude'], errors='coerce').values
+    valid = ~(np.isnan(lats) | np.isnan(lons))
+    lats, lons = lats[valid], lons[valid]
+    names = locations_df['name'].values[valid]
+    countries = locations_df['country'].fillna(UNKNOWN_COUNTRY).values[valid]
+    weights = np.asarray(weights, dtype=np.int64)[valid]
+    point_weights = np.maximum(weights, 1)  # institutions without authors still place the centroid
+
+    # tiles at the highest zoom, lower zooms' tiles are obtained by shifting
+    max_x, max_y = get_tile_coords(lats, lons, max_zoom)
+    tables = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        shift = max_zoom - zoom
+        df = pd.DataFrame({'x': max_x >> shift, 'y': max_y >> shift, 'lat': lats * point_weights,
+                           'lon': lons * point_weights, 'w': point_weights, 'institutions': 1, 'authors': weights,
+                           'country': countries, 'name': names})
+        tiles = df.groupby(['x', 'y'], sort=True).agg(lat=('lat', 'sum'), lon=('lon', 'sum'), w=('w', 'sum'),
+                                                      institutions=('institutions', 'sum'),
+                                                      authors=('authors', 'sum'), name=('name', 'first'))
+        tiles_countries = {}
+        for (x, y, country), count in df.groupby(['x', 'y', 'country'], sort=True).size().items():
+            tiles_countries.setdefault((x, y), {})[country] = int(count)
+        tiles['countries'] = [tiles_countries.get(tile, {}) for tile in tiles.index]
+        tiles['latitude'] = tiles['lat'] / tiles['w']
+        tiles['longitude'] = tiles['lon'] / tiles['w']
+        tiles.loc[tiles['institutions'] > 1, 'name'] = None
+        tables.append(tiles.reset_index().assign(zoom=zoom))
+    return pd.concat(tables, ignore_index=True).reindex(columns=TILE_COLUMNS) if len(tables) > 0 else \
+        pd.DataFrame(columns=TILE_COLUMNS)
+
+
+def get_countries_table(locations_df, weights):
+    """
+    Counts the institutions and citing authors of each country in the given locations table.
+    :param pd.DataFrame locations_df: the locations table, as produced by `get_locations`.
+    :param np.ndarray weights: the number of citing authors of each institution (row) in the locations table.
+    :rtype: pd.DataFrame
+    :return: a table with one row per country (`UNKNOWN_COUNTRY` for institutions without a country), with the
+    centroid of its geo-located institutions (weighted by citing authors) and its number of institutions and citing
+    authors, sorted by decreasing number of authors.
+    """
+    lats = pd.to_numeric(locations_df['latitude'], errors='coerce').values
+    lons = pd.to_numeric(locations_df['longitude'], errors='coerce').values
+    weights = np.asarray(weights, dtype=np.int64)
+    point_weights = np.where(np.isnan(lats) | np.isnan(lons), 0, np.maximum(weights, 1))
+    df = pd.DataFrame({'country': locations_df['country'].fillna(UNKNOWN_COUNTRY).values,
+                       'lat': np.nan_to_num(lats) * point_weights, 'lon': np.nan_to_num(lons) * point_weights,
+                       'w': point_weights, 'institutions': 1, 'authors': weights})
+    countries = df.groupby('country', sort=True).agg(lat=('lat', 'sum'), lon=('lon', 'sum'), w=('w', 'sum'),
+                                                     institutions=('institutions', 'sum'),
+                                                     authors=('authors', 'sum'))
+    located = countries['w'] > 0
+    countries['latitude'] = (countries['lat'] / countries['w']).where(located)
+    countries['longitude'] = (countries['lon'] / countries['w']).where(located)
+    countries = countries.sort_values('authors', ascending=False, kind='stable').reset_index()
+    return countries[['country', 'latitude', 'longitude', 'institutions', 'authors']]
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _get_features(df, columns):
+    # one GeoJSON point feature per row, properties in the given columns
+    lons = df['longitude'].astype(float).round(COORD_DECIMALS).tolist()
+    lats = df['latitude'].astype(float).round(COORD_DECIMALS).tolist()
+    values = [df[col].tolist() for col in columns]  # as Python objects
+    for i, (lon, lat, *row) in enumerate(zip(lons, lats, *values)):
+        properties = {col: value for col, value in zip(columns, row) if not _is_missing(value)}
+        geometry = None if np.isnan(lat) else dict(type='Point', coordinates=[lon, lat])
+        yield dict(type='Feature', id=i, geometry=geometry, properties=properties)
+
+
+def write_geojson(file_path, features):
+    """
+    Writes the given features as a compact (no whitespace) GeoJSON feature collection.
+    :param str file_path: the path to the file in which to save the features.
+    :param typing.Iterable[dict] features: the GeoJSON features.
+    """
+    data = json.dumps(dict(type='FeatureCollection', features=list(features)), ensure_ascii=False,
+                      separators=(',', ':'))  # encoded at once by the C encoder, `json.dump` streams in Python
+    with open(file_path, 'w', encoding='utf-8') as fp:
+        fp.write(data)
+
+
+def get_map_tiles(output_dir, authors=None, domains_df=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Aggregates the citing institutions into map tiles at several zoom levels, such that large citation maps can be
+    loaded and rendered one zoom level at a time, and saves each zoom level's tiles as GeoJSON points in the
+    `TILES_DIR/zZOOM.geojson` files, together with the per-country totals in `TILES_DIR/COUNTRIES_FILE`. Data not given
+    is loaded from the files saved in the output directory by the previous stages.
+    :param str output_dir: the path to the directory to load and save data.
+    :param dict authors: the citing authors' data, indexed by author id.
+    :param pd.DataFrame domains_df: the locations table, as produced by `get_locations`.
+    :param int min_zoom: the lowest zoom level.
+    :param int max_zoom: the highest zoom level.
+    :rtype: pd.DataFrame
+    :return: the table with the non-empty tiles of all zoom levels.
+    """
+    saved = domains_df is None and authors is None  # whether to use the saved mapping from author to institution
+    if domains_df is None:
+        file_path = os.path.join(output_dir, LOCATIONS_FILE)
+        if not os.path.isfile(file_path):
+            raise ValueError(f'File with domain info does not exist: {file_path}')
+        domains_df = pd.read_csv(file_path)
+        logging.info(f'Loaded location data from "{file_path}"')
+
+    # count citing authors of each institution
+    institutions = get_author_institutions(output_dir) if saved else \
+        get_author_institutions(output_dir, authors, domains_df)
+    weights = institutions.count_authors()
+    logging.info(f'Got {len(institutions)} citing authors from {len(domains_df)} institutions')
+
+    tiles_dir = os.path.join(output_dir, TILES_DIR)
+    os.makedirs(tiles_dir, exist_ok=True)
+    tiles_df = get_tiles_table(domains_df, weights, min_zoom, max_zoom)
+    for zoom, df in tiles_df.groupby('zoom', sort=True):
+        file_path = os.path.join(tiles_dir, f'z{zoom}.geojson')
+        write_geojson(file_path, _get_features(df, ['zoom', 'x', 'y', 'institutions', 'authors', 'countries',
+                                                    'name']))
+        logging.info(f'Saved {len(df)} tiles of zoom level {zoom} in "{file_path}"')
+
+    countries_df = get_countries_table(domains_df, weights)
+    file_path = os.path.join(tiles_dir, COUNTRIES_FILE)
+    write_geojson(file_path, _get_features(countries_df, ['country', 'institutions', 'authors']))
+    logging.info(f'Saved {len(countries_df)} countries in "{file_path}"')
+    return tiles_df
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', type=str, default=OUTPUT_DIR,
+                        help='The path to the directory to load and save data.')
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM, help='The lowest zoom level.')
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM, help='The highest zoom level.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='The path to the file in which to save the run\'s metrics, in the Prometheus text format '
+                             'if with a ".prom" extension, otherwise as JSON. Defaults to "tiles_metrics.json" in the '
+                             'output directory.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Whether to profile the stage with cProfile, saving the statistics in "tiles.prof" in '
+                             'the output directory.')
+    args = parser.parse_args()
+
+    # output
+    os.makedirs(args.output, exist_ok=True)
+    logging.RootLogger.root.handlers = []
+    handlers = [logging.FileHandler(os.path.join(args.output, 'tiles.log'), 'w', encoding='utf-8'),
+                logging.StreamHandler()]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S',
+                        handlers=handlers)
+
+    with stage('tiles', os.path.join(args.output, 'tiles.prof') if args.profile else None):
+        get_map_tiles(args.output, min_zoom=args.min_zoom, max_zoom=args.max_zoom)
+    metrics.save(args.metrics if args.metrics is not None else os.path.join(args.output, 'tiles_metrics.json'))
+    logging.info('Done!')
@@ -3,18 +3,199 @@ import os
 import logging
 import jsonpickle
 import tqdm
+from collections import Counter, namedtuple
 from scholarly import scholarly
-from util import clean_filename
+from .fetching import ScholarFetcher, CITATIONS
+from .loading import load_cached, iter_json_array, get_citations_file, AUTHOR_FILE, AUTHORS_FILE, OUTPUT_DIR
+from .metrics import metrics, stage
+from .stores import AuthorStore, AuthorDatabase, AUTHORS_STORE_FILE, AUTHORS_DB_FILE
+from .throttling import MAX_WORKERS
 
 __author__ = 'Pedro Sequeira'
 __email__ = 'pedrodbs@gmail.com'
 
-AUTHOR_FILE = 'author.json'
-AUTHORS_FILE = 'authors.json'
-
 MIN_WAIT = 5
 MAX_WAIT = 20
-OUTPUT_DIR = 'output'
+
+
+ScholarData = namedtuple('ScholarData', ['author', 'authors', 'num_citations', 'num_fetched'])
+
+
+def _process_citations(citations, scholar_id, authors, fetcher, citing):
+    # for each citation, get authors' list
+    num_cites = num_fetched = num_processed = 0
+    for citation in citations:
+        num_processed += 1
+        authors_ids = citation['author_id']
+        author_names = citation['bib']['author']
+
+        # check own citation, skip
+        if scholar_id in authors_ids:
+            logging.debug('Skipping own citation')
+            metrics.count('citations.own')
+            continue
+        num_cites += 1
+
+        # for each author, get info
+        for i, author_id in enumerate(authors_ids):
+            if i >= len(author_names):
+                continue
+            name = author_names[i]
+            if citing is not None:
+                citing.add(author_id if author_id != '' else name)
+            if author_id in authors or (author_id == '' and name in authors):
+                logging.debug(f'Author "{name}" previously fetched')
+                metrics.count('cache.authors.hits')
+                continue
+
+            # check no Google scholar for author, just store name
+            if author_id == '':
+                authors.put(name, {'name': name})
+                logging.debug(f'Author "{name}" does not have a Google Scholar profile')
+                metrics.count('authors.no_profile')
+            elif fetcher.submit_author(author_id):
+                logging.debug(f'Getting info for citing author "{name}"...')
+                metrics.count('cache.authors.misses')
+                num_fetched += 1
+    logging.info(f'Processed {num_processed} citations')
+    return dict(citations=num_cites, fetched=num_fetched)
+
+
+def _load_author(scholar_id, output_dir, backend):
+    author_file = os.path.join(output_dir, AUTHOR_FILE)
+    if os.path.isfile(author_file):
+        author = load_cached(author_file)
+        logging.info(f'Loaded info for author id: "{scholar_id}" from {author_file}')
+        return author
+
+    logging.info(f'Getting info for author id: "{scholar_id}"...')
+    search_query = backend.search_author_id(scholar_id)
+    author = backend.fill(search_query)
+    with open(author_file, 'w') as fp:
+        fp.write(jsonpickle.dumps(author, indent=4))
+    logging.info(f'Saved author info to {author_file}')
+    return author
+
+
+def get_scholars(scholars, authors, fetcher, streaming=False):
+    """
+    Fetches the given scholars' publications, their citations and the citing authors' profiles, skipping the data
+    stored in the scholars' output directories and in the citing authors' store. Requests for all scholars are
+    scheduled together through the given fetcher, and citing authors shared among scholars are only fetched once.
+    :param dict[str, str] scholars: a dictionary from Google Scholar profile/user ID to the path of the directory in
+    which to save the scholar's data.
+    :param AuthorStore authors: the citing authors' store, possibly shared by several scholars, or an
+    `AuthorDatabase` in streaming mode.
+    :param ScholarFetcher fetcher: the fetcher through which to schedule the requests.
+    :param bool streaming: whether to parse the stored citations files incrementally and not collect the citing
+    authors of each scholar, such that memory does not grow with the number of citations and citing authors. The
+    citing authors' data of each scholar is then the given store.
+    :rtype: dict[str, ScholarData]
+    :return: a dictionary from scholar id to the scholar's data, the data of the scholar's citing authors, indexed by
+    author id, the number of citations and the number of citing authors' profiles fetched for the scholar.
+    """
+    # for each publication, get citations, either from file or by scheduling their fetching
+    scholar_authors = {}  # scholar id -> scholar's data
+    citing = {}  # scholar id -> ids (or names, if without profile) of the citing authors
+    counts = {}  # scholar id -> number of citations and of fetched citing authors
+    pub_scholars = {}  # pub id -> scholar id
+    for scholar_id, output_dir in scholars.items():
+        os.makedirs(output_dir, exist_ok=True)
+        scholar_authors[scholar_id] = _load_author(scholar_id, output_dir, fetcher.backend)
+        citing[scholar_id] = set() if not streaming else None
+        counts[scholar_id] = Counter()
+        pubs = scholar_authors[scholar_id]['publications']
+        logging.info(f'Got {len(pubs)} publications')
+        for pub in pubs:
+            pub_title = pub['bib']['title']
+            citations_file = get_citations_file(output_dir, pub)
+            if os.path.isfile(citations_file):
+                citations = load_cached(citations_file) if not streaming else iter_json_array(citations_file)
+                logging.info(f'Loading citations for "{pub_title}" from {citations_file}')
+                counts[scholar_id].update(_process_citations(citations, scholar_id, authors, fetcher,
+                                                             citing[scholar_id]))
+            elif 'citedby_url' not in pub:
+                logging.info(f'"{pub_title}" does not have citations, skipping')
+            else:
+                logging.info(f'Getting citations for "{pub_title}"...')
+                pub_scholars[pub['author_pub_id']] = scholar_id
+                fetcher.submit_citations(pub)
+
+    # process fetched citations and authors as they arrive
+    with tqdm.tqdm() as progress:
+        for kind, item, result in fetcher.results():
+            progress.update()
+            if kind == CITATIONS:
+                scholar_id = pub_scholars[item['author_pub_id']]
+                citations_file = get_citations_file(scholars[scholar_id], item)
+                with open(citations_file, 'w') as fp:
+                    fp.write(jsonpickle.dumps(result, indent=4))
+                logging.info(f'Saved citations info to {citations_file}')
+                counts[scholar_id].update(_process_citations(result, scholar_id, authors, fetcher,
+                                                             citing[scholar_id]))
+            else:
+                authors.put(item, result)  # appends to authors file
+                logging.info(f'Got info for citing author "{item}"')
+    if fetcher.num_errors > 0:
+        logging.info(f'Could not fetch {fetcher.num_errors} items, re-run to retry')
+
+    results = {}
+    for scholar_id, author in scholar_authors.items():
+        if streaming:
+            authors_data = authors
+            logging.info(f'Got {len(author["publications"])} articles and {counts[scholar_id]["citations"]} '
+                         f'citations for scholar "{scholar_id}"')
+        else:
+            authors_data = {author_id: data for author_id, data in authors.authors.items()
+                            if author_id in citing[scholar_id]}
+            logging.info(f'Got {len(author["publications"])} articles, {counts[scholar_id]["citations"]} citations '
+                         f'and {len(authors_data)} unique citing authors for scholar "{scholar_id}"')
+        results[scholar_id] = ScholarData(author, authors_data, counts[scholar_id]['citations'],
+                                          counts[scholar_id]['fetched'])
+    return results
+
+
+def get_scholar(scholar_id, output_dir, backend=scholarly, max_workers=MAX_WORKERS, min_wait=MIN_WAIT,
+                max_wait=MAX_WAIT, streaming=False):
+    """
+    Fetches the given scholar's publications, their citations and the citing authors' profiles, skipping the data
+    stored in the output directory by previous runs.
+    :param str scholar_id: the Google Scholar profile/user ID.
+    :param str output_dir: the path to the directory in which to save data.
+    :param backend: the scholar backend, e.g., the `scholarly` module or a local stand-in.
+    :param int max_workers: the maximum number of concurrent requests.
+    :param float min_wait: the minimum time between consecutive requests, in seconds.
+    :param float max_wait: the maximum time between consecutive requests, in seconds.
+    :param bool streaming: whether to run in bounded memory, i.e., with the citing authors kept in an on-disk
+    `AuthorDatabase` instead of in memory, and the citations files parsed incrementally.
+    :rtype: ScholarData
+    :return: the scholar's data, the data of the scholar's citing authors, indexed by author id, the number of
+    citations and the number of citing authors' profiles fetched. In streaming mode, the citing authors' data is the
+    `AuthorDatabase` with all stored authors, to be closed by the caller.
+    """
+    # get citing authors data
+    os.makedirs(output_dir, exist_ok=True)
+    authors_file = os.path.join(output_dir, AUTHORS_STORE_FILE)
+    legacy_file = os.path.join(output_dir, AUTHORS_FILE)
+    if streaming:
+        if not os.path.isfile(authors_file) and os.path.isfile(legacy_file):
+            AuthorStore(authors_file, legacy_file).close()  # one-time import
+        authors = AuthorDatabase(authors_file, os.path.join(output_dir, AUTHORS_DB_FILE))
+    else:
+        authors = AuthorStore(authors_file, legacy_file)
+    logging.info(f'Loaded info for {len(authors)} citing authors from {authors_file}')
+
+    fetcher = ScholarFetcher(backend, max_workers, min_wait, max_wait)
+    try:
+        data = get_scholars({scholar_id: output_dir}, authors, fetcher, streaming)[scholar_id]
+    finally:
+        fetcher.close()
+
+    authors.compact()
+    logging.info(f'Updated authors info file: {authors_file}')
+    logging.info(f'Saved results to {output_dir}...')
+    return data
+
 
 if __name__ == '__main__':
 
@@ -24,6 +205,22 @@ if __name__ == '__main__':
                              'https://scholar.google.com/citations?user=')
     parser.add_argument('-o', '--output', type=str, default=OUTPUT_DIR,
                         help='The path to the directory in which to save data.')
+    parser.add_argument('-t', '--threads', type=int, default=MAX_WORKERS,
+                        help='The maximum number of concurrent requests to Google Scholar.')
+    parser.add_argument('--min-wait', type=float, default=MIN_WAIT,
+                        help='The minimum time between consecutive requests to Google Scholar, in seconds.')
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT,
+                        help='The maximum time between consecutive requests to Google Scholar, in seconds.')
+    parser.add_argument('--streaming', action='store_true',
+                        help=f'Whether to run in bounded memory, keeping the citing authors in an on-disk store, '
+                             f'"{AUTHORS_DB_FILE}" in the output directory, and parsing citations incrementally.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='The path to the file in which to save the run\'s metrics, in the Prometheus text format '
+                             'if with a ".prom" extension, otherwise as JSON. Defaults to "scholar_metrics.json" in '
+                             'the output directory.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Whether to profile the stage with cProfile, saving the statistics in "scholar.prof" in '
+                             'the output directory.')
     args = parser.parse_args()
 
     # output
@@ -34,88 +231,10 @@ if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S',
                         handlers=handlers)
 
-    # get author data
-    author_file = os.path.join(args.output, AUTHOR_FILE)
-    if os.path.isfile(author_file):
-        with open(author_file, 'r') as fp:
-            author = jsonpickle.loads(fp.read())
-        logging.info(f'Loaded info for author id: "{args.id}" from {author_file}')
-    else:
-        logging.info(f'Getting info for author id: "{args.id}"...')
-        search_query = scholarly.search_args.id(args.id)
-        author = scholarly.fill(search_query)
-        with open(author_file, 'w') as fp:
-            fp.write(jsonpickle.dumps(author, indent=4))
-        logging.info(f'Saved author info to {author_file}')
-
-    # get citing authors data
-    authors = {}
-    authors_file = os.path.join(args.output, AUTHORS_FILE)
-    if os.path.isfile(authors_file):
-        with open(authors_file, 'r') as fp:
-            authors = jsonpickle.loads(fp.read())
-        logging.info(f'Loaded info for {len(authors)} citing authors from {authors_file}')
-
-    # for each publication, get citations
-    pubs = author['publications']
-    logging.info(f'Got {len(pubs)} publications')
-    total_cites = 0
-    for pub in tqdm.tqdm(pubs):
-        pub_id = pub['author_pub_id']
-        pub_title = pub['bib']['title']
-
-        # get citation data for this pub
-        citations_file = os.path.join(args.output, clean_filename(pub_id) + '.json')
-        if os.path.isfile(citations_file):
-            with open(citations_file, 'r') as fp:
-                citations = jsonpickle.loads(fp.read())
-            logging.info(f'Loaded citations for "{pub_title}" from {citations_file}')
-        else:
-            logging.info(f'Getting citations for "{pub_title}"...')
-            if 'citedby_url' not in pub:
-                logging.info(f'"{pub_title}" does not have citations, skipping')
-                continue
-            citations = list(scholarly.citedby(pub))
-            with open(citations_file, 'w') as fp:
-                fp.write(jsonpickle.dumps(citations, indent=4))
-            logging.info(f'Saved citations info to {citations_file}')
-        total_cites += len(citations)
-
-        # for each citation, get authors' list
-        logging.info(f'Processing {len(citations)} citations...')
-        for citation in citations:
-            authors_ids = citation['args.id']
-            author_names = citation['bib']['author']
-
-            # check own citation, skip
-            if args.id in authors_ids:
-                total_cites -= 1
-                logging.info('Skipping own citation')
-                continue
-
-            # for each author, get info
-            for i, args.id in enumerate(authors_ids):
-                if i >= len(author_names):
-                    continue
-                name = author_names[i]
-                if args.id in authors:
-                    logging.info(f'Author "{name}" previously fetched')
-                else:
-                    # check no Google scholar for author, just store name
-                    if args.id == '':
-                        authors[name] = {'name': name}
-                        logging.info(f'Author "{name}" does not have a Google Scholar profile')
-                    else:
-                        logging.info(f'Getting info for citing author "{name}"...')
-                        search_query = scholarly.search_args.id(args.id)
-                        authors[args.id] = search_query
-
-                    # update authors file
-                    with open(authors_file, 'w') as fp:
-                        fp.write(jsonpickle.dumps(authors, indent=4))
-                    logging.info(f'Updated authors info file: {authors_file}')
-
-    logging.info('Done processing scholar')
-    logging.info(f'Got {len(pubs)} articles, {total_cites} citations and {len(authors)} unique citing authors')
-    logging.info(f'Saved results to {args.output}...')
+    with stage('scholar', os.path.join(args.output, 'scholar.prof') if args.profile else None):
+        data = get_scholar(args.id, args.output, scholarly, args.threads, args.min_wait, args.max_wait,
+                           args.streaming)
+        if args.streaming:
+            data.authors.close()
+    metrics.save(args.metrics if args.metrics is not None else os.path.join(args.output, 'scholar_metrics.json'))
     logging.info('Done!')
@@ -0,0 +1,156 @@
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from .metrics import metrics
+from .throttling import map_concurrent, retry, MAX_WORKERS
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+DNS_CACHE_FILE = 'dns_cache.db'
+
+CACHE_TTL = 7 * 24 * 60 * 60  # 7 days
+NEGATIVE_CACHE_TTL = 24 * 60 * 60  # 1 day
+
+MAX_QUERY_PARAMS = 900  # below SQLite's limit of host parameters per statement
+
+
+def _gethostbyname(domain):
+    return socket.gethostbyname(domain)  # looked up on each call such that it can be replaced by a local stand-in
+
+
+def _is_temporary(err):
+    return isinstance(err, socket.gaierror) and err.errno == socket.EAI_AGAIN
+
+
+class CachedHostResolver(object):
+    """
+    Resolves domain names into IPv4 addresses, backed by a persistent SQLite cache keyed on the domain. Both resolved
+    and unknown domains are cached, each with its own time-to-live, while temporary failures are not cached. Any
+    callable resolving a domain into an IPv4 address and raising `socket.gaierror` or `ValueError` on failure, e.g.,
+    `socket.gethostbyname` (the default), or a local stand-in, can be used as the backend resolver. Can be shared among
+    threads.
+    """
+
+    def __init__(self, resolver=None, cache_file=None, ttl=CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL):
+        """
+        Creates a new resolver.
+        :param callable resolver: the backend resolver, `socket.gethostbyname` by default.
+        :param str cache_file: the path to the cache file, or `None` to hold the cache in memory.
+        :param float ttl: the time-to-live of resolved domains, in seconds.
+        :param float negative_ttl: the time-to-live of unknown domains, in seconds.
+        """
+        self.resolver = resolver
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = self.misses = 0
+        self._resolve = retry(metrics.timed('network.dns', resolver if resolver is not None else _gethostbyname),
+                              (socket.gaierror, ValueError),
+                              retry_if=_is_temporary)  # retry temporary DNS failures
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file if cache_file is not None else ':memory:', check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS hosts (domain TEXT PRIMARY KEY, ip TEXT, '
+                           'timestamp REAL NOT NULL)')
+        self._conn.commit()
+
+    def _get_host_ip(self, domain):
+        # gets the domain's IP address, or None if unknown, and whether the result can be cached
+        try:
+            return self._resolve(domain), True
+        except (socket.gaierror, ValueError) as err:  # ValueError (UnicodeError) for malformed domains, e.g., "a..edu"
+            logging.info(f'Error: {err}')
+            return None, not _is_temporary(err)
+
+    def resolve(self, domain):
+        """
+        Resolves the given domain, first by searching the cache, then by calling the backend resolver.
+        :param str domain: the domain name.
+        :rtype: str
+        :return: the domain's IPv4 address, or `None` if the domain could not be resolved.
+        """
+        return self.resolve_all([domain], max_workers=1)[domain]
+
+    def resolve_all(self, domains, max_workers=MAX_WORKERS, progress=None):
+        """
+        Resolves the given domains, first by searching the cache for all domains at once, then by calling the backend
+        resolver concurrently for the domains not found, whose results are cached in a single transaction.
+        :param typing.Iterable[str] domains: the domain names.
+        :param int max_workers: the maximum number of concurrent calls to the backend resolver.
+        :param callable progress: an optional callable wrapping the backend results iterator, e.g., `tqdm.tqdm`.
+        :rtype: dict[str, str]
+        :return: a dictionary from domain to its IPv4 address, or `None` if the domain could not be resolved.
+        """
+        domains = sorted(set(domains))
+        ips = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(domains), MAX_QUERY_PARAMS):
+                chunk = domains[i:i + MAX_QUERY_PARAMS]
+                rows = self._conn.execute(f'SELECT domain, ip, timestamp FROM hosts WHERE domain IN '
+                                          f'({",".join("?" * len(chunk))})', chunk)
+                for domain, ip, timestamp in rows:
+                    if now - timestamp <= (self.ttl if ip is not None else self.negative_ttl):
+                        ips[domain] = ip
+            missing = [domain for domain in domains if domain not in ips]
+            self.hits += len(ips)
+            self.misses += len(missing)
+        metrics.count('cache.dns_db.hits', len(ips))
+        metrics.count('cache.dns_db.misses', len(missing))
+        if len(missing) == 0:
+            return ips
+
+        results = map_concurrent(self._get_host_ip, missing, max_workers, progress)  # not locked
+        now = time.time()
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?)',
+                                   [(domain, ip, now) for domain, (ip, cache) in results.items() if cache])
+            self._conn.commit()
+        ips.update((domain, results[domain][0] if domain in results else None) for domain in missing)  # or failed
+        return ips
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StaticHostResolver(object):
+    """
+    Offline stand-in resolver resolving domains from a fixed mapping, e.g., to be used as the backend of a
+    `CachedHostResolver` in tests, benchmarks or runs without network access. Unknown domains raise `socket.gaierror`.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = {domain.lower(): ip for domain, ip in hosts.items()}
+        self.calls = 0
+
+    def __call__(self, domain):
+        self.calls += 1
+        ip = self.hosts.get(domain.lower())
+        if ip is None:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return ip
+
+    @classmethod
+    def from_hosts_file(cls, file_path):
+        """
+        Creates a resolver from a hosts file, i.e., with lines of the form "IP_ADDRESS DOMAIN [ALIASES...]", where only
+        IPv4 addresses are kept and "#" starts a comment.
+        :param str file_path: the path to the hosts file.
+        :rtype: StaticHostResolver
+        """
+        hosts = {}
+        with open(file_path, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                fields = line.split('#')[0].split()
+                if len(fields) < 2:
+                    continue
+                try:
+                    socket.inet_aton(fields[0])
+                except OSError:
+                    continue  # not IPv4
+                for domain in fields[1:]:
+                    hosts.setdefault(domain.lower(), fields[0])
+        logging.info(f'Loaded {len(hosts)} hosts from "{file_path}"')
+        return cls(hosts)
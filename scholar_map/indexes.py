@@ -0,0 +1,360 @@
+import bisect
+import collections
+import copy
+import ipaddress
+import logging
+import mmap
+import os
+import socket
+import struct
+import numpy as np
+import pandas as pd
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+def _label_suffixes(domain):
+    labels = domain.split('.')
+    return ['.'.join(labels[i:]) for i in range(len(labels))]
+
+
+class DomainSuffixIndex(object):
+    """
+    Index over a list of (normalized) domains that maps each label suffix, e.g., "cs.mit.edu", "mit.edu" and "edu" for
+    "cs.mit.edu", to the position of the shortest domain ending with it, i.e., the best match for that suffix.
+    """
+
+    def __init__(self, domains):
+        self._domains = list(domains)
+        self._index = {}
+        for pos, domain in enumerate(self._domains):
+            for suffix in _label_suffixes(domain):
+                if suffix not in self._index:
+                    self._index[suffix] = [pos, 1]
+                    continue
+                entry = self._index[suffix]
+                entry[1] += 1
+                if len(domain) < len(self._domains[entry[0]]):
+                    entry[0] = pos  # ties keep first position
+
+    def __len__(self):
+        return len(self._domains)
+
+    def lookup(self, domain):
+        """
+        Gets the best domain matching the given domain suffix.
+        :param str domain: the domain suffix to search for.
+        :rtype: tuple[int, int]
+        :return: a tuple (pos, num_matches) with the position of the best match in the indexed list (`None` if no
+        match was found) and the number of indexed domains ending with the given suffix.
+        """
+        entry = self._index.get(domain)
+        return (None, 0) if entry is None else tuple(entry)
+
+
+class DomainMatchIndex(object):
+    """
+    Index over items (e.g., universities) each having a list of domains, that maps a queried domain to the first item
+    (in insertion order) having a domain that either ends with the queried domain or is a parent domain of it.
+    """
+
+    def __init__(self, items_domains):
+        self._suffixes = {}  # label suffix of some item domain -> first item
+        self._exact = {}  # item domain -> first item
+        for pos, domains in enumerate(items_domains):
+            for domain in domains:
+                self._exact.setdefault(domain, pos)
+                for suffix in _label_suffixes(domain):
+                    self._suffixes.setdefault(suffix, pos)
+
+    def lookup(self, domain):
+        """
+        Gets the item matching the given domain, first by checking the items' domains ending with it, then by searching
+        for the closest parent domain (excluding top-level domains) of the given domain.
+        :param str domain: the domain to search for.
+        :rtype: int
+        :return: the position of the matched item, or `None` if no item matches the given domain.
+        """
+        pos = self._suffixes.get(domain)
+        if pos is not None:
+            return pos
+        labels = domain.split('.')
+        for i in range(1, len(labels) - 1):
+            pos = self._exact.get('.'.join(labels[i:]))
+            if pos is not None:
+                return pos
+        return None
+
+
+class SubstringIndex(object):
+    """
+    Index over a list of texts allowing to search for all texts containing some query string in a single pass over a
+    joined buffer, instead of checking each text individually.
+    """
+
+    def __init__(self, texts):
+        self._starts = []
+        pos = 0
+        for text in texts:
+            self._starts.append(pos)
+            pos += len(text) + 1
+        self._buffer = '\0'.join(texts)
+
+    def find_all(self, query):
+        """
+        Gets the positions of the texts containing the given query string.
+        :param str query: the string to search for.
+        :rtype: list[int]
+        :return: a sorted list with the positions of the texts containing the query.
+        """
+        matches = []
+        i = self._buffer.find(query)
+        while i != -1:
+            pos = bisect.bisect_right(self._starts, i) - 1
+            matches.append(pos)
+            i = self._buffer.find(query, self._starts[pos + 1] if pos + 1 < len(self._starts) else len(self._buffer))
+        return matches
+
+
+_IP_RANGE_ARRAYS = ['starts', 'ends', 'name_codes', 'name_data', 'name_offsets']
+
+
+class IPRangeIndex(object):
+    """
+    Index over sorted, non-overlapping IPv4 address ranges, each associated with a name (e.g., the ISP / AS name),
+    queried via binary search.
+    """
+
+    def __init__(self, starts, ends, name_codes, name_data, name_offsets):
+        self._starts = np.asarray(starts, dtype=np.uint32)
+        self._ends = np.asarray(ends, dtype=np.uint32)
+        self._name_codes = np.asarray(name_codes, dtype=np.int32)
+        self._name_data = np.asarray(name_data, dtype=np.uint8)  # names' UTF-8 encodings, concatenated
+        self._name_offsets = np.asarray(name_offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def lookup(self, ip_addr):
+        """
+        Gets the name associated with the range containing the given IP address.
+        :param str ip_addr: the IPv4 address to search for.
+        :rtype: str
+        :return: the name of the range containing the address, or `None` if no range contains it.
+        """
+        ip_addr = int(ipaddress.IPv4Address(ip_addr))
+        i = int(np.searchsorted(self._starts, ip_addr, side='right')) - 1
+        if i < 0 or ip_addr > self._ends[i]:
+            return None
+        code = self._name_codes[i]
+        return self._name_data[self._name_offsets[code]:self._name_offsets[code + 1]].tobytes().decode('utf-8')
+
+    @classmethod
+    def from_csv(cls, file_path):
+        """
+        Creates an index from an IP2Location LITE ASN CSV file, i.e., with rows of the form
+        "ip_from,ip_to,cidr,asn,as_name".
+        :param str file_path: the path to the CSV file.
+        :rtype: IPRangeIndex
+        """
+        df = pd.read_csv(file_path, names=['ip_from', 'ip_to', 'cidr', 'asn', 'name'], keep_default_na=False)
+        df = df.sort_values('ip_from', kind='stable')
+        name_codes, names = pd.factorize(df['name'])
+        name_data = [name.encode('utf-8') for name in names]
+        name_offsets = np.cumsum([0] + [len(name) for name in name_data], dtype=np.int64)
+        return cls(df['ip_from'].values, df['ip_to'].values, name_codes,
+                   np.frombuffer(b''.join(name_data), dtype=np.uint8), name_offsets)
+
+    def save(self, dir_path):
+        """
+        Saves this index in a compact binary format, i.e., a directory with one NumPy `.npy` file per array.
+        :param str dir_path: the path to the directory in which to save the index.
+        """
+        os.makedirs(dir_path, exist_ok=True)
+        for name in _IP_RANGE_ARRAYS:
+            np.save(os.path.join(dir_path, name + '.npy'), getattr(self, '_' + name))
+
+    @classmethod
+    def load(cls, dir_path):
+        """
+        Loads an index previously saved in the binary format, memory-mapping its arrays.
+        :param str dir_path: the path to the directory from which to load the index.
+        :rtype: IPRangeIndex
+        """
+        return cls(*[np.load(os.path.join(dir_path, name + '.npy'), mmap_mode='r') for name in _IP_RANGE_ARRAYS])
+
+    @classmethod
+    def compile(cls, csv_file, compiled_dir):
+        """
+        Loads the index from the given compiled directory if it is up to date with the CSV file, otherwise creates the
+        index from the CSV file and saves its compiled form.
+        :param str csv_file: the path to the IP2Location LITE ASN CSV file.
+        :param str compiled_dir: the path to the compiled (binary) index directory.
+        :rtype: IPRangeIndex
+        """
+        stamp_file = os.path.join(compiled_dir, _IP_RANGE_ARRAYS[-1] + '.npy')  # last saved
+        if os.path.isfile(stamp_file) and os.path.getmtime(stamp_file) >= os.path.getmtime(csv_file):
+            return cls.load(compiled_dir)
+        index = cls.from_csv(csv_file)
+        index.save(compiled_dir)
+        return cls.load(compiled_dir)
+
+
+# internals of `IP2Location.IP2Location` (as of IP2Location 8.11) read by `IPLocationIndex`
+_IP2LOCATION_ATTRS = ('_ipv4dbcount', '_dbcolumn', '_ipv4dbaddr', '_f', '_read_record')
+
+
+class IPLocationIndex(object):
+    """
+    Batched IPv4 lookups over an IP2Location BIN database. The start addresses of the database's (sorted) IPv4 ranges
+    are read once into an array, such that a batch of addresses is resolved in a single vectorized pass over the
+    sorted addresses, instead of one binary search over the file per address, and the record of each range is only
+    read once per batch. The ranges are read from the library's internals, if these are not found, e.g., in an
+    untested version of `IP2Location`, each address is looked up with the database's `get_all`. Reads are not
+    thread-safe.
+    """
+
+    def __init__(self, database):
+        """
+        Creates a new index.
+        :param IP2Location.IP2Location database: the opened database, preferably in `SHARED_MEMORY` mode such that the
+        ranges are memory-mapped instead of copied.
+        """
+        self.database = database
+        self._starts = None
+        if not all(hasattr(database, attr) for attr in _IP2LOCATION_ATTRS):
+            logging.info('Unsupported IP2Location version, looking up one IP address at a time')
+            return
+        count, width, offset = database._ipv4dbcount, database._dbcolumn, database._ipv4dbaddr - 1  # 1-based
+        if isinstance(database._f, mmap.mmap):
+            rows = np.frombuffer(database._f, dtype='<u4', count=count * width, offset=offset)
+        else:
+            database._f.seek(offset)
+            rows = np.frombuffer(database._f.read(count * width * 4), dtype='<u4')
+        self._starts = rows.reshape(count, width)[:, 0].copy()  # first column of each row, not pinning the file
+
+    def __len__(self):
+        return len(self._starts) if self._starts is not None else 0
+
+    def lookup_all(self, ip_addrs):
+        """
+        Gets the database records of the given IP addresses, as given by the database's `get_all`.
+        :param typing.Iterable[str] ip_addrs: the IP addresses to search for.
+        :rtype: dict[str, IP2Location.database.IP2LocationRecord]
+        :return: a dictionary from IP address to its record, or `None` if no range contains the address.
+        """
+        if self._starts is None:
+            return {ip_addr: self.database.get_all(ip_addr) for ip_addr in set(ip_addrs)}
+        records = {}
+        ips = {}
+        for ip_addr in set(ip_addrs):
+            try:
+                ips[ip_addr] = struct.unpack('!L', socket.inet_pton(socket.AF_INET, ip_addr))[0]
+            except OSError:
+                records[ip_addr] = self.database.get_all(ip_addr)  # not a (dotted) IPv4 address
+        ip_addrs = sorted(ips.keys(), key=ips.get)
+        values = np.fromiter((min(ips[ip_addr], 2 ** 32 - 2) for ip_addr in ip_addrs), dtype=np.int64,
+                             count=len(ip_addrs))
+        positions = np.searchsorted(self._starts, values, side='right') - 1
+        range_records = {}
+        for ip_addr, pos in zip(ip_addrs, positions.tolist()):
+            if pos < 0:
+                records[ip_addr] = None
+                continue
+            if pos in range_records:
+                record = copy.copy(range_records[pos])  # range shared with previous addresses
+            else:
+                self.database.original_ip = ''
+                record = range_records[pos] = self.database._read_record(pos, 4)
+            record.ip = ip_addr
+            records[ip_addr] = record
+        return records
+
+
+class MultiPatternMatcher(object):
+    """
+    Aho-Corasick automaton finding all occurrences of a set of patterns (e.g., university names) in a single pass over
+    a text. When several patterns occur in a text, the best match is the longest one, with ties broken alphabetically.
+    """
+
+    def __init__(self, patterns):
+        self._goto = {}  # (state, char) -> state
+        self._pattern = [None]  # pattern ending at each state
+        children = [[]]
+        for pattern in sorted(set(p for p in patterns if p)):
+            state = 0
+            for c in pattern:
+                nxt = self._goto.get((state, c))
+                if nxt is None:
+                    nxt = len(self._pattern)
+                    self._goto[(state, c)] = nxt
+                    self._pattern.append(None)
+                    children.append([])
+                    children[state].append((c, nxt))
+                state = nxt
+            self._pattern[state] = pattern
+
+        # breadth-first computation of failure, longest output and dictionary-suffix links
+        self._fail = [0] * len(self._pattern)
+        self._longest = list(self._pattern)  # longest pattern ending at each state
+        self._dict_link = [0] * len(self._pattern)  # closest proper suffix state ending a pattern
+        queue = collections.deque(child for _, child in children[0])
+        while len(queue) > 0:
+            state = queue.popleft()
+            for c, child in children[state]:
+                fail = self._fail[state]
+                while fail and (fail, c) not in self._goto:
+                    fail = self._fail[fail]
+                fail = self._goto.get((fail, c), 0) if state else 0
+                self._fail[child] = fail
+                self._dict_link[child] = fail if self._pattern[fail] is not None else self._dict_link[fail]
+                if self._longest[child] is None:
+                    self._longest[child] = self._longest[fail]
+                queue.append(child)
+
+    def __len__(self):
+        return sum(p is not None for p in self._pattern)
+
+    def _iter_states(self, text):
+        goto = self._goto
+        fail = self._fail
+        state = 0
+        for i, c in enumerate(text):
+            while state and (state, c) not in goto:
+                state = fail[state]
+            state = goto.get((state, c), 0)
+            yield i, state
+
+    def find_all(self, text):
+        """
+        Finds all occurrences of the patterns in the given text.
+        :param str text: the text to search.
+        :rtype: list[tuple[int, str]]
+        :return: a list of tuples (start, pattern) with the start position of each pattern found in the text.
+        """
+        matches = []
+        for i, state in self._iter_states(text):
+            if self._pattern[state] is None:
+                state = self._dict_link[state]
+            while state:
+                pattern = self._pattern[state]
+                matches.append((i - len(pattern) + 1, pattern))
+                state = self._dict_link[state]
+        return matches
+
+    def best_match(self, *texts):
+        """
+        Gets the best pattern occurring in the given texts, i.e., the longest, with ties broken alphabetically.
+        :param str texts: the texts to search.
+        :rtype: str
+        :return: the best pattern found in the texts, or `None` if no pattern occurs in them.
+        """
+        best = None
+        for text in texts:
+            for _, state in self._iter_states(text):
+                pattern = self._longest[state]
+                if pattern is not None and (best is None or len(pattern) > len(best) or
+                                            len(pattern) == len(best) and pattern < best):
+                    best = pattern
+        return best
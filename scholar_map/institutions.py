@@ -0,0 +1,148 @@
+import copy
+import json
+import numpy as np
+import pandas as pd
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+AUTHOR_INSTITUTIONS_FILE = 'author_institutions.json'
+
+
+def get_domain_index(domains_df):
+    """
+    Gets an index from domain to the position of its (first) row in the given locations table.
+    :param pd.DataFrame domains_df: the locations table, as produced by `get_locations`.
+    :rtype: dict[str, int]
+    """
+    return {domain: i for i, domain in reversed(list(enumerate(domains_df['domain'])))}
+
+
+def get_domains_pos(email_domains, domain_index):
+    """
+    Resolves the location of the given authors' email domains, first by searching for the email sub-domain, then for
+    its domain.
+    :param pd.Series email_domains: the authors' email domains, e.g., "@cs.mit.edu", indexed by author id.
+    :param dict[str, int] domain_index: the index from domain to row position in the locations table.
+    :rtype: pd.Series
+    :return: a series indexed by author id with the position of the author's row in the locations table, for the
+    authors whose location was found.
+    """
+    sub_domains = email_domains.astype(object).str.lower().str.replace('@', '', regex=False)
+    domain_pos = sub_domains.map(domain_index)
+    missing = domain_pos.isna()
+    domains = sub_domains[missing].str.split('.').str[-2:].str.join('.')
+    domain_pos[missing] = domains.map(domain_index)
+    return domain_pos.dropna().astype(int)
+
+
+def _with_missing(values):
+    # code -1 (missing) indexes the last element
+    return np.array(list(values) + [np.nan], dtype=object)
+
+
+class AuthorInstitutions(object):
+    """
+    Integer-coded mapping from citing author to institution, i.e., to the position of the institution's row in the
+    locations table, together with the dictionaries of the institutions' names and countries, such that citations can
+    be grouped by institution and country by joining integers, without matching the authors' email domains.
+    """
+
+    def __init__(self, author_ids, institutions, name_codes, country_codes, names, countries, domains):
+        """
+        Creates a new mapping.
+        :param list[str] author_ids: the ids of the authors with a known institution.
+        :param np.ndarray institutions: the institution of each author, i.e., its row position in the locations table.
+        :param np.ndarray name_codes: the position of each institution's name in `names`, -1 if missing.
+        :param np.ndarray country_codes: the position of each institution's country in `countries`, -1 if missing.
+        :param list[str] names: the unique institution names.
+        :param list[str] countries: the unique countries.
+        :param list[str] domains: the domain of each institution.
+        """
+        self.author_ids = pd.Index(author_ids, dtype=object)
+        self.institutions = np.asarray(institutions, dtype=np.int64)
+        self.name_codes = np.asarray(name_codes, dtype=np.int64)
+        self.country_codes = np.asarray(country_codes, dtype=np.int64)
+        self.names = _with_missing(names)
+        self.countries = _with_missing(countries)
+        self.domains = _with_missing(domains)
+        self._lookup = np.append(self.institutions, -1)  # position -1 (unknown author) to institution -1
+
+    def __len__(self):
+        return len(self.author_ids)
+
+    @property
+    def num_institutions(self):
+        return len(self.name_codes)
+
+    @classmethod
+    def from_locations(cls, authors, domains_df):
+        """
+        Maps the given authors to the institutions in the given locations table by their email (sub-)domain.
+        :param authors: the citing authors' data, indexed by author id, e.g., a dict or an `AuthorDatabase`.
+        :param pd.DataFrame domains_df: the locations table, as produced by `get_locations`.
+        :rtype: AuthorInstitutions
+        """
+        name_codes, names = pd.factorize(domains_df['name'])
+        country_codes, countries = pd.factorize(domains_df['country'])
+        institutions = cls([], [], name_codes, country_codes, names, countries, domains_df['domain'])
+        return institutions.with_authors(authors, get_domain_index(domains_df))
+
+    def with_authors(self, authors, domain_index):
+        """
+        Maps the given authors to the same institutions (and dictionaries) as this mapping, e.g., only the citing
+        authors of one publication.
+        :param authors: the citing authors' data, indexed by author id, e.g., a dict.
+        :param dict[str, int] domain_index: the index from domain to row position in the locations table.
+        :rtype: AuthorInstitutions
+        """
+        email_domains = pd.Series({author_id: author['email_domain'] for author_id, author in authors.items()
+                                   if 'email_domain' in author}, dtype=object)
+        domain_pos = get_domains_pos(email_domains, domain_index)
+        institutions = copy.copy(self)  # shares the institutions' codes and dictionaries
+        institutions.author_ids = pd.Index(domain_pos.index, dtype=object)
+        institutions.institutions = domain_pos.values.astype(np.int64)
+        institutions._lookup = np.append(institutions.institutions, -1)
+        return institutions
+
+    def get_institutions(self, author_ids):
+        """
+        Gets the institutions of the given authors.
+        :param author_ids: the authors' ids.
+        :rtype: np.ndarray
+        :return: the position of each author's institution in the locations table, -1 if unknown.
+        """
+        return self._lookup[self.author_ids.get_indexer(author_ids)]
+
+    def count_authors(self):
+        """
+        Counts the authors of each institution.
+        :rtype: np.ndarray
+        :return: the number of authors of each institution (row) in the locations table.
+        """
+        return np.bincount(self.institutions, minlength=self.num_institutions)
+
+    def save(self, file_path):
+        """
+        Saves the mapping and dictionaries as a compact JSON file.
+        :param str file_path: the path to the file.
+        """
+        data = dict(authors=dict(author_id=self.author_ids.tolist(), institution=self.institutions.tolist()),
+                    institutions=dict(name=self.name_codes.tolist(), country=self.country_codes.tolist(),
+                                      domain=self.domains[:-1].tolist()),
+                    names=self.names[:-1].tolist(), countries=self.countries[:-1].tolist())
+        data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with open(file_path, 'w', encoding='utf-8') as fp:
+            fp.write(data)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Loads a mapping saved with `save`.
+        :param str file_path: the path to the file.
+        :rtype: AuthorInstitutions
+        """
+        with open(file_path, 'r', encoding='utf-8') as fp:
+            data = json.loads(fp.read())
+        return cls(data['authors']['author_id'], data['authors']['institution'], data['institutions']['name'],
+                   data['institutions']['country'], data['names'], data['countries'], data['institutions']['domain'])
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import pickle
+import jsonpickle
+from .metrics import metrics
+from .util import clean_filename
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+AUTHOR_FILE = 'author.json'
+AUTHORS_FILE = 'authors.json'
+OUTPUT_DIR = 'output'
+
+CACHE_DIR = '.cache'
+PICKLE_PROTOCOL = 5
+
+JSON_CHUNK_SIZE = 1 << 16  # chars read at a time when parsing incrementally
+
+
+def get_file_stamp(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_json(file_path):
+    with open(file_path, 'r', encoding='utf-8') as fp:
+        return jsonpickle.loads(fp.read())
+
+
+def load_cached(file_path, parse=_read_json):
+    """
+    Loads the given file through a compact binary (pickle) cache, stored in a `CACHE_DIR` directory next to the file.
+    The cache is only used if it was created from the file's current version, i.e., with the same modification time
+    and size, otherwise the file is parsed and the cache is (re)created.
+    :param str file_path: the path to the file to be loaded.
+    :param callable parse: the function parsing the file's contents given its path. Defaults to jsonpickle decoding.
+    :return: the object loaded from the file.
+    """
+    stamp = get_file_stamp(file_path)
+    cache_dir = os.path.join(os.path.dirname(file_path), CACHE_DIR)
+    cache_file = os.path.join(cache_dir, os.path.basename(file_path) + '.pkl')
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'rb') as fp:
+                cache_stamp, obj = pickle.load(fp)
+            if cache_stamp == stamp:
+                metrics.count('cache.pickle.hits')
+                return obj
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError) as err:
+            logging.info(f'Could not load cache file "{cache_file}": {err}')
+
+    metrics.count('cache.pickle.misses')
+    obj = parse(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as fp:
+        pickle.dump((stamp, obj), fp, protocol=PICKLE_PROTOCOL)
+    os.replace(tmp_file, cache_file)  # atomic, concurrent readers see either version
+    return obj
+
+
+def iter_json_array(file_path, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Incrementally parses a (jsonpickle) JSON file holding an array, e.g., a publication's citations, yielding its items
+    one at a time, such that only the item being parsed, and not the whole array, is held in memory. Items referencing
+    previous items (jsonpickle's "py/id" tags) can only be restored from the whole array, in which case the remaining
+    items are taken from the fully-decoded file.
+    :param str file_path: the path to the JSON file.
+    :param int chunk_size: the number of characters read from the file at a time.
+    :rtype: typing.Iterator
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as fp:
+        buffer = ''
+        pos = 0
+        eof = False
+        in_array = False
+        num_items = 0
+        while True:
+            # skip whitespace and separators, reading more of the file when needed
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+                pos += 1
+            if pos == len(buffer) or not in_array:
+                if pos == len(buffer):
+                    if eof:
+                        raise ValueError(f'Unexpected end of JSON array in "{file_path}"')
+                    buffer, pos = fp.read(chunk_size), 0
+                    eof = len(buffer) < chunk_size
+                    continue
+                if buffer[pos] != '[':
+                    raise ValueError(f'File does not hold a JSON array: "{file_path}"')
+                in_array = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+
+            # decode next item, reading more if it is incomplete (or might be, e.g., a number at the end)
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                complete = eof or (end < len(buffer) and (buffer[end].isspace() or buffer[end] in ',]'))
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                more = fp.read(max(chunk_size, len(buffer) - pos))  # grows with the item, linear time overall
+                eof = len(more) == 0
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            if '"py/id"' in buffer[pos:end]:
+                logging.info(f'Items in "{file_path}" reference each other, loading whole file')
+                yield from _read_json(file_path)[num_items:]
+                return
+            yield jsonpickle.Unpickler().restore(item)
+            num_items += 1
+            pos = end
+
+
+def get_citations_file(output_dir, pub):
+    """
+    Gets the path to the file with the citations of the given publication.
+    :param str output_dir: the directory with the scholar's data.
+    :param dict pub: the publication.
+    :rtype: str
+    """
+    return os.path.join(output_dir, clean_filename(pub['author_pub_id']) + '.json')
+
+
+def iter_citations(output_dir, pubs):
+    """
+    Lazily loads the citations of each of the given publications, one publication at a time.
+    :param str output_dir: the directory with the scholar's data.
+    :param list[dict] pubs: the publications.
+    :rtype: typing.Iterator[tuple[dict, list[dict]]]
+    :return: an iterator over tuples (pub, citations) for the publications whose citations file exists.
+    """
+    for pub in pubs:
+        citations_file = get_citations_file(output_dir, pub)
+        if not os.path.isfile(citations_file):
+            logging.info(f'File with citations info for "{pub["bib"]["title"]}" does not exist: {citations_file} '
+                         f'(no citations?)')
+            continue
+        yield pub, load_cached(citations_file)
@@ -0,0 +1,179 @@
+import bisect
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import re
+import threading
+import time
+from collections import Counter
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)  # seconds
+METRICS_PREFIX = 'scholar_map'
+PROFILE_TOP = 25  # number of functions logged from a profile
+
+
+class Metrics(object):
+    """
+    Thread-safe registry of counters, e.g., cache hits and misses, and timers, e.g., of stages, resolvers and network
+    calls, each keeping the number and total duration of the timed calls and a histogram of their durations. Metric
+    names are dot-separated, e.g., "cache.geocode.hits", and can be exported as JSON or in the Prometheus text format.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = Counter()
+        self.timers = {}  # name -> [count, total seconds, bucket counts]
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def count(self, name, value=1):
+        """
+        Increments the given counter.
+        :param str name: the counter's name.
+        :param int value: the increment.
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name, seconds):
+        """
+        Records the duration of a call in the given timer.
+        :param str name: the timer's name.
+        :param float seconds: the duration of the call.
+        """
+        with self._lock:
+            if name not in self.timers:
+                self.timers[name] = [0, 0., [0] * (len(self.buckets) + 1)]
+            timer = self.timers[name]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Context manager recording the duration of its block in the given timer.
+        :param str name: the timer's name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name, func):
+        """
+        Wraps the given function such that the duration of each call is recorded in the given timer, and calls
+        raising an exception are counted in the "NAME.errors" counter.
+        :param str name: the timer's name.
+        :param callable func: the function to be wrapped.
+        :rtype: callable
+        """
+
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                self.count(name + '.errors')
+                raise
+            finally:
+                self.observe(name, time.perf_counter() - start)
+
+        return _wrapper
+
+    def to_dict(self):
+        """
+        Gets the metrics as a JSON-serializable dictionary.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(counters=dict(sorted(self.counters.items())),
+                        timers={name: dict(count=count, total=total, mean=total / count if count > 0 else 0.,
+                                           buckets={str(le): n for le, n in
+                                                    zip(self.buckets + ('+Inf',), _cumulative(buckets))})
+                                for name, (count, total, buckets) in sorted(self.timers.items())})
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """
+        Gets the metrics in the Prometheus text exposition format, i.e., counters as "PREFIX_NAME_total" and timers as
+        "PREFIX_NAME_seconds" histograms.
+        :param str prefix: the prefix of all metric names.
+        :rtype: str
+        """
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                name = _get_prometheus_name(prefix, name) + '_total'
+                lines.extend([f'# TYPE {name} counter', f'{name} {value}'])
+            for name, (count, total, buckets) in sorted(self.timers.items()):
+                name = _get_prometheus_name(prefix, name) + '_seconds'
+                lines.append(f'# TYPE {name} histogram')
+                for le, n in zip(self.buckets + ('+Inf',), _cumulative(buckets)):
+                    lines.append(f'{name}_bucket{{le="{le}"}} {n}')
+                lines.extend([f'{name}_sum {total}', f'{name}_count {count}'])
+        return '\n'.join(lines) + '\n'
+
+    def save(self, file_path):
+        """
+        Saves the metrics in the given file, in the Prometheus text format if the file has a ".prom" extension,
+        otherwise as JSON.
+        :param str file_path: the path to the file.
+        """
+        with open(file_path, 'w', encoding='utf-8') as fp:
+            if file_path.endswith('.prom'):
+                fp.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), fp, indent=4)
+        logging.info(f'Saved metrics in "{file_path}"')
+
+
+def _cumulative(buckets):
+    total = 0
+    for n in buckets:
+        total += n
+        yield total
+
+
+def _get_prometheus_name(prefix, name):
+    return re.sub('[^a-zA-Z0-9_]', '_', f'{prefix}_{name}')
+
+
+metrics = Metrics()  # the process-wide metrics registry
+
+
+@contextlib.contextmanager
+def stage(name, profile_file=None):
+    """
+    Context manager timing a pipeline stage in the "stage.NAME" timer and, optionally, profiling it with `cProfile`.
+    :param str name: the stage's name.
+    :param str profile_file: the path to the file in which to save the profile's statistics (to be loaded with
+    `pstats`), or `None` to not profile the stage. Only the calling thread is profiled, i.e., not the requests made
+    by worker threads, which are timed in the metrics instead. The functions with the highest cumulative time are also
+    logged.
+    """
+    profiler = cProfile.Profile() if profile_file is not None else None
+    with metrics.timer(f'stage.{name}'):
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile_file)
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_TOP)
+                logging.info(f'Saved profile of stage "{name}" in "{profile_file}":\n{stream.getvalue()}')
@@ -0,0 +1,306 @@
+import argparse
+import logging
+import os
+import pandas as pd
+from geopy import Nominatim
+from scholarly import scholarly
+from .fetching import ScholarFetcher
+from .geocoding import CachedGeocoder, ThrottledGeocoder, GEO_CACHE_FILE, NOMINATIM_RATE
+from .get_impact_chart import get_impact_chart, IMPACT_CHART_FILE, IMPACT_TABLE_FILE, TABLE_FORMATS
+from .get_locations import Resolver, LOCATIONS_FILE
+from .get_map_tiles import get_map_tiles, TILES_DIR
+from .get_scholar import get_scholar, get_scholars, MIN_WAIT, MAX_WAIT
+from .hosts import CachedHostResolver, StaticHostResolver, DNS_CACHE_FILE
+from .loading import OUTPUT_DIR
+from .metrics import metrics, stage
+from .stores import AuthorStore, DomainStore, AUTHORS_STORE_FILE, DOMAINS_DB_FILE
+from .throttling import MAX_WORKERS
+from .util import clean_filename
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+BATCH_REPORT_FILE = 'batch_report.csv'
+STAGES = ['scholar', 'locations', 'impact', 'tiles']
+
+
+def _get_rate(hits, total):
+    return hits / total if total > 0 else float('nan')
+
+
+class Pipeline(object):
+    """
+    Runs the three stages, i.e., `get_scholar`, `get_locations` and `get_impact_chart`, and optionally the map tiles'
+    aggregation, `get_map_tiles`, in a single process. The reference datasets, the geo-locator and the domains' lookups
+    are held in memory by the pipeline's `Resolver`, such that these are shared by all the scholars it processes, and
+    each stage's results are passed to the next stage in memory instead of being reloaded from disk.
+    """
+
+    def __init__(self, backend=scholarly, geo_locator=None, geo_cache_file=GEO_CACHE_FILE, reference=None,
+                 max_workers=MAX_WORKERS, min_wait=MIN_WAIT, max_wait=MAX_WAIT, geo_rate=NOMINATIM_RATE, workers=1,
+                 profile=(), host_resolver=None, dns_cache_file=DNS_CACHE_FILE):
+        """
+        Creates a new pipeline.
+        :param backend: the scholar backend, e.g., the `scholarly` module or a local stand-in.
+        :param geo_locator: the geocoder, providing a `geocode(query)` method. Defaults to a cached, rate-limited
+        Nominatim geocoder.
+        :param str geo_cache_file: the path to the persistent geo-location cache file, if no geocoder is given.
+        :param ReferenceData reference: the reference datasets, loaded lazily by default.
+        :param int max_workers: the maximum number of concurrent requests to each service.
+        :param float min_wait: the minimum time between consecutive requests to Google Scholar, in seconds.
+        :param float max_wait: the maximum time between consecutive requests to Google Scholar, in seconds.
+        :param float geo_rate: the maximum number of geo-location requests per second, if no geocoder is given.
+        :param int workers: the number of worker processes parsing and voting affiliations.
+        :param typing.Collection[str] profile: the names of the stages, from `STAGES`, to be profiled with `cProfile`,
+        saving each stage's statistics in a "STAGE.prof" file in the output directory. All stages are timed in the
+        process-wide `metrics` regardless.
+        :param CachedHostResolver host_resolver: the resolver of the domains' IP addresses. Defaults to resolving via
+        DNS with a persistent cache.
+        :param str dns_cache_file: the path to the persistent DNS cache file, if no host resolver is given.
+        """
+        self.backend = backend
+        self.max_workers = max_workers
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self._own_geo_locator = geo_locator is None
+        if geo_locator is None:
+            geo_locator = CachedGeocoder(ThrottledGeocoder(Nominatim(user_agent="uni-finder"), geo_rate),
+                                         geo_cache_file)
+        self.geo_locator = geo_locator
+        self._own_host_resolver = host_resolver is None
+        if host_resolver is None:
+            host_resolver = CachedHostResolver(cache_file=dns_cache_file)
+        self.host_resolver = host_resolver
+        self.resolver = Resolver(geo_locator, reference, max_workers, workers, host_resolver)
+        self.profile = set(profile)
+
+    def _stage(self, name, output_dir):
+        return stage(name, os.path.join(output_dir, f'{name}.prof') if name in self.profile else None)
+
+    def run(self, scholar_id, output_dir, reset=False, table_format=None, tiles=False):
+        """
+        Runs all stages for the given scholar.
+        :param str scholar_id: the Google Scholar profile/user ID.
+        :param str output_dir: the path to the directory in which to save the scholar's data.
+        :param bool reset: whether to discard the domains and authors resolved in previous runs.
+        :param str table_format: the format in which to also save the impact data as a long-form table, one of
+        `TABLE_FORMATS`, or `None`.
+        :param bool tiles: whether to also aggregate the citing institutions into map tiles.
+        :rtype: pd.DataFrame
+        :return: the table with the unique institutes citing each of the scholar's publications.
+        """
+        logging.info('==================================================')
+        logging.info(f'Processing scholar "{scholar_id}"...')
+        with self._stage('scholar', output_dir):
+            scholar = get_scholar(scholar_id, output_dir, self.backend, self.max_workers, self.min_wait,
+                                  self.max_wait)
+        logging.info('==================================================')
+        with self._stage('locations', output_dir):
+            domains_df = self.resolver.get_locations(scholar.authors, output_dir, reset)
+        logging.info('==================================================')
+        with self._stage('impact', output_dir):
+            impact_df = get_impact_chart(scholar_id, output_dir, scholar.author, scholar.authors, domains_df,
+                                         table_format)
+        if tiles:
+            logging.info('==================================================')
+            with self._stage('tiles', output_dir):
+                get_map_tiles(output_dir, scholar.authors, domains_df)
+        return impact_df
+
+    def run_batch(self, scholar_ids, output_dir, reset=False, table_format=None, tiles=False):
+        """
+        Runs all stages for the given scholars, e.g., all the members of a department. Each scholar's data is saved
+        in its own sub-directory of the output directory, while the citing authors' store and the resolved domains'
+        store are saved in the output directory, shared by all scholars, such that citing authors and domains common
+        to several scholars are only fetched and resolved once. The publications' citations and the citing authors'
+        profiles are fetched for all scholars together, through a single scheduler. A report with each scholar's
+        outputs and hit rates of the shared stores is saved in a `BATCH_REPORT_FILE` file.
+        :param list[str] scholar_ids: the Google Scholar profile/user IDs.
+        :param str output_dir: the path to the directory in which to save data.
+        :param bool reset: whether to discard the domains and authors resolved in previous runs.
+        :param str table_format: the format in which to also save the impact data as a long-form table, one of
+        `TABLE_FORMATS`, or `None`.
+        :param bool tiles: whether to also aggregate each scholar's citing institutions into map tiles.
+        :rtype: pd.DataFrame
+        :return: the batch report, with one row per scholar.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        scholars = {scholar_id: os.path.join(output_dir, clean_filename(scholar_id))
+                    for scholar_id in dict.fromkeys(scholar_ids)}  # unique ids, in the given order
+        authors_file = os.path.join(output_dir, AUTHORS_STORE_FILE)
+        authors = AuthorStore(authors_file)
+        logging.info(f'Loaded info for {len(authors)} citing authors from {authors_file}')
+        domain_store = DomainStore(os.path.join(output_dir, DOMAINS_DB_FILE))
+        if reset:
+            domain_store.clear()
+
+        # fetch all scholars' data together
+        logging.info('==================================================')
+        logging.info(f'Processing {len(scholars)} scholars...')
+        fetcher = ScholarFetcher(self.backend, self.max_workers, self.min_wait, self.max_wait)
+        try:
+            with self._stage('scholar', output_dir):
+                scholars_data = get_scholars(scholars, authors, fetcher)
+        finally:
+            fetcher.close()
+        authors.compact()
+        logging.info(f'Updated authors info file: {authors_file}')
+
+        # resolve locations and impact of each scholar, sharing the resolved domains
+        rows = []
+        for scholar_id, scholar in scholars_data.items():
+            logging.info('==================================================')
+            logging.info(f'Resolving locations and impact of scholar "{scholar_id}"...')
+            scholar_dir = scholars[scholar_id]
+            counts = self.resolver.counts.copy()
+            with self._stage('locations', scholar_dir):
+                domains_df = self.resolver.get_locations(scholar.authors, scholar_dir, domain_store=domain_store)
+            counts = self.resolver.counts - counts
+            with self._stage('impact', scholar_dir):
+                get_impact_chart(scholar_id, scholar_dir, scholar.author, scholar.authors, domains_df, table_format)
+            if tiles:
+                with self._stage('tiles', scholar_dir):
+                    get_map_tiles(scholar_dir, scholar.authors, domains_df)
+            num_authors = len(scholar.authors)
+            rows.append(dict(scholar=scholar_id,
+                             output=scholar_dir,
+                             publications=len(scholar.author['publications']),
+                             citations=scholar.num_citations,
+                             citing_authors=num_authors,
+                             fetched_authors=scholar.num_fetched,
+                             author_hit_rate=_get_rate(num_authors - scholar.num_fetched, num_authors),
+                             domains=counts['domains'],
+                             resolved_domains=counts['domains'] - counts['domain_hits'],
+                             domain_hit_rate=_get_rate(counts['domain_hits'], counts['domains']),
+                             institutes=len(domains_df),
+                             locations_file=os.path.join(scholar_dir, LOCATIONS_FILE),
+                             impact_chart_file=os.path.join(scholar_dir, IMPACT_CHART_FILE)))
+        domain_store.close()
+
+        report = pd.DataFrame(rows)
+        file_path = os.path.join(output_dir, BATCH_REPORT_FILE)
+        report.to_csv(file_path, index=False)
+        logging.info('==================================================')
+        logging.info(f'Saved batch report in "{file_path}"')
+        self._log_hit_rates(report)
+        return report
+
+    def _log_hit_rates(self, report):
+        num_authors = report['citing_authors'].sum() if len(report) > 0 else 0
+        num_fetched = report['fetched_authors'].sum() if len(report) > 0 else 0
+        counts = self.resolver.counts
+        logging.info('Shared caches hit rates:')
+        logging.info(f'\tciting authors: {_get_rate(num_authors - num_fetched, num_authors):.1%} '
+                     f'({num_fetched} of {num_authors} fetched)')
+        logging.info(f'\tdomains: {_get_rate(counts["domain_hits"], counts["domains"]):.1%} '
+                     f'({counts["domains"] - counts["domain_hits"]} of {counts["domains"]} resolved)')
+        logging.info(f'\tDNS: {_get_rate(counts["ip_queries"] - counts["ip_lookups"], counts["ip_queries"]):.1%} '
+                     f'({counts["ip_lookups"]} of {counts["ip_queries"]} looked up)')
+        hits, misses = self.host_resolver.hits, self.host_resolver.misses
+        logging.info(f'\tDNS cache: {_get_rate(hits, hits + misses):.1%} ({misses} of {hits + misses} resolved)')
+        num_queries = counts['country_queries']
+        logging.info(f'\tcountries: {_get_rate(num_queries - counts["country_lookups"], num_queries):.1%} '
+                     f'({counts["country_lookups"]} of {num_queries} looked up)')
+        num_queries = counts['affiliation_queries']
+        logging.info(f'\taffiliations: {_get_rate(num_queries - counts["affiliation_parses"], num_queries):.1%} '
+                     f'({counts["affiliation_parses"]} of {num_queries} parsed)')
+        if isinstance(self.geo_locator, CachedGeocoder):
+            hits, misses = self.geo_locator.hits, self.geo_locator.misses
+            logging.info(f'\tgeo-locations: {_get_rate(hits, hits + misses):.1%} '
+                         f'({misses} of {hits + misses} geocoded)')
+
+    def close(self):
+        if self._own_geo_locator:
+            self.geo_locator.close()
+        if self._own_host_resolver:
+            self.host_resolver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--id', type=str, nargs='+', default=[],
+                        help='The Google Scholar profile/user ID(s), i.e., what appears after '
+                             'https://scholar.google.com/citations?user=. If several IDs are given, each scholar\'s '
+                             'data is saved in its own sub-directory of the output directory.')
+    parser.add_argument('--ids-file', type=str, default=None,
+                        help='The path to a text file with one Google Scholar profile/user ID per line, processed '
+                             'together with the IDs given in "--id".')
+    parser.add_argument('-o', '--output', type=str, default=OUTPUT_DIR,
+                        help='The path to the directory in which to save data.')
+    parser.add_argument('--geo-cache', type=str, default=None,
+                        help=f'The path to the persistent geo-location cache file. '
+                             f'Defaults to "{GEO_CACHE_FILE}" in the output directory.')
+    parser.add_argument('--dns-cache', type=str, default=None,
+                        help=f'The path to the persistent DNS cache file. '
+                             f'Defaults to "{DNS_CACHE_FILE}" in the output directory.')
+    parser.add_argument('--hosts', type=str, default=None,
+                        help='The path to a hosts file, i.e., with lines "IP_ADDRESS DOMAIN...", from which to resolve '
+                             'the domains\' IP addresses instead of DNS, e.g., to run offline.')
+    parser.add_argument('-t', '--threads', type=int, default=MAX_WORKERS,
+                        help='The maximum number of concurrent requests to each service.')
+    parser.add_argument('--min-wait', type=float, default=MIN_WAIT,
+                        help='The minimum time between consecutive requests to Google Scholar, in seconds.')
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT,
+                        help='The maximum time between consecutive requests to Google Scholar, in seconds.')
+    parser.add_argument('--geo-rate', type=float, default=NOMINATIM_RATE,
+                        help='The maximum number of geo-location requests per second.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The number of worker processes parsing and voting the authors\' affiliations.')
+    parser.add_argument('--reset', action='store_true',
+                        help=f'Whether to discard the domains and authors resolved in previous runs, stored in '
+                             f'"{DOMAINS_DB_FILE}" in the output directory.')
+    parser.add_argument('-f', '--table-format', type=str, choices=TABLE_FORMATS, default=None,
+                        help=f'Also save the impact data as a long-form table, "{IMPACT_TABLE_FILE}.FORMAT", in the '
+                             f'given format.')
+    parser.add_argument('--tiles', action='store_true',
+                        help=f'Also aggregate the citing institutions into map tiles at several zoom levels, saved as '
+                             f'GeoJSON in "{TILES_DIR}".')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='The path to the file in which to save the run\'s metrics, in the Prometheus text format '
+                             'if with a ".prom" extension, otherwise as JSON. Defaults to "pipeline_metrics.json" in '
+                             'the output directory.')
+    parser.add_argument('--profile', type=str, nargs='+', choices=STAGES, default=[],
+                        help='The stages to profile with cProfile, saving each stage\'s statistics in "STAGE.prof" in '
+                             'the (scholar\'s) output directory.')
+    args = parser.parse_args()
+    scholar_ids = list(args.id)
+    if args.ids_file is not None:
+        with open(args.ids_file, 'r') as fp:
+            scholar_ids.extend(line.strip() for line in fp if line.strip() != '')
+    if len(scholar_ids) == 0:
+        parser.error('no Google Scholar IDs given, use "--id" or "--ids-file"')
+
+    # output
+    os.makedirs(args.output, exist_ok=True)
+    logging.RootLogger.root.handlers = []
+    handlers = [logging.FileHandler(os.path.join(args.output, 'pipeline.log'), 'w', encoding='utf-8'),
+                logging.StreamHandler()]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S',
+                        handlers=handlers)
+
+    geo_cache_file = args.geo_cache if args.geo_cache is not None else os.path.join(args.output, GEO_CACHE_FILE)
+    dns_cache_file = args.dns_cache if args.dns_cache is not None else os.path.join(args.output, DNS_CACHE_FILE)
+    host_resolver = CachedHostResolver(
+        StaticHostResolver.from_hosts_file(args.hosts) if args.hosts is not None else None, dns_cache_file)
+    with Pipeline(scholarly, geo_cache_file=geo_cache_file, max_workers=args.threads, min_wait=args.min_wait,
+                  max_wait=args.max_wait, geo_rate=args.geo_rate, workers=args.workers,
+                  profile=args.profile, host_resolver=host_resolver) as pipeline:
+        if len(scholar_ids) == 1 and args.ids_file is None:
+            pipeline.run(scholar_ids[0], args.output, args.reset, args.table_format, args.tiles)
+        else:
+            pipeline.run_batch(scholar_ids, args.output, args.reset, args.table_format, args.tiles)
+        logging.info(f'Geo-location cache: {pipeline.geo_locator.hits} hits, '
+                     f'{pipeline.geo_locator.misses} geocoder calls')
+    host_resolver.close()
+    logging.info(f'DNS cache: {host_resolver.hits} hits, {host_resolver.misses} DNS lookups')
+    metrics.save(args.metrics if args.metrics is not None else os.path.join(args.output, 'pipeline_metrics.json'))
+
+    logging.info('Done!')
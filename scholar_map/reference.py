@@ -0,0 +1,209 @@
+import logging
+import os
+import pickle
+import threading
+import IP2Location
+import jsonpickle
+import pandas as pd
+from urllib.parse import urlparse
+from .indexes import DomainSuffixIndex, DomainMatchIndex, SubstringIndex, IPRangeIndex, IPLocationIndex, \
+    MultiPatternMatcher
+from .loading import get_file_stamp, PICKLE_PROTOCOL
+from .metrics import metrics
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+# DATA files, relative to the repository root such that the package can be used from any directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+IP_LOCATION_DB = os.path.join(DATA_DIR, 'IP2LOCATION-LITE-DB9.BIN', 'IP2LOCATION-LITE-DB9.BIN')
+WORLD_UNI_DOMAINS = os.path.join(DATA_DIR, 'world_universities_and_domains.json')
+US_UNI_DATA = os.path.join(DATA_DIR, 'Colleges_and_Universities.csv')
+ISP_NAMES_DB = os.path.join(DATA_DIR, 'IP2LOCATION-LITE-ASN.CSV')
+
+COMPILED_DIR = os.path.join(DATA_DIR, 'compiled')
+REFERENCE_VERSION = 2  # increment whenever the compiled artifacts' contents change
+
+
+def get_world_uni_host(url):
+    return (urlparse(url).netloc if '://' in url else url.split('/')[0]).lower()
+
+
+class ReferenceData(object):
+    """
+    Lazily-loaded reference datasets used to resolve the authors' domains and affiliations. Each dataset is only loaded
+    on first use, from a compiled artifact holding its normalized data and precomputed indexes. Artifacts are versioned
+    and (re)built from the original data files whenever these change. Can be shared among threads.
+    """
+
+    def __init__(self, compiled_dir=COMPILED_DIR):
+        self.compiled_dir = compiled_dir
+        self._data = {}
+        self._lock = threading.RLock()  # artifacts can be built from other artifacts
+
+    def _get(self, name, build):
+        with self._lock:
+            if name not in self._data:
+                self._data[name] = build()
+            return self._data[name]
+
+    def _load_compiled(self, name, sources, build):
+        file_path = os.path.join(self.compiled_dir, name + '.pkl')
+        header = (REFERENCE_VERSION, [get_file_stamp(source) for source in sources])
+        if os.path.isfile(file_path):
+            try:
+                with open(file_path, 'rb') as fp:
+                    if pickle.load(fp) == header:
+                        obj = pickle.load(fp)
+                        metrics.count('cache.reference.hits')
+                        return obj
+            except (pickle.UnpicklingError, EOFError, ValueError, TypeError, ImportError, AttributeError) as err:
+                logging.info(f'Could not load compiled reference data "{file_path}": {err}')
+
+        metrics.count('cache.reference.misses')
+        with metrics.timer(f'reference.build.{name}'):
+            obj = build()
+        os.makedirs(self.compiled_dir, exist_ok=True)
+        tmp_file = file_path + '.tmp'
+        with open(tmp_file, 'wb') as fp:
+            pickle.dump(header, fp, protocol=PICKLE_PROTOCOL)  # header first, no need to load stale data
+            pickle.dump(obj, fp, protocol=PICKLE_PROTOCOL)
+        os.replace(tmp_file, file_path)
+        logging.info(f'Compiled reference data "{name}" into "{file_path}"')
+        return obj
+
+    @property
+    def ip_database(self):
+        """
+        The IP2Location database. Reads are not thread-safe.
+        :rtype: IP2Location.IP2Location
+        """
+
+        def _load():
+            ip_database = IP2Location.IP2Location(IP_LOCATION_DB, 'SHARED_MEMORY')
+            logging.info(f'Loaded IP2Location database from "{IP_LOCATION_DB}"')
+            return ip_database
+
+        return self._get('ip_database', _load)
+
+    @property
+    def ip_location_index(self):
+        """
+        The index over the IP2Location database's IPv4 ranges, used to look up many IP addresses at once. Reads are not
+        thread-safe.
+        :rtype: IPLocationIndex
+        """
+
+        def _load():
+            index = IPLocationIndex(self.ip_database)
+            logging.info(f'Indexed {len(index)} IPv4 ranges of the IP2Location database')
+            return index
+
+        return self._get('ip_location_index', _load)
+
+    @property
+    def isp_names_index(self):
+        """
+        The index of the IP2Location ISP names database, memory-mapped from its compiled form.
+        :rtype: IPRangeIndex
+        """
+
+        def _load():
+            index = IPRangeIndex.compile(ISP_NAMES_DB, os.path.join(self.compiled_dir, 'isp_names'))
+            logging.info(f'Loaded IP2Location names database with {len(index)} ranges from "{ISP_NAMES_DB}"')
+            return index
+
+        return self._get('isp_names_index', _load)
+
+    def _get_world_unis(self):
+        def _build():
+            with open(WORLD_UNI_DOMAINS, 'r', encoding='utf-8') as fp:
+                world_unis = jsonpickle.loads(fp.read())
+            index = DomainMatchIndex(  # world uni domain and web page hosts -> first uni
+                [d.lower() for d in uni['domains']] + [get_world_uni_host(w) for w in uni['web_pages']]
+                for uni in world_unis)
+            return world_unis, index
+
+        def _load():
+            world_unis = self._load_compiled('world_unis', [WORLD_UNI_DOMAINS], _build)
+            logging.info(f'Loaded info for {len(world_unis[0])} universities from "{WORLD_UNI_DOMAINS}"')
+            return world_unis
+
+        return self._get('world_unis', _load)
+
+    @property
+    def world_unis(self):
+        """
+        The world universities' records.
+        :rtype: list[dict]
+        """
+        return self._get_world_unis()[0]
+
+    @property
+    def world_unis_index(self):
+        """
+        The index from the world universities' domains and web page hosts to the position of the first matching uni.
+        :rtype: DomainMatchIndex
+        """
+        return self._get_world_unis()[1]
+
+    def _get_us_unis(self):
+        def _build():
+            us_unis_df = pd.read_csv(US_UNI_DATA)
+            us_unis_df.columns = us_unis_df.columns.str.lower()
+            us_unis_df['name'] = us_unis_df['name'].str.lower()
+            us_unis_df['alias'] = us_unis_df['alias'].str.lower()
+            us_unis_df['website'] = us_unis_df['website'].str.replace('https?://|www.|/', '', regex=True).str.lower()
+            index = DomainSuffixIndex(us_unis_df['website'])  # website domain suffix -> best uni
+            name_index = SubstringIndex(us_unis_df['name'].tolist() + us_unis_df['alias'].tolist())
+            return us_unis_df, index, name_index
+
+        def _load():
+            us_unis = self._load_compiled('us_unis', [US_UNI_DATA], _build)
+            logging.info(f'Loaded info for {len(us_unis[0])} US universities from "{US_UNI_DATA}"')
+            return us_unis
+
+        return self._get('us_unis', _load)
+
+    @property
+    def us_unis_df(self):
+        """
+        The US universities' records, with lower-case names and aliases and bare website domains.
+        :rtype: pd.DataFrame
+        """
+        return self._get_us_unis()[0]
+
+    @property
+    def us_unis_index(self):
+        """
+        The index from the US universities' website domain suffixes to the position of the best uni.
+        :rtype: DomainSuffixIndex
+        """
+        return self._get_us_unis()[1]
+
+    @property
+    def us_unis_name_index(self):
+        """
+        The substring index over the US universities' names followed by their aliases.
+        :rtype: SubstringIndex
+        """
+        return self._get_us_unis()[2]
+
+    @property
+    def all_unis_matcher(self):
+        """
+        The matcher of all known (US and world) university names.
+        :rtype: MultiPatternMatcher
+        """
+
+        def _build():
+            all_unis = set(self.us_unis_df['name'].unique())
+            all_unis.update(uni['name'].lower() for uni in self.world_unis)
+            return MultiPatternMatcher(all_unis)
+
+        def _load():
+            matcher = self._load_compiled('all_unis_matcher', [US_UNI_DATA, WORLD_UNI_DOMAINS], _build)
+            logging.info(f'Loaded matcher for {len(matcher)} known university names')
+            return matcher
+
+        return self._get('all_unis_matcher', _load)
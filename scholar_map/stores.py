@@ -0,0 +1,409 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import jsonpickle
+from .loading import load_cached
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+DOMAINS_DB_FILE = 'domains.db'
+AUTHORS_STORE_FILE = 'authors.jsonl'
+AUTHORS_DB_FILE = 'authors.db'
+
+COMPACT_RATIO = 2  # compact when the store has this many lines per unique author
+COMPACT_MIN_LINES = 1000
+
+COMMIT_LINES = 1000  # lines imported or stored per index transaction
+TAIL_SIZE = 64  # bytes before the last imported position checked to detect rewritten files
+MAX_QUERY_PARAMS = 900  # below SQLite's limit of host parameters per statement
+
+
+def _to_json(obj):
+    return json.dumps(obj, default=lambda o: o.item() if hasattr(o, 'item') else str(o))  # e.g., numpy scalars
+
+
+class DomainStore(object):
+    """
+    Persistent SQLite store for the resolved domain records and the citing authors' affiliation votes, allowing
+    `get_locations` runs to be incremental and resumable. Resolved domains are committed as soon as they are stored,
+    so an interrupted run resumes from the last resolved domain. Can be shared among threads.
+    """
+
+    def __init__(self, file_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, uni TEXT NOT NULL, resolver TEXT);
+            CREATE TABLE IF NOT EXISTS authors (seq INTEGER PRIMARY KEY AUTOINCREMENT, author_id TEXT UNIQUE NOT NULL,
+                                                domain TEXT NOT NULL, raw_affiliation TEXT, affiliation TEXT);
+            CREATE INDEX IF NOT EXISTS authors_domain ON authors (domain);
+        ''')
+        self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript('DELETE FROM domains; DELETE FROM authors;')
+            self._conn.commit()
+
+    def get_domains(self):
+        """
+        Gets all the resolved domain records.
+        :rtype: dict[str, dict]
+        :return: a dictionary from domain to the corresponding institution record.
+        """
+        with self._lock:
+            return {domain: json.loads(uni) for domain, uni in self._conn.execute('SELECT domain, uni FROM domains')}
+
+    def put_domain(self, domain, uni, resolver):
+        """
+        Stores the record of a resolved domain.
+        :param str domain: the resolved domain.
+        :param dict uni: the institution record for the domain.
+        :param str resolver: the id of the author whose information was used to resolve the domain.
+        """
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO domains (domain, uni, resolver) VALUES (?, ?, ?)',
+                               (domain, _to_json(uni), resolver))
+            self._conn.commit()
+
+    def get_authors(self):
+        """
+        Gets the stored authors' domain and (raw) affiliation, used to detect new or changed authors.
+        :rtype: dict[str, tuple[str, str]]
+        :return: a dictionary from author id to a tuple (domain, raw_affiliation).
+        """
+        with self._lock:
+            return {author_id: (domain, raw_affiliation) for author_id, domain, raw_affiliation in
+                    self._conn.execute('SELECT author_id, domain, raw_affiliation FROM authors')}
+
+    def put_authors(self, authors):
+        """
+        Stores (new or changed) authors' domain and affiliation information.
+        :param list[tuple[str, str, str, str]] authors: a list of tuples
+        (author_id, domain, raw_affiliation, affiliation), where `affiliation` is the author's processed affiliation.
+        """
+        with self._lock:
+            self._conn.executemany('INSERT INTO authors (author_id, domain, raw_affiliation, affiliation) '
+                                   'VALUES (?, ?, ?, ?) ON CONFLICT (author_id) DO UPDATE SET domain=excluded.domain, '
+                                   'raw_affiliation=excluded.raw_affiliation, affiliation=excluded.affiliation',
+                                   authors)
+            self._conn.commit()
+
+    def get_affiliations(self, author_ids):
+        """
+        Gets the affiliation votes of each resolved domain, i.e., the current affiliation of the author whose
+        information was used to resolve the domain followed by those of the domain's other authors, in the order in
+        which they were stored.
+        :param set[str] author_ids: the ids of the authors whose votes are to be considered.
+        :rtype: dict[str, list[str]]
+        :return: a dictionary from domain to the list of affiliation votes.
+        """
+        with self._lock:
+            domain_affiliations = {}
+            resolvers = {}
+            for domain, resolver in self._conn.execute('SELECT domain, resolver FROM domains'):
+                domain_affiliations[domain] = []
+                resolvers[domain] = resolver
+            for author_id, domain, affiliation in self._conn.execute(
+                    'SELECT author_id, domain, affiliation FROM authors ORDER BY seq'):
+                if domain not in domain_affiliations or author_id not in author_ids:
+                    continue
+                if author_id == resolvers[domain]:
+                    domain_affiliations[domain].insert(0, affiliation)
+                else:
+                    domain_affiliations[domain].append(affiliation)
+            return domain_affiliations
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AuthorStore(object):
+    """
+    Append-only JSON Lines store for the citing authors' data. Each stored author is appended as a single line, so the
+    cost of storing an author does not depend on the number of stored authors, and a crash can at most lose the line
+    being written, which is discarded upon loading. Lines overridden by later ones are dropped by periodic compaction.
+    """
+
+    def __init__(self, file_path, legacy_file=None, read_only=False):
+        """
+        Creates a new store, loading previously-stored authors.
+        :param str file_path: the path to the JSON Lines file.
+        :param str legacy_file: the path to a (jsonpickle) JSON file with the authors dictionary, from which authors
+        are imported if the JSON Lines file does not exist.
+        :param bool read_only: whether the store is only read, i.e., no authors are written to the store's file.
+        """
+        self.file_path = file_path
+        self.read_only = read_only
+        self.authors = {}
+        self._num_lines = 0
+        self._fp = None
+        if os.path.isfile(file_path):
+            self.authors, self._num_lines, num_invalid = load_cached(file_path, self._parse)
+            if num_invalid > 0:
+                logging.info(f'Discarded {num_invalid} invalid lines from "{file_path}"')
+                self._rewrite()  # otherwise appending after a truncated line would corrupt the next one
+        elif legacy_file is not None and os.path.isfile(legacy_file):
+            with open(legacy_file, 'r') as fp:
+                self.authors = jsonpickle.loads(fp.read())
+            logging.info(f'Imported {len(self.authors)} authors from "{legacy_file}"')
+            self._rewrite()
+
+    @staticmethod
+    def _parse(file_path):
+        authors = {}
+        num_lines = num_invalid = 0
+        with open(file_path, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    entry = jsonpickle.Unpickler().restore(json.loads(line))
+                    authors[entry['id']] = entry['author']
+                    num_lines += 1
+                except (ValueError, KeyError, TypeError):
+                    num_invalid += 1
+        return authors, num_lines, num_invalid
+
+    def __len__(self):
+        return len(self.authors)
+
+    def __contains__(self, author_id):
+        return author_id in self.authors
+
+    def __getitem__(self, author_id):
+        return self.authors[author_id]
+
+    def put(self, author_id, author):
+        """
+        Stores the given author's data by appending it to the store's file.
+        :param str author_id: the author's id.
+        :param dict author: the author's data.
+        """
+        self.authors[author_id] = author
+        if self.read_only:
+            return
+        if self._fp is None:
+            self._fp = open(self.file_path, 'a', encoding='utf-8')
+        self._fp.write(jsonpickle.encode({'id': author_id, 'author': author}) + '\n')
+        self._fp.flush()
+        self._num_lines += 1
+        if self._num_lines >= max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self.authors)):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the store's file with a single line per author, atomically replacing the previous file, if it has
+        lines overridden by later ones, such that the file is left untouched, e.g., its modification time, otherwise.
+        """
+        if self._num_lines > len(self.authors):
+            self._rewrite()
+
+    def _rewrite(self):
+        # writes a single line per author to a new file, atomically replacing the previous file
+        if self.read_only:
+            return
+        self.close()
+        tmp_file = self.file_path + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as fp:
+            for author_id, author in self.authors.items():
+                fp.write(jsonpickle.encode({'id': author_id, 'author': author}) + '\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_file, self.file_path)
+        self._num_lines = len(self.authors)
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class AuthorDatabase(object):
+    """
+    Keyed on-disk store for the citing authors' data, allowing authors to be looked up by id without loading all of
+    them into memory. The authors are stored in the same JSON Lines file as an `AuthorStore`, which remains the store's
+    source, while a SQLite index maps each author id to the author's (latest) line. The index is brought up to date
+    with the JSON Lines file when the store is opened, importing only the lines appended since it was last updated,
+    unless the file was rewritten, e.g., compacted, in which case it is rebuilt. Only one process should write to the
+    file at a time.
+    """
+
+    def __init__(self, file_path, index_file, read_only=False):
+        """
+        Creates a new store, updating its index with the authors stored in the JSON Lines file.
+        :param str file_path: the path to the JSON Lines file.
+        :param str index_file: the path to the SQLite index file.
+        :param bool read_only: whether the store is only read, i.e., no authors are written to the store's file.
+        """
+        self.file_path = file_path
+        self.read_only = read_only
+        self._fp = None
+        self._num_uncommitted = 0
+        self._conn = sqlite3.connect(index_file)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS authors (author_id TEXT PRIMARY KEY, line TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS source (inode INTEGER, offset INTEGER, num_lines INTEGER, tail BLOB);
+        ''')
+        row = self._conn.execute('SELECT inode, offset, num_lines, tail FROM source').fetchone()
+        self._inode, self._offset, self._num_lines, self._tail = row if row is not None else (None, 0, 0, b'')
+        self._update()
+
+    def _get_tail(self):
+        # the last bytes indexed from the file
+        with open(self.file_path, 'rb') as fp:
+            fp.seek(max(0, self._offset - TAIL_SIZE))
+            return fp.read(min(self._offset, TAIL_SIZE))
+
+    def _set_source(self, inode, offset, num_lines, tail=None):
+        self._inode, self._offset, self._num_lines = inode, offset, num_lines
+        if tail is None:
+            tail = self._get_tail() if inode is not None else b''
+        self._tail = tail
+        self._conn.execute('DELETE FROM source')
+        self._conn.execute('INSERT INTO source VALUES (?, ?, ?, ?)', (inode, offset, num_lines, self._tail))
+
+    def _update(self):
+        # imports the lines appended to the source file since the last update
+        if not os.path.isfile(self.file_path):
+            self._conn.execute('DELETE FROM authors')
+            self._set_source(None, 0, 0)
+            self._conn.commit()
+            return
+        stat = os.stat(self.file_path)
+        if stat.st_ino != self._inode or stat.st_size < self._offset or self._get_tail() != self._tail:
+            logging.info(f'Indexing authors in "{self.file_path}"...')
+            self._conn.execute('DELETE FROM authors')  # file was rewritten
+            self._set_source(stat.st_ino, 0, 0)
+        offset, num_lines = self._offset, self._num_lines
+        num_invalid = 0
+        rows = []
+        with open(self.file_path, 'rb') as fp:
+            fp.seek(offset)
+            for line in fp:
+                if not line.endswith(b'\n'):
+                    break  # incomplete last line, e.g., interrupted write
+                offset += len(line)
+                try:
+                    line = line.decode('utf-8')
+                    rows.append((json.loads(line)['id'], line))
+                    num_lines += 1
+                except (ValueError, KeyError, TypeError):
+                    num_invalid += 1
+                if len(rows) >= COMMIT_LINES:
+                    self._put_lines(rows, stat.st_ino, offset, num_lines)
+                    rows = []
+        self._put_lines(rows, stat.st_ino, offset, num_lines)
+        if num_invalid > 0:
+            logging.info(f'Discarded {num_invalid} invalid lines from "{self.file_path}"')
+        if offset < stat.st_size and not self.read_only:
+            os.truncate(self.file_path, offset)  # otherwise appending after a truncated line would corrupt the next one
+            logging.info(f'Discarded incomplete last line from "{self.file_path}"')
+
+    def _put_lines(self, rows, inode, offset, num_lines):
+        self._conn.executemany('INSERT INTO authors VALUES (?, ?) ON CONFLICT (author_id) DO UPDATE SET '
+                               'line=excluded.line', rows)  # keeps first insertion order
+        self._set_source(inode, offset, num_lines)
+        self._conn.commit()
+
+    @staticmethod
+    def _restore(line):
+        return jsonpickle.Unpickler().restore(json.loads(line))['author']
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM authors').fetchone()[0]
+
+    def __contains__(self, author_id):
+        return self._conn.execute('SELECT 1 FROM authors WHERE author_id=?', (author_id,)).fetchone() is not None
+
+    def __getitem__(self, author_id):
+        row = self._conn.execute('SELECT line FROM authors WHERE author_id=?', (author_id,)).fetchone()
+        if row is None:
+            raise KeyError(author_id)
+        return self._restore(row[0])
+
+    def get_many(self, author_ids):
+        """
+        Gets the data of the given authors.
+        :param typing.Iterable[str] author_ids: the ids of the authors.
+        :rtype: dict[str, dict]
+        :return: a dictionary from author id to the author's data, for the given authors found in the store.
+        """
+        author_ids = list(set(author_ids))
+        authors = {}
+        for i in range(0, len(author_ids), MAX_QUERY_PARAMS):
+            chunk = author_ids[i:i + MAX_QUERY_PARAMS]
+            for author_id, line in self._conn.execute(f'SELECT author_id, line FROM authors WHERE author_id IN '
+                                                      f'({",".join("?" * len(chunk))})', chunk):
+                authors[author_id] = self._restore(line)
+        return authors
+
+    def items(self):
+        """
+        Iterates over all the stored authors, in the order in which they were first stored.
+        :rtype: typing.Iterator[tuple[str, dict]]
+        """
+        for author_id, line in self._conn.execute('SELECT author_id, line FROM authors ORDER BY rowid'):
+            yield author_id, self._restore(line)
+
+    def put(self, author_id, author):
+        """
+        Stores the given author's data by appending it to the store's file and indexing it.
+        :param str author_id: the author's id.
+        :param dict author: the author's data.
+        """
+        line = jsonpickle.encode({'id': author_id, 'author': author}) + '\n'
+        if not self.read_only:
+            if self._fp is None:
+                self._fp = open(self.file_path, 'a', encoding='utf-8')
+            self._fp.write(line)
+            self._fp.flush()
+            data = line.encode('utf-8')
+            self._offset += len(data)
+            self._tail = (self._tail + data)[-TAIL_SIZE:]  # not read back, the file may have been rewritten since
+            self._num_lines += 1
+        self._conn.execute('INSERT INTO authors VALUES (?, ?) ON CONFLICT (author_id) DO UPDATE SET '
+                           'line=excluded.line', (author_id, line))
+        self._num_uncommitted += 1
+        if self._num_uncommitted >= COMMIT_LINES:
+            self._commit()  # not committed lines are re-imported from the file if interrupted
+
+    def _commit(self):
+        if self._inode is None and os.path.isfile(self.file_path):
+            self._inode = os.stat(self.file_path).st_ino  # file created by this store
+        self._set_source(self._inode, self._offset, self._num_lines, self._tail)
+        self._conn.commit()
+        self._num_uncommitted = 0
+
+    def compact(self):
+        """
+        Rewrites the store's file with a single line per author, streamed from the index, atomically replacing the
+        previous file, if it has lines overridden by later ones.
+        """
+        if self.read_only or self._num_lines <= len(self):
+            return
+        self.close_file()
+        tmp_file = self.file_path + '.tmp'
+        num_lines = 0
+        with open(tmp_file, 'w', encoding='utf-8') as fp:
+            for (line,) in self._conn.execute('SELECT line FROM authors ORDER BY rowid'):
+                fp.write(line)
+                num_lines += 1
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_file, self.file_path)
+        stat = os.stat(self.file_path)
+        self._set_source(stat.st_ino, stat.st_size, num_lines)
+        self._conn.commit()
+
+    def close_file(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def close(self):
+        self.close_file()
+        self._commit()
+        self._conn.close()
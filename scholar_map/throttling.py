@@ -0,0 +1,170 @@
+import functools
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+MAX_WORKERS = 8
+MAX_RETRIES = 3
+BACKOFF = 1.  # seconds
+MAX_BACKOFF = 60.  # seconds
+MIN_PROCESS_ITEMS = 20000  # below which starting worker processes takes longer than the work they save
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket limiting the rate at which some service is called, e.g., the 1 request/second policy of
+    Nominatim.
+    """
+
+    def __init__(self, rate, burst=1, jitter=0.):
+        """
+        Creates a new rate limiter.
+        :param float rate: the maximum (average) number of calls per second.
+        :param int burst: the maximum number of calls that can be made at once.
+        :param float jitter: the maximum random delay, in seconds, added after each call, e.g., such that consecutive
+        calls are between `1/rate` and `1/rate + jitter` seconds apart when `burst` is 1.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a call is allowed by this limiter.
+        """
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1 + random.uniform(0, self.jitter) * self.rate
+                    return
+                time.sleep((1 - self._tokens) / self.rate)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def backoff_delay(attempt, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+    """
+    Gets a jittered, exponentially-increasing delay for a retry attempt ("full jitter" strategy).
+    :param int attempt: the (zero-based) retry attempt.
+    :param float backoff: the base delay, in seconds.
+    :param float max_backoff: the maximum delay, in seconds.
+    :rtype: float
+    """
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+def retry(func, exceptions=(Exception,), retries=MAX_RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF,
+          limiter=None, retry_if=None):
+    """
+    Wraps the given function such that it is retried with jittered exponential backoff whenever it raises one of the
+    given exceptions.
+    :param callable func: the function to be wrapped.
+    :param tuple exceptions: the exception types upon which the call is retried.
+    :param int retries: the maximum number of retries, after which the last exception is raised.
+    :param float backoff: the base backoff delay, in seconds.
+    :param float max_backoff: the maximum backoff delay, in seconds.
+    :param RateLimiter limiter: an optional rate limiter acquired before each call attempt.
+    :param callable retry_if: an optional predicate on the raised exception deciding whether to retry.
+    :rtype: callable
+    """
+
+    @functools.wraps(func)
+    def _wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                return func(*args, **kwargs)
+            except exceptions as err:
+                if attempt >= retries or (retry_if is not None and not retry_if(err)):
+                    raise
+                delay = backoff_delay(attempt, backoff, max_backoff)
+                logging.info(f'Error calling {func.__name__}: {err}, retrying in {delay:.1f}s...')
+                time.sleep(delay)
+                attempt += 1
+
+    return _wrapper
+
+
+def map_concurrent(func, items, max_workers=MAX_WORKERS, progress=None):
+    """
+    Calls the given function for each of the given (unique) items through a bounded thread pool. Errors raised by the
+    function are logged per item, such that one failing item does not discard the results of the others.
+    :param callable func: the function to be called for each item.
+    :param list items: the items to be processed.
+    :param int max_workers: the maximum number of concurrent calls.
+    :param callable progress: an optional callable wrapping the results iterator, e.g., `tqdm.tqdm`.
+    :rtype: dict
+    :return: a dictionary mapping each item to the function's result, without the items whose call failed.
+    """
+
+    def _call(item):
+        try:
+            return True, func(item)
+        except Exception as err:
+            logging.info(f'Error calling {func.__name__} for "{item}": {err}')
+            return False, None
+
+    items = list(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        results = executor.map(_call, items)
+        if progress is not None:
+            results = progress(results, total=len(items))
+        results = list(results)  # consumes the whole iterator, such that a progress bar completes and is closed
+    finally:
+        executor.shutdown(cancel_futures=True)  # on interruption, skip calls not yet started
+    return {item: result for item, (ok, result) in zip(items, results) if ok}
+
+
+def map_processes(func, items, max_workers, chunks_per_worker=4, initializer=None, initargs=(),
+                  min_items=MIN_PROCESS_ITEMS):
+    """
+    Calls the given function for each of the given items through a pool of worker processes, e.g., for CPU-bound work.
+    Workers are started by a fork server, or spawned if not supported by the platform, such that they do not inherit
+    the caller's threads and locks, e.g., of thread pools or progress bars. Objects needed by the function, e.g.,
+    read-only indexes, are sent once to each worker through the initializer instead of being pickled per task. The
+    function is called serially if there are too few items for the workers' start-up time to pay off.
+    :param callable func: the (module-level) function to be called for each item.
+    :param list items: the items to be processed, sent to the workers in chunks.
+    :param int max_workers: the number of worker processes, at most the number of CPUs.
+    :param int chunks_per_worker: the number of chunks in which each worker's share of the items is split.
+    :param callable initializer: the (module-level) function called by each worker process upon start, and before
+    calling the function serially.
+    :param tuple initargs: the arguments of the initializer.
+    :param int min_items: the minimum number of items for which worker processes are used.
+    :rtype: list
+    :return: the function's results, in the order of the given items.
+    """
+    items = list(items)
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    if max_workers <= 1 or len(items) < max(2, min_items):
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(item) for item in items]
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    if context.get_start_method() == 'forkserver':
+        context.set_forkserver_preload([func.__module__])  # imported once by the server, not by each worker
+    chunk_size = max(1, -(-len(items) // (max_workers * chunks_per_worker)))
+    with context.Pool(max_workers, initializer, initargs) as pool:
+        return pool.map(func, items, chunk_size)
@@ -1,8 +1,18 @@
+import functools
 import unicodedata
 import string
+import numpy as np
+import pandas as pd
 
 valid_filename_chars = "-_.() %s%s" % (string.ascii_letters, string.digits)
 char_limit = 255
+title_cache_size = 2 ** 16
+
+
+@functools.lru_cache(maxsize=None)
+def _get_invalid_chars(whitelist):
+    # the ASCII chars not in the whitelist, to be deleted via `bytes.translate`
+    return bytes(i for i in range(128) if chr(i) not in whitelist)
 
 
 def clean_filename(filename, whitelist=valid_filename_chars, replace=' '):
@@ -13,16 +23,52 @@ def clean_filename(filename, whitelist=valid_filename_chars, replace=' '):
     for r in replace:
         filename = filename.replace(r, '_')
 
-    # keep only valid ascii chars
-    cleaned_filename = unicodedata.normalize('NFKD', filename).encode('ASCII', 'ignore').decode()
+    # keep only valid ascii chars (normalization leaves ascii strings unchanged)
+    if filename.isascii():
+        cleaned_filename = filename.encode('ASCII')
+    else:
+        cleaned_filename = unicodedata.normalize('NFKD', filename).encode('ASCII', 'ignore')
 
     # keep only whitelisted chars
-    cleaned_filename = ''.join(c for c in cleaned_filename if c in whitelist)
+    cleaned_filename = cleaned_filename.translate(None, _get_invalid_chars(whitelist)).decode()
     if len(cleaned_filename) > char_limit:
         print(
             "Warning, filename truncated because it was over {}. Filenames may no longer be unique".format(char_limit))
     return cleaned_filename[:char_limit]
 
 
+@functools.lru_cache(maxsize=title_cache_size)
 def get_title(title):
     return None if title is None else ' '.join([w.title() if w.islower() else w for w in title.split()])
+
+
+def _map_unique(values, func):
+    # applies the function once per unique value, missing values are kept as they are
+    values = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    mapped[:-1] = [func(value) for value in uniques]
+    result = mapped[codes]
+    missing = codes < 0
+    result[missing] = values.values[missing]
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def clean_filenames(filenames, whitelist=valid_filename_chars, replace=' '):
+    """
+    Vectorized `clean_filename`, cleaning each unique filename once.
+    :param pd.Series filenames: the filenames to be cleaned.
+    :param str whitelist: the chars allowed in filenames.
+    :param str replace: the chars to be replaced by '_'.
+    :rtype: pd.Series
+    """
+    return _map_unique(filenames, functools.partial(clean_filename, whitelist=whitelist, replace=replace))
+
+
+def get_titles(titles):
+    """
+    Vectorized `get_title`, title-casing each unique title once. Missing values are kept as they are.
+    :param pd.Series titles: the titles.
+    :rtype: pd.Series
+    """
+    return _map_unique(titles, get_title)
@@ -15,14 +15,16 @@ setup(name='GoogleScholarMap',
           'email2country',
           'geopy',
           'geotext',
-          'IP2Location',
+          'IP2Location>=8.11,<9',  # IPLocationIndex reads its internals
           'jsonpickle',
+          'numpy',
           'pandas',
           'requests',
           'scholarly',
           'tqdm',
       ],
       extras_require={
+          'parquet': ['pyarrow'],
       },
       zip_safe=True
       )
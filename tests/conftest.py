@@ -0,0 +1,15 @@
+import types
+import pytest
+from scholar_map import geocoding, hosts
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # fake wall clock of the persistent caches, advanced by setting `now`
+    clock = types.SimpleNamespace(now=1e9)
+    for module in (geocoding, hosts):
+        monkeypatch.setattr(module, 'time', types.SimpleNamespace(time=lambda: clock.now))
+    return clock
@@ -0,0 +1,91 @@
+import time
+import pytest
+from benchmarks.fakes import FakeScholar
+from scholar_map import throttling
+from scholar_map.fetching import ScholarFetcher, CITATIONS, AUTHOR
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+class _TimedScholar(FakeScholar):
+    # records the time of each request
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.times = []
+
+    def _request(self):
+        with self._lock:
+            self.times.append(time.monotonic())
+        super()._request()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(throttling, 'backoff_delay', lambda *args: 0.)  # retries do not wait
+
+
+def _fetch(backend, min_wait=0., max_wait=0., retries=10):
+    # fetches all citations and their authors' profiles, as `get_scholar` does
+    fetcher = ScholarFetcher(backend, max_workers=4, min_wait=min_wait, max_wait=max_wait, retries=retries)
+    for pub in backend.author['publications']:
+        fetcher.submit_citations(pub)
+    citations, authors = {}, {}
+    for kind, item, result in fetcher.results():
+        if kind == CITATIONS:
+            citations[item['author_pub_id']] = result
+            for citation in result:
+                for author_id in citation['author_id']:
+                    if author_id != '' and author_id not in authors:
+                        fetcher.submit_author(author_id)
+        else:
+            assert kind == AUTHOR
+            authors[item] = result
+    fetcher.close()
+    return citations, authors, fetcher.num_errors
+
+
+def _serial_fetch(backend):
+    citations = {pub['author_pub_id']: list(backend.citedby(pub)) for pub in backend.author['publications']}
+    author_ids = {author_id for pub_citations in citations.values() for citation in pub_citations
+                  for author_id in citation['author_id'] if author_id != ''}
+    return citations, {author_id: backend.search_author_id(author_id) for author_id in author_ids}
+
+
+def test_results_match_serial_fetch():
+    backend = FakeScholar(num_pubs=5, num_citations=10, num_authors=30, failure_rate=.2)
+    citations, authors, num_errors = _fetch(backend)
+    ref_citations, ref_authors = _serial_fetch(FakeScholar(num_pubs=5, num_citations=10, num_authors=30))
+    assert num_errors == 0
+    assert citations == ref_citations
+    assert authors == ref_authors
+    assert backend.num_calls > len(citations) + len(authors)  # failed calls were retried
+
+
+def test_failed_calls_retried():
+    backend = FakeScholar(num_pubs=4, num_citations=2, failure_rate=1.)
+    citations, authors, num_errors = _fetch(backend, retries=2)
+    assert citations == {} and authors == {}
+    assert num_errors == 4
+    assert backend.num_calls == 4 * (1 + 2)  # each request tried once and retried twice
+
+
+def test_min_wait():
+    min_wait = .05
+    backend = _TimedScholar(num_pubs=3, num_citations=2, num_authors=5, failure_rate=.2)
+    _fetch(backend, min_wait=min_wait, max_wait=.06)
+    times = sorted(backend.times)
+    assert len(times) > 5
+    assert min(t2 - t1 for t1, t2 in zip(times, times[1:])) >= min_wait * .8  # tolerance for thread scheduling
+
+
+def test_authors_in_flight():
+    backend = FakeScholar(num_pubs=1, num_citations=1, num_authors=3)
+    fetcher = ScholarFetcher(backend, max_workers=1)
+    author_id = next(iter(backend.authors))
+    assert fetcher.submit_author(author_id)
+    assert not fetcher.submit_author(author_id)  # already being fetched
+    assert [kind for kind, _, _ in fetcher.results()] == [AUTHOR]
+    assert fetcher.submit_author(author_id)  # not tracked once fetched, i.e., deduplicated by the caller
+    fetcher.close()
@@ -0,0 +1,35 @@
+import os
+from scholar_map.geocoding import CachedGeocoder, StaticGeocoder, CACHE_TTL, NEGATIVE_CACHE_TTL
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+LOCATIONS = {'MIT, USA': ('Massachusetts Institute of Technology, USA', 42.36, -71.09),
+             'FEUP, Portugal': ('Faculdade de Engenharia, Porto, Portugal', 41.18, -8.6)}
+QUERIES = ['MIT, USA', 'feup,  portugal', 'Nowhere, Atlantis']
+
+
+def _geocode_all(cache_file, backend):
+    geocoder = CachedGeocoder(backend, cache_file)
+    locations = [geocoder.geocode(query) for query in QUERIES]
+    geocoder.close()
+    return locations
+
+
+def test_negative_caching(tmp_path, clock):
+    cache_file = os.path.join(tmp_path, 'geo.db')
+    backend = StaticGeocoder(LOCATIONS)
+    locations = _geocode_all(cache_file, backend)
+    assert locations[0].latitude == 42.36 and locations[1].longitude == -8.6 and locations[2] is None
+    assert backend.calls == 3
+
+    # not-found queries are cached between runs, but expire before found ones
+    backend = StaticGeocoder(LOCATIONS)
+    assert _geocode_all(cache_file, backend) == locations
+    assert backend.calls == 0
+    clock.now += NEGATIVE_CACHE_TTL + 1
+    assert _geocode_all(cache_file, backend) == locations
+    assert backend.calls == 1
+    clock.now += CACHE_TTL
+    assert _geocode_all(cache_file, backend) == locations
+    assert backend.calls == 4
@@ -0,0 +1,63 @@
+import os
+import socket
+from scholar_map import throttling
+from scholar_map.hosts import CachedHostResolver, StaticHostResolver, NEGATIVE_CACHE_TTL
+from scholar_map.throttling import MAX_RETRIES
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+HOSTS = {'mit.edu': '18.0.0.1', 'fe.up.pt': '193.136.0.1'}
+
+
+class _IDNAResolver(StaticHostResolver):
+    # encodes domains like `socket.gethostbyname`, which raises `UnicodeError` on malformed domains
+
+    def __call__(self, domain):
+        self.calls += 1
+        domain.encode('idna')
+        return self.hosts[domain]
+
+
+def test_malformed_domains(clock):
+    backend = _IDNAResolver(HOSTS)
+    resolver = CachedHostResolver(backend)
+    domains = ['foo..edu', '.edu', 'a' * 64 + '.edu', 'mit.edu']
+    ips = resolver.resolve_all(domains, max_workers=2)
+    assert ips == {'foo..edu': None, '.edu': None, 'a' * 64 + '.edu': None, 'mit.edu': '18.0.0.1'}
+    assert backend.calls == len(domains)  # not retried
+
+    # cached as unknown domains
+    assert resolver.resolve('foo..edu') is None
+    assert backend.calls == len(domains)
+    clock.now += NEGATIVE_CACHE_TTL + 1
+    assert resolver.resolve('foo..edu') is None
+    assert backend.calls == len(domains) + 1
+    resolver.close()
+
+
+def _resolve_all(cache_file, backend, domains):
+    resolver = CachedHostResolver(backend, cache_file)
+    ips = resolver.resolve_all(domains, max_workers=2)
+    resolver.close()
+    return ips
+
+
+class _TemporaryFailure(StaticHostResolver):
+    # fails with a temporary DNS error
+
+    def __call__(self, domain):
+        self.calls += 1
+        raise socket.gaierror(socket.EAI_AGAIN, 'Temporary failure in name resolution')
+
+
+def test_temporary_failures_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(throttling, 'backoff_delay', lambda *args: 0.)  # retries do not wait
+    cache_file = os.path.join(tmp_path, 'dns.db')
+    backend = _TemporaryFailure(HOSTS)
+    assert _resolve_all(cache_file, backend, ['mit.edu']) == {'mit.edu': None}
+    assert backend.calls == 1 + MAX_RETRIES  # retried
+
+    backend = StaticHostResolver(HOSTS)
+    assert _resolve_all(cache_file, backend, ['mit.edu']) == {'mit.edu': '18.0.0.1'}
+    assert backend.calls == 1
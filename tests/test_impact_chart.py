@@ -0,0 +1,26 @@
+import pandas as pd
+from scholar_map.get_impact_chart import get_impact_table, AUTHOR_ID_COL, CITATION_POS_COL, PUB_POS_COL, \
+    INSTITUTE_COL_NAME, LOCATION_COL_NAME, DOMAIN_COL_NAME, CITATIONS_COL_NAME, LOCATION_CITATIONS_COL_NAME
+from scholar_map.institutions import AuthorInstitutions
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+def test_first_occurrence():
+    domains_df = pd.DataFrame({'country': [None, 'United States', 'Portugal'],
+                               'name': ['MIT', 'MIT', 'FEUP'],
+                               'domain': ['csail.mit.edu', 'mit.edu', 'fe.up.pt']})
+    authors = {'a1': dict(email_domain='@csail.mit.edu'), 'a2': dict(email_domain='@mit.edu'),
+               'a3': dict(email_domain='@fe.up.pt'), 'a4': dict(email_domain='@unknown.org')}
+    institutions = AuthorInstitutions.from_locations(authors, domains_df)
+    citing_df = pd.DataFrame({PUB_POS_COL: [0, 0, 0, 0, 1, 1],
+                              CITATION_POS_COL: [0, 0, 1, 2, 0, 1],
+                              AUTHOR_ID_COL: ['a1', 'a3', 'a2', 'a4', 'a2', 'a1']})
+
+    # the country and domain of each institute are those of its first citing author, even if unknown
+    impact_df = get_impact_table(citing_df, institutions)
+    assert impact_df[[PUB_POS_COL, INSTITUTE_COL_NAME, DOMAIN_COL_NAME, CITATIONS_COL_NAME]].values.tolist() == \
+           [[0, 'MIT', 'csail.mit.edu', 2], [0, 'FEUP', 'fe.up.pt', 1], [1, 'MIT', 'mit.edu', 2]]
+    assert impact_df[LOCATION_COL_NAME].isna().tolist() == [True, False, False]
+    assert impact_df[LOCATION_CITATIONS_COL_NAME].tolist() == [1, 1, 1]
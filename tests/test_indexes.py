@@ -0,0 +1,40 @@
+import os
+import random
+import IP2Location
+from benchmarks.fakes import write_ip_database
+from scholar_map.indexes import IPLocationIndex
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+class _PublicDatabase(object):
+    # exposes only the public API of an IP2Location database, e.g., as in an untested library version
+
+    def __init__(self, database):
+        self.get_all = database.get_all
+
+
+def _get_ips(num_ips, seed=0):
+    rng = random.Random(seed)
+    ips = [f'{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}'
+           for _ in range(num_ips)]
+    return ips + ips[:10] + ['0.0.0.0', '255.255.255.255']
+
+
+def test_lookup_all(tmp_path):
+    db_file = os.path.join(tmp_path, 'IP2LOCATION-DB9.BIN')
+    write_ip_database(db_file, 1000)
+    database = IP2Location.IP2Location(db_file)
+    ips = _get_ips(500)
+    index = IPLocationIndex(database)
+    assert len(index) > 0
+    records = index.lookup_all(ips)
+    assert all(vars(records[ip]) == vars(database.get_all(ip)) for ip in ips)
+
+    # falls back to one lookup per address without the library's internals
+    fallback = IPLocationIndex(_PublicDatabase(database))
+    assert len(fallback) == 0
+    records = fallback.lookup_all(ips)
+    assert all(vars(records[ip]) == vars(database.get_all(ip)) for ip in ips)
+    database.close()
@@ -0,0 +1,113 @@
+import json
+import os
+import jsonpickle
+from scholar_map.stores import AuthorDatabase, AuthorStore, DomainStore, AUTHORS_DB_FILE, AUTHORS_STORE_FILE
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+def test_affiliation_votes(tmp_path):
+    store = DomainStore(os.path.join(tmp_path, 'domains.db'))
+    store.put_authors([('a1', 'cs.mit.edu', 'Professor, MIT', 'MIT'),
+                       ('a2', 'cs.mit.edu', 'Student at MIT', 'Mit'),
+                       ('a3', 'cs.mit.edu', 'Unknown affiliation', None)])
+    store.put_domain('cs.mit.edu', dict(domain='cs.mit.edu', name='MIT'), 'a2')
+    assert store.get_affiliations({'a1', 'a2', 'a3'}) == {'cs.mit.edu': ['Mit', 'MIT', None]}
+
+    # the resolver's vote follows their current affiliation
+    store.put_authors([('a2', 'cs.mit.edu', 'Harvard University', 'Harvard University')])
+    assert store.get_affiliations({'a1', 'a2', 'a3'}) == {'cs.mit.edu': ['Harvard University', 'MIT', None]}
+
+    # only the given authors vote, including the resolver
+    assert store.get_affiliations({'a1'}) == {'cs.mit.edu': ['MIT']}
+    store.close()
+
+
+def _authors(num_authors, name='Author'):
+    return {f'a{i}': dict(name=f'{name} {i}', email_domain='@mit.edu') for i in range(num_authors)}
+
+
+def _write_authors(file_path, authors):
+    with open(file_path, 'w', encoding='utf-8') as fp:
+        for author_id, author in authors.items():
+            fp.write(jsonpickle.encode({'id': author_id, 'author': author}) + '\n')
+
+
+def _read_ids(file_path):
+    with open(file_path, 'r', encoding='utf-8') as fp:
+        return [json.loads(line)['id'] for line in fp]
+
+
+def test_truncated_last_line(tmp_path):
+    file_path = os.path.join(tmp_path, AUTHORS_STORE_FILE)
+    authors = _authors(3)
+    _write_authors(file_path, authors)
+    with open(file_path, 'a', encoding='utf-8') as fp:
+        fp.write('{"id": "a3", "author": {"na')  # interrupted write
+
+    # the incomplete line is discarded and does not corrupt the next one
+    store = AuthorStore(file_path)
+    assert store.authors == authors
+    store.put('a3', dict(name='Author 3'))
+    store.close()
+    assert _read_ids(file_path) == ['a0', 'a1', 'a2', 'a3']
+
+    with open(file_path, 'a', encoding='utf-8') as fp:
+        fp.write('{"id": "a4"')
+    database = AuthorDatabase(file_path, os.path.join(tmp_path, AUTHORS_DB_FILE))
+    assert len(database) == 4 and 'a4' not in database
+    database.put('a4', dict(name='Author 4'))
+    database.close()
+    assert _read_ids(file_path) == ['a0', 'a1', 'a2', 'a3', 'a4']
+
+
+def test_compact(tmp_path):
+    file_path = os.path.join(tmp_path, AUTHORS_STORE_FILE)
+    store = AuthorStore(file_path)
+    for author_id, author in _authors(3).items():
+        store.put(author_id, author)
+    store.put('a0', dict(name='Author 0', email_domain='@fe.up.pt'))
+    store.compact()
+    store.close()
+
+    # a single line per author, replaced atomically
+    assert _read_ids(file_path) == ['a0', 'a1', 'a2']
+    assert os.listdir(tmp_path) == [AUTHORS_STORE_FILE]
+    store = AuthorStore(file_path)
+    assert store['a0']['email_domain'] == '@fe.up.pt'
+
+    # not rewritten without overridden lines
+    stat = os.stat(file_path)
+    store.compact()
+    assert os.stat(file_path).st_ino == stat.st_ino and os.stat(file_path).st_mtime_ns == stat.st_mtime_ns
+
+
+def test_rewritten_file_reindexed(tmp_path):
+    file_path = os.path.join(tmp_path, AUTHORS_STORE_FILE)
+    index_file = os.path.join(tmp_path, AUTHORS_DB_FILE)
+    _write_authors(file_path, _authors(3))
+    database = AuthorDatabase(file_path, index_file, read_only=True)
+    assert dict(database.items()) == _authors(3)
+
+    # rewritten in place with the same size, i.e., the same inode and offset but different last bytes
+    _write_authors(file_path, _authors(3, name='Person'))
+    database.close()
+    database = AuthorDatabase(file_path, index_file, read_only=True)
+    assert dict(database.items()) == _authors(3, name='Person')
+
+    # rewritten in place with fewer authors
+    _write_authors(file_path, _authors(2))
+    database.close()
+    database = AuthorDatabase(file_path, index_file, read_only=True)
+    assert dict(database.items()) == _authors(2)
+
+    # replaced by a compacted file with the same size and last bytes, i.e., only another inode
+    store = AuthorStore(file_path)
+    store.put('a0', dict(name='Person 0', email_domain='@mit.edu'))
+    store.compact()
+    store.close()
+    database.close()
+    database = AuthorDatabase(file_path, index_file, read_only=True)
+    assert database['a0']['name'] == 'Person 0' and len(database) == 2
+    database.close()
@@ -0,0 +1,40 @@
+import io
+import tqdm
+from scholar_map import get_locations, throttling
+from scholar_map.indexes import MultiPatternMatcher
+from scholar_map.throttling import map_concurrent, map_processes
+
+__author__ = 'Pedro Sequeira'
+__email__ = 'pedrodbs@gmail.com'
+
+
+def _invert(item):
+    return 1 / item
+
+
+def test_map_concurrent_errors():
+    bars = []
+
+    def _progress(*args, **kwargs):
+        bars.append(tqdm.tqdm(*args, file=io.StringIO(), **kwargs))
+        return bars[-1]
+
+    # failed items are left out, all others are processed and the progress bar completes
+    results = map_concurrent(_invert, [1, 0, 2, 4], max_workers=2, progress=_progress)
+    assert results == {1: 1., 2: .5, 4: .25}
+    assert bars[0].n == 4
+
+
+def test_map_processes(monkeypatch):
+    monkeypatch.setattr(throttling.os, 'cpu_count', lambda: 2)
+    matcher = MultiPatternMatcher(['massachusetts institute of technology', 'universidade do porto'])
+    affiliations = ['Professor, Massachusetts Institute of Technology', 'Student at Universidade do Porto',
+                    'Unknown affiliation', 'Researcher - Some Lab, Lisbon'] * 5
+    serial = map_processes(get_locations._worker_process_affiliation, affiliations, 1,
+                           initializer=get_locations._init_worker, initargs=(matcher,))
+    assert serial[:3] == ['massachusetts institute of technology', 'universidade do porto', None]
+
+    # worker processes started without inheriting the caller's state, receiving the matcher once
+    parallel = map_processes(get_locations._worker_process_affiliation, affiliations, 2,
+                             initializer=get_locations._init_worker, initargs=(matcher,), min_items=0)
+    assert parallel == serial